@@ -7,15 +7,14 @@ import os
 import sys
 from datetime import datetime
 
-from esphome import const, writer, yaml_util
-import esphome.codegen as cg
-from esphome.config import iter_components, read_config, strip_default_ids
+from esphome import const, profiling, yaml_util
 from esphome.const import CONF_BAUD_RATE, CONF_BROKER, CONF_LOGGER, CONF_OTA, \
     CONF_PASSWORD, CONF_PORT, CONF_ESPHOME, CONF_PLATFORMIO_OPTIONS
 from esphome.core import CORE, EsphomeError, coroutine, coroutine_with_priority
 from esphome.helpers import color, indent
 from esphome.py_compat import IS_PY2, safe_input, IS_PY3
-from esphome.util import run_external_command, run_external_process, safe_print, list_yaml_files
+from esphome.util import run_external_command, run_external_process, safe_print, \
+    list_yaml_files, shlex_quote, OrderedDict
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -122,6 +121,8 @@ def run_miniterm(config, port):
 
 
 def wrap_to_code(name, comp):
+    import esphome.codegen as cg
+
     coro = coroutine(comp.to_code)
 
     @functools.wraps(comp.to_code)
@@ -139,20 +140,31 @@ def wrap_to_code(name, comp):
     return wrapped
 
 
-def write_cpp(config):
+def write_cpp(config, verify_build_tree=False):
+    from esphome import writer
+    from esphome.build_manifest import get_manifest
+    from esphome.config import iter_components
+
     _LOGGER.info("Generating C++ source...")
 
-    for name, component, conf in iter_components(CORE.config):
-        if component.to_code is not None:
-            coro = wrap_to_code(name, component)
-            CORE.add_job(coro, conf)
+    if verify_build_tree:
+        for path in get_manifest().verify():
+            _LOGGER.warning("%s was changed outside of ESPHome, writing it again.", path)
+
+    with profiling.span(u'to_code'):
+        for name, component, conf in iter_components(CORE.config):
+            if component.to_code is not None:
+                coro = wrap_to_code(name, component)
+                task = CORE.add_job(coro, conf)
+                CORE.task_units[task] = name
 
-    CORE.flush_tasks()
+        CORE.flush_tasks()
 
-    writer.write_platformio_project()
+    with profiling.span(u'write_platformio_project'):
+        writer.write_platformio_project()
 
-    code_s = indent(CORE.cpp_main_section)
-    writer.write_cpp(code_s)
+    with profiling.span(u'write_cpp'):
+        writer.write_cpp()
     return 0
 
 
@@ -160,7 +172,8 @@ def compile_program(args, config):
     from esphome import platformio_api
 
     _LOGGER.info("Compiling app...")
-    return platformio_api.run_compile(config, CORE.verbose)
+    with profiling.span(u'platformio compile'):
+        return platformio_api.run_compile(config, CORE.verbose)
 
 
 def upload_using_esptool(config, port):
@@ -273,6 +286,8 @@ def command_wizard(args):
 
 
 def command_config(args, config):
+    from esphome.config import strip_default_ids
+
     _LOGGER.info("Configuration is valid!")
     if not CORE.verbose:
         config = strip_default_ids(config)
@@ -288,7 +303,7 @@ def command_vscode(args):
 
 
 def command_compile(args, config):
-    exit_code = write_cpp(config)
+    exit_code = write_cpp(config, args.verify_build_tree)
     if exit_code != 0:
         return exit_code
     if args.only_generate:
@@ -318,7 +333,7 @@ def command_logs(args, config):
 
 
 def command_run(args, config):
-    exit_code = write_cpp(config)
+    exit_code = write_cpp(config, args.verify_build_tree)
     if exit_code != 0:
         return exit_code
     exit_code = compile_program(args, config)
@@ -354,8 +369,12 @@ def command_version(args):
 
 
 def command_clean(args, config):
+    from esphome import config_cache, device_profile, writer
+
     try:
         writer.clean_build()
+        config_cache.clear()
+        device_profile.clear()
     except OSError as err:
         _LOGGER.error("Error deleting build files: %s", err)
         return 1
@@ -369,10 +388,136 @@ def command_dashboard(args):
     return dashboard.start_web_server(args)
 
 
+def _run_update_step(log_path, cmd, env=None):
+    import subprocess
+
+    full_cmd = u' '.join(shlex_quote(x) for x in cmd)
+    if env is not None:
+        full_env = os.environ.copy()
+        full_env.update(env)
+        env = full_env
+    with open(log_path, 'a') as log_file:
+        log_file.write(u"Running:  {}\n".format(full_cmd))
+        log_file.flush()
+        try:
+            return subprocess.call(cmd, stdout=log_file, stderr=subprocess.STDOUT, env=env)
+        except Exception as err:  # pylint: disable=broad-except
+            log_file.write(u"Running command failed: {}\n".format(err))
+            return 1
+
+
+def _platformio_compile_step(f):
+    """Return the command and environment that compile the generated project of f.
+
+    The build path is taken from the storage JSON written while generating the
+    code, so that the configuration doesn't have to be loaded again.
+    """
+    from esphome import platformio_api
+    from esphome.core import EsphomeCore
+    from esphome.storage_json import StorageJSON, ext_storage_path
+
+    storage = StorageJSON.load(ext_storage_path(os.path.dirname(os.path.abspath(f)),
+                                                os.path.basename(f)))
+    if storage is None or storage.build_path is None:
+        return ['esphome', f, 'compile'], None
+    core = EsphomeCore()
+    core.name = storage.name
+    core.build_path = storage.build_path
+    return ['platformio', 'run', '-d', storage.build_path], platformio_api.get_platformio_env(core)
+
+
+def _update_device_parallel(f, log_path, compile_lock, upload_lock):
+    """Generate, compile and upload a single device, output goes to log_path.
+
+    The code is generated without a lock, the compile lock is only held while
+    PlatformIO builds the generated project.
+
+    Returns a tuple of the step that failed (or None) and the timings of each step.
+    """
+    import time
+
+    steps = [
+        ('generate', None, ['esphome', f, 'compile', '--only-generate']),
+        ('compile', compile_lock, None),
+        ('upload', upload_lock, ['esphome', f, 'upload', '--upload-port', 'OTA']),
+    ]
+    timings = OrderedDict()
+    for name, lock, cmd in steps:
+        env = None
+        if cmd is None:
+            # The build path is only known once the code is generated
+            cmd, env = _platformio_compile_step(f)
+        if lock is not None:
+            lock.acquire()
+        try:
+            start = time.time()
+            rc = _run_update_step(log_path, cmd, env)
+            timings[name] = time.time() - start
+        finally:
+            if lock is not None:
+                lock.release()
+        if rc != 0:
+            return name, timings
+    return None, timings
+
+
+def _update_all_parallel(args, files):
+    """Update all devices with a pool of workers.
+
+    Code generation runs on up to --jobs workers, PlatformIO compiles and OTA
+    uploads are additionally limited by --compile-jobs and --upload-jobs, because
+    the former are CPU-bound and the latter are network-bound.
+    """
+    import threading
+
+    from esphome.helpers import mkdir_p
+
+    log_dir = os.path.join(args.configuration[0], '.esphome', 'update-all')
+    mkdir_p(log_dir)
+    compile_lock = threading.BoundedSemaphore(args.compile_jobs or args.jobs)
+    upload_lock = threading.BoundedSemaphore(args.upload_jobs)
+    print_lock = threading.Lock()
+    queue = list(reversed(files))
+    results = {}
+
+    def worker():
+        while True:
+            with print_lock:
+                if not queue:
+                    return
+                f = queue.pop()
+                print("Updating {}".format(color('cyan', f)))
+            log_path = os.path.join(log_dir, os.path.basename(f) + '.log')
+            if os.path.exists(log_path):
+                os.remove(log_path)
+            failed_step, timings = _update_device_parallel(f, log_path, compile_lock,
+                                                           upload_lock)
+            results[f] = (failed_step, timings, log_path)
+            with print_lock:
+                if failed_step is None:
+                    print("[{}] {}".format(color('bold_green', 'SUCCESS'), f))
+                else:
+                    print("[{}] {} ({} failed, see {})".format(
+                        color('bold_red', 'ERROR'), f, failed_step, log_path))
+
+    threads = [threading.Thread(target=worker) for _ in range(min(args.jobs, len(files)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _format_timings(timings):
+    total = sum(timings.values())
+    parts = u', '.join(u'{} {:.1f}s'.format(name, value) for name, value in timings.items())
+    return u'{:.1f}s ({})'.format(total, parts)
+
+
 def command_update_all(args):
     import click
+    import time
 
-    success = {}
     files = list_yaml_files(args.configuration[0])
     twidth = 60
 
@@ -382,40 +527,68 @@ def command_update_all(args):
         half_line = "=" * ((twidth - width) // 2)
         click.echo("%s%s%s" % (half_line, middle_text, half_line))
 
-    for f in files:
-        print("Updating {}".format(color('cyan', f)))
-        print('-' * twidth)
+    if args.jobs > 1:
+        results = _update_all_parallel(args, files)
         print()
-        rc = run_external_process('esphome', '--dashboard', f, 'run', '--no-logs', '--upload-port',
-                                  'OTA')
-        if rc == 0:
-            print_bar("[{}] {}".format(color('bold_green', 'SUCCESS'), f))
-            success[f] = True
-        else:
-            print_bar("[{}] {}".format(color('bold_red', 'ERROR'), f))
-            success[f] = False
+    else:
+        results = {}
+        for f in files:
+            print("Updating {}".format(color('cyan', f)))
+            print('-' * twidth)
+            print()
+            start = time.time()
+            rc = run_external_process('esphome', '--dashboard', f, 'run', '--no-logs',
+                                      '--upload-port', 'OTA')
+            timings = OrderedDict([('run', time.time() - start)])
+            if rc == 0:
+                print_bar("[{}] {}".format(color('bold_green', 'SUCCESS'), f))
+                results[f] = (None, timings, None)
+            else:
+                print_bar("[{}] {}".format(color('bold_red', 'ERROR'), f))
+                results[f] = ('run', timings, None)
 
-        print()
-        print()
-        print()
+            print()
+            print()
+            print()
 
     print_bar('[{}]'.format(color('bold_white', 'SUMMARY')))
     failed = 0
     for f in files:
-        if success[f]:
-            print("  - {}: {}".format(f, color('green', 'SUCCESS')))
+        failed_step, timings, log_path = results[f]
+        if failed_step is None:
+            print("  - {}: {} in {}".format(f, color('green', 'SUCCESS'),
+                                            _format_timings(timings)))
         else:
-            print("  - {}: {}".format(f, color('bold_red', 'FAILED')))
+            msg = "  - {}: {} in {}".format(f, color('bold_red', 'FAILED'),
+                                            _format_timings(timings))
+            if log_path is not None:
+                msg += " ({} failed, see {})".format(failed_step, log_path)
+            print(msg)
             failed += 1
     return failed
 
 
+def command_logs_all(args):
+    if IS_PY2:
+        raise EsphomeError("logs-all requires python 3")
+    from esphome import logs_all
+
+    directory = args.configuration[0]
+    log_dir = None
+    if not args.no_log_files:
+        log_dir = args.log_dir or os.path.join(directory, '.esphome', 'logs-all')
+    return logs_all.run_logs_all(directory, level=args.level, tags=args.tag,
+                                 exclude_tags=args.exclude_tag, log_dir=log_dir,
+                                 max_bytes=args.log_max_bytes, backup_count=args.log_backups)
+
+
 PRE_CONFIG_ACTIONS = {
     'wizard': command_wizard,
     'version': command_version,
     'dashboard': command_dashboard,
     'vscode': command_vscode,
     'update-all': command_update_all,
+    'logs-all': command_logs_all,
 }
 
 POST_CONFIG_ACTIONS = {
@@ -429,6 +602,43 @@ POST_CONFIG_ACTIONS = {
     'clean': command_clean,
 }
 
+# The commands that only need the device profile (see esphome.device_profile) of a config
+PROFILE_ACTIONS = ['upload', 'logs', 'clean-mqtt']
+
+
+def positive_int(value):
+    try:
+        value = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(u"invalid int value: '{}'".format(value))
+    if value < 1:
+        raise argparse.ArgumentTypeError(u"must be at least 1, got {}".format(value))
+    return value
+
+
+def mqtt_broker_address(value):
+    """Split host[:port] into (host, port), port is None if it's not given.
+
+    IPv6 addresses with a port have to be written as [addr]:port.
+    """
+    host, port = value, None
+    if value.startswith('['):
+        host, sep, rest = value[1:].partition(']')
+        if not sep or (rest and not rest.startswith(':')):
+            raise argparse.ArgumentTypeError(u"invalid broker address: '{}'".format(value))
+        port = rest[1:] if rest else None
+    elif value.count(':') == 1:
+        host, port = value.split(':')
+    if port is None:
+        return host, None
+    try:
+        port = int(port)
+    except ValueError:
+        port = 0
+    if not 0 < port < 65536:
+        raise argparse.ArgumentTypeError(u"invalid port in broker address: '{}'".format(value))
+    return host, port
+
 
 def parse_args(argv):
     parser = argparse.ArgumentParser(description='ESPHome v{}'.format(const.__version__))
@@ -437,6 +647,14 @@ def parse_args(argv):
     parser.add_argument('-q', '--quiet', help="Disable all esphome logs.",
                         action='store_true')
     parser.add_argument('--dashboard', help=argparse.SUPPRESS, action='store_true')
+    parser.add_argument('--no-config-cache', help="Always validate the configuration, "
+                                                  "don't use the cached validation result.",
+                        action='store_true')
+    parser.add_argument('--profile', help="Print the time of each stage and component and "
+                                          "write them as a Chrome trace file.",
+                        action='store_true')
+    parser.add_argument('--profile-file', help="Path of the Chrome trace file of --profile, "
+                                               "by default .esphome/<configuration>.trace.json.")
     parser.add_argument('configuration', help='Your YAML configuration file.', nargs='*')
 
     subparsers = parser.add_subparsers(help='Commands', dest='command')
@@ -448,6 +666,10 @@ def parse_args(argv):
     parser_compile.add_argument('--only-generate',
                                 help="Only generate source code, do not compile.",
                                 action='store_true')
+    parser_compile.add_argument('--verify-build-tree',
+                                help="Compare the contents of all generated source files "
+                                     "instead of trusting their timestamps.",
+                                action='store_true')
 
     parser_upload = subparsers.add_parser('upload', help='Validate the configuration '
                                                          'and upload the latest binary.')
@@ -467,6 +689,10 @@ def parse_args(argv):
                                                    'upload it, and start MQTT logs.')
     parser_run.add_argument('--upload-port', help="Manually specify the upload port/ip to use. "
                                                   "For example /dev/cu.SLAB_USBtoUART.")
+    parser_run.add_argument('--verify-build-tree',
+                            help="Compare the contents of all generated source files "
+                                 "instead of trusting their timestamps.",
+                            action='store_true')
     parser_run.add_argument('--no-logs', help='Disable starting MQTT logs.',
                             action='store_true')
     parser_run.add_argument('--topic', help='Manually set the topic to subscribe to for logs.')
@@ -507,11 +733,58 @@ def parse_args(argv):
                            action="store_true")
     dashboard.add_argument("--socket",
                            help="Make the dashboard serve under a unix socket", type=str)
+    dashboard.add_argument("--mqtt-broker",
+                           help="Track the device status through the birth and will messages "
+                                "on this MQTT broker (host[:port], [IPv6 address]:port).",
+                           type=mqtt_broker_address,
+                           default=os.getenv('ESPHOME_DASHBOARD_MQTT_BROKER', ''))
+    dashboard.add_argument("--mqtt-username", help="The username for the MQTT broker.",
+                           type=str, default='')
+    dashboard.add_argument("--mqtt-password", help="The password for the MQTT broker.",
+                           type=str, default='')
+    dashboard.add_argument("--status-interval", help="Seconds between two sweeps of the device "
+                                                     "status while the dashboard is open. "
+                                                     "Defaults to 5.",
+                           type=float, default=None)
 
     vscode = subparsers.add_parser('vscode', help=argparse.SUPPRESS)
     vscode.add_argument('--ace', action='store_true')
-
-    subparsers.add_parser('update-all', help=argparse.SUPPRESS)
+    vscode.add_argument('--incremental', action='store_true',
+                        help="Only re-validate the parts of the configuration that changed "
+                             "since the previous request.")
+
+    update_all = subparsers.add_parser('update-all', help=argparse.SUPPRESS)
+    update_all.add_argument('--jobs', '-j', help="Number of devices to update in parallel. "
+                                                 "Output of each device is written to "
+                                                 ".esphome/update-all/<name>.log then.",
+                            type=positive_int, default=1)
+    update_all.add_argument('--compile-jobs', help="Maximum number of parallel PlatformIO "
+                                                   "compiles. Defaults to --jobs.",
+                            type=positive_int, default=None)
+    update_all.add_argument('--upload-jobs', help="Maximum number of parallel OTA uploads.",
+                            type=positive_int, default=4)
+
+    logs_all = subparsers.add_parser('logs-all', help="Show the logs of all devices in the "
+                                                      "configuration directory.")
+    logs_all.add_argument('--level', help="Only show messages up to this log level.",
+                          choices=['ERROR', 'WARN', 'INFO', 'CONFIG', 'DEBUG', 'VERBOSE',
+                                   'VERY_VERBOSE'], type=str.upper)
+    logs_all.add_argument('--tag', help="Only show messages of this tag, can be given multiple "
+                                        "times. Wildcards like 'sensor*' are allowed.",
+                          action='append', default=[])
+    logs_all.add_argument('--exclude-tag', help="Hide messages of this tag, can be given "
+                                                "multiple times.",
+                          action='append', default=[])
+    logs_all.add_argument('--log-dir', help="Directory for the per-device log files. Defaults "
+                                            "to .esphome/logs-all in the configuration "
+                                            "directory.")
+    logs_all.add_argument('--no-log-files', help="Don't write per-device log files.",
+                          action='store_true')
+    logs_all.add_argument('--log-max-bytes', help="Size at which a log file is rotated.",
+                          type=int, default=5 * 1024 * 1024)
+    logs_all.add_argument('--log-backups', help="Number of rotated log files to keep per "
+                                                "device.",
+                          type=int, default=3)
 
     return parser.parse_args(argv[1:])
 
@@ -545,19 +818,13 @@ def run_esphome(argv):
         CORE.config_path = conf_path
         CORE.dashboard = args.dashboard
 
-        config = read_config()
-        if config is None:
-            return 1
-        CORE.config = config
-
-        if args.command not in POST_CONFIG_ACTIONS:
-            safe_print(u"Unknown command {}".format(args.command))
-
+        if args.profile:
+            profiling.start()
         try:
-            rc = POST_CONFIG_ACTIONS[args.command](args, config)
-        except EsphomeError as e:
-            _LOGGER.error(e)
-            return 1
+            rc = run_config_command(args)
+        finally:
+            if args.profile:
+                report_profile(args, profiling.stop())
         if rc != 0:
             return rc
 
@@ -565,6 +832,46 @@ def run_esphome(argv):
     return 0
 
 
+def run_config_command(args):
+    config = None
+    with profiling.span(u'read_config'):
+        if args.command in PROFILE_ACTIONS and not args.no_config_cache:
+            from esphome.device_profile import read_profile
+
+            config = read_profile()
+        if config is None:
+            from esphome.config import read_config
+
+            config = read_config(use_cache=not args.no_config_cache)
+    if config is None:
+        return 1
+    CORE.config = config
+
+    if args.command not in POST_CONFIG_ACTIONS:
+        safe_print(u"Unknown command {}".format(args.command))
+
+    try:
+        with profiling.span(args.command):
+            return POST_CONFIG_ACTIONS[args.command](args, config)
+    except EsphomeError as e:
+        _LOGGER.error(e)
+        return 1
+
+
+def report_profile(args, profiler):
+    safe_print(u"")
+    safe_print(profiler.format_report())
+    path = args.profile_file
+    if path is None:
+        path = CORE.relative_config_path('.esphome', u'{}.trace.json'.format(CORE.config_filename))
+    try:
+        profiler.write_trace(path)
+    except (IOError, OSError) as err:
+        _LOGGER.warning("Could not write profile: %s", err)
+        return
+    _LOGGER.info("Wrote profile to %s", path)
+
+
 def main():
     try:
         return run_esphome(sys.argv)
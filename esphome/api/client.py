@@ -14,7 +14,7 @@ import esphome.api.api_pb2 as pb
 from esphome.const import CONF_PASSWORD, CONF_PORT
 from esphome.core import EsphomeError
 from esphome.helpers import resolve_ip_address, indent, color
-from esphome.py_compat import text_type, IS_PY2, byte_to_bytes, char_to_byte
+from esphome.py_compat import text_type, IS_PY2, IS_PY3, byte_to_bytes, char_to_byte
 from esphome.util import safe_print
 
 _LOGGER = logging.getLogger(__name__)
@@ -420,6 +420,10 @@ class APIClient(threading.Thread):
 
 
 def run_logs(config, address):
+    if IS_PY3:
+        from esphome.api import client_async
+
+        return client_async.run_logs(config, address)
     conf = config['api']
     port = conf[CONF_PORT]
     password = conf[CONF_PASSWORD]
@@ -0,0 +1,502 @@
+"""asyncio implementation of the native API client.
+
+Unlike the threaded client in esphome.api.client, incoming data is appended to
+one reusable buffer per connection and complete frames are parsed from it with
+memoryview slices, so there is no byte-wise reading and no copying of message
+payloads. Pings and reconnects are scheduled on the event loop, which means any
+number of devices can be handled by one thread (see run_logs_many).
+
+This module requires python 3.5+, use esphome.api.client for the public entry points.
+"""
+import asyncio
+from datetime import datetime
+import logging
+import random
+import socket
+import time
+
+import esphome.api.api_pb2 as pb
+from esphome import const
+from esphome.api.client import MESSAGE_TYPE_TO_PROTO, APIConnectionError, _varuint_to_bytes
+from esphome.const import CONF_PASSWORD, CONF_PORT
+from esphome.core import EsphomeError
+from esphome.helpers import color, indent, is_ip_address, resolve_ip_address
+from esphome.util import safe_print
+
+# pylint: disable=unused-import, wrong-import-order
+from typing import Optional  # noqa
+
+_LOGGER = logging.getLogger(__name__)
+
+PROTO_TO_MESSAGE_TYPE = {klass: message_type
+                         for message_type, klass in MESSAGE_TYPE_TO_PROTO.items()}
+CONNECT_TIMEOUT = 10.0
+RESPONSE_TIMEOUT = 5.0
+KEEPALIVE_INTERVAL = 5.0
+MAX_RECONNECT_WAIT = 30
+
+
+def _read_varuint(buf, pos, end):
+    """Decode a varuint from buf[pos:end], returns (value, new_pos) or (None, pos)."""
+    result = 0
+    bitpos = 0
+    while pos < end:
+        val = buf[pos]
+        pos += 1
+        result |= (val & 0x7F) << bitpos
+        if not val & 0x80:
+            return result, pos
+        bitpos += 7
+    return None, pos
+
+
+class FrameBuffer(object):
+    """Receive buffer that splits the API byte stream into frames.
+
+    A frame is a 0x00 preamble, the varuint payload length, the varuint message
+    type and the payload. Data is appended with feed(); parse() then calls a
+    handler with a memoryview of each complete payload. The view is only valid
+    during the call, consumed bytes are dropped from the buffer afterwards.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def feed(self, data):  # type: (bytes) -> None
+        self._buffer += data
+
+    def parse(self, handler):
+        buf = self._buffer
+        end = len(buf)
+        pos = 0
+        view = memoryview(buf)
+        try:
+            while pos < end:
+                if buf[pos] != 0x00:
+                    raise APIConnectionError("Invalid preamble")
+                length, next_pos = _read_varuint(buf, pos + 1, end)
+                if length is None:
+                    break
+                msg_type, next_pos = _read_varuint(buf, next_pos, end)
+                if msg_type is None or next_pos + length > end:
+                    break
+                pos = next_pos + length
+                handler(msg_type, view[next_pos:pos])
+        finally:
+            view.release()
+        if pos:
+            del buf[:pos]
+
+
+def encode_frame(msg):  # type: (...) -> bytes
+    message_type = PROTO_TO_MESSAGE_TYPE.get(type(msg))
+    if message_type is None:
+        raise ValueError("Unknown message type {}".format(type(msg)))
+    encoded = msg.SerializeToString()
+    return b''.join([b'\x00', _varuint_to_bytes(len(encoded)),
+                     _varuint_to_bytes(message_type), encoded])
+
+
+class _APIProtocol(asyncio.Protocol):
+    def __init__(self, client):
+        self._client = client
+
+    def connection_made(self, transport):
+        self._client._connection_made(transport)  # pylint: disable=protected-access
+
+    def data_received(self, data):
+        self._client._data_received(data)  # pylint: disable=protected-access
+
+    def connection_lost(self, exc):
+        self._client._connection_lost(exc)  # pylint: disable=protected-access
+
+
+# pylint: disable=too-many-instance-attributes
+class APIClient(object):
+    """Connection to one device, all methods must be called from the same event loop."""
+
+    def __init__(self, address, port, password, keepalive=KEEPALIVE_INTERVAL):
+        self._address = address  # type: str
+        self._port = port  # type: int
+        self._password = password  # type: Optional[str]
+        self._keepalive = keepalive
+        self._transport = None
+        self._frames = FrameBuffer()
+        self._connected = False
+        self._authenticated = False
+        self._message_handlers = []
+        self._ping_handle = None
+        self._ping_task = None
+
+        self.on_disconnect = None
+
+    @property
+    def address(self):
+        return self._address
+
+    @property
+    def connected(self):
+        return self._connected
+
+    async def _resolve(self):
+        if is_ip_address(self._address):
+            return self._address
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(None, resolve_ip_address, self._address)
+        except EsphomeError as err:
+            _LOGGER.warning("Error resolving IP address of %s. Is it connected to WiFi?",
+                            self._address)
+            _LOGGER.warning("(If this error persists, please set a static IP address: "
+                            "https://esphome.io/components/wifi.html#manual-ips)")
+            raise APIConnectionError(err)
+
+    async def connect(self):
+        if self._transport is not None:
+            await self.disconnect(on_disconnect=False)
+
+        ip = await self._resolve()
+        _LOGGER.info("Connecting to %s:%s (%s)", self._address, self._port, ip)
+        loop = asyncio.get_event_loop()
+        try:
+            await asyncio.wait_for(
+                loop.create_connection(lambda: _APIProtocol(self), ip, self._port),
+                CONNECT_TIMEOUT)
+        except (OSError, socket.error, asyncio.TimeoutError) as err:
+            raise APIConnectionError("Error connecting to {}: {}".format(ip,
+                                                                         str(err) or 'Timeout'))
+
+        hello = pb.HelloRequest()
+        hello.client_info = 'ESPHome v{}'.format(const.__version__)
+        try:
+            resp = await self._send_message_await_response(hello, pb.HelloResponse)
+        except APIConnectionError as err:
+            self._fatal_error(err)
+            raise
+        _LOGGER.debug("Successfully connected to %s ('%s' API=%s.%s)", self._address,
+                      resp.server_info, resp.api_version_major, resp.api_version_minor)
+        self._connected = True
+        self._schedule_ping()
+
+    def _check_connected(self):
+        if not self._connected:
+            raise APIConnectionError("Must be connected!")
+
+    async def login(self):
+        self._check_connected()
+        if self._authenticated:
+            raise APIConnectionError("Already logged in!")
+
+        connect = pb.ConnectRequest()
+        if self._password is not None:
+            connect.password = self._password
+        resp = await self._send_message_await_response(connect, pb.ConnectResponse)
+        if resp.invalid_password:
+            raise APIConnectionError("Invalid password!")
+        self._authenticated = True
+
+    def _schedule_ping(self):
+        self._cancel_ping()
+        loop = asyncio.get_event_loop()
+        self._ping_handle = loop.call_later(self._keepalive, self._ping_due)
+
+    def _ping_due(self):
+        self._ping_handle = None
+        self._ping_task = asyncio.ensure_future(self._keepalive_ping())
+
+    async def _keepalive_ping(self):
+        try:
+            await self.ping()
+        except APIConnectionError as err:
+            self._fatal_error(err)
+        else:
+            if self._connected:
+                self._schedule_ping()
+        finally:
+            self._ping_task = None
+
+    def _cancel_ping(self):
+        if self._ping_handle is not None:
+            self._ping_handle.cancel()
+            self._ping_handle = None
+
+    def _connection_made(self, transport):
+        self._transport = transport
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _data_received(self, data):
+        self._frames.feed(data)
+        try:
+            self._frames.parse(self._handle_frame)
+        except APIConnectionError as err:
+            _LOGGER.error("Error while reading incoming messages: %s", err)
+            self._fatal_error(err)
+
+    def _connection_lost(self, exc):
+        if self._transport is None:
+            return
+        self._fatal_error(APIConnectionError("Connection lost: {}".format(
+            exc or 'Closed by device')))
+
+    def _close(self):
+        self._cancel_ping()
+        if self._ping_task is not None:
+            self._ping_task.cancel()
+            self._ping_task = None
+        transport = self._transport
+        self._transport = None
+        if transport is not None:
+            transport.close()
+        self._frames = FrameBuffer()
+        self._connected = False
+        self._authenticated = False
+        handlers = self._message_handlers
+        self._message_handlers = []
+        return handlers
+
+    def _fatal_error(self, err):
+        was_connected = self._connected
+        for handler in self._close():
+            # Wake up everyone waiting for a response
+            fail = getattr(handler, 'fail', None)
+            if fail is not None:
+                fail(err)
+
+        if was_connected and self.on_disconnect is not None:
+            self.on_disconnect(err)
+
+    def _send_message(self, msg):
+        if self._transport is None:
+            raise APIConnectionError("Socket closed")
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Sending %s:\n%s", type(msg), indent(str(msg)))
+        self._transport.write(encode_frame(msg))
+
+    async def _send_message_await_response_complex(self, send_msg, do_append, do_stop,
+                                                   timeout=RESPONSE_TIMEOUT):
+        future = asyncio.get_event_loop().create_future()
+        responses = []
+
+        def on_message(resp):
+            if do_append(resp):
+                responses.append(resp)
+            if do_stop(resp) and not future.done():
+                future.set_result(responses)
+
+        def fail(err):
+            if not future.done():
+                future.set_exception(err)
+
+        on_message.fail = fail
+        self._message_handlers.append(on_message)
+        try:
+            self._send_message(send_msg)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise APIConnectionError("Timeout while waiting for message response!")
+        finally:
+            try:
+                self._message_handlers.remove(on_message)
+            except ValueError:
+                pass
+
+    async def _send_message_await_response(self, send_msg, response_type,
+                                           timeout=RESPONSE_TIMEOUT):
+        def is_response(msg):
+            return isinstance(msg, response_type)
+
+        responses = await self._send_message_await_response_complex(send_msg, is_response,
+                                                                    is_response, timeout)
+        return responses[0]
+
+    async def device_info(self):
+        self._check_connected()
+        return await self._send_message_await_response(pb.DeviceInfoRequest(),
+                                                       pb.DeviceInfoResponse)
+
+    async def ping(self):
+        self._check_connected()
+        return await self._send_message_await_response(pb.PingRequest(), pb.PingResponse)
+
+    async def disconnect(self, on_disconnect=True):
+        if self._connected:
+            try:
+                await self._send_message_await_response(pb.DisconnectRequest(),
+                                                        pb.DisconnectResponse)
+            except APIConnectionError:
+                pass
+        self._close()
+
+        if self.on_disconnect is not None and on_disconnect:
+            self.on_disconnect(None)
+
+    def _check_authenticated(self):
+        if not self._authenticated:
+            raise APIConnectionError("Must login first!")
+
+    def subscribe_logs(self, on_log, log_level=7, dump_config=False):
+        self._check_authenticated()
+
+        def on_msg(msg):
+            if isinstance(msg, pb.SubscribeLogsResponse):
+                on_log(msg)
+
+        self._message_handlers.append(on_msg)
+        req = pb.SubscribeLogsRequest(dump_config=dump_config)
+        req.level = log_level
+        self._send_message(req)
+
+    def _handle_frame(self, msg_type, payload):
+        if self._transport is None:
+            # Closed by an earlier frame of the same read
+            return
+        klass = MESSAGE_TYPE_TO_PROTO.get(msg_type)
+        if klass is None:
+            _LOGGER.debug("Skipping message type %s", msg_type)
+            return
+        msg = klass()
+        msg.ParseFromString(payload)
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Got message: %s:\n%s", type(msg), indent(str(msg)))
+        for msg_handler in self._message_handlers[:]:
+            msg_handler(msg)
+        self._handle_internal_messages(msg)
+
+    def _handle_internal_messages(self, msg):
+        if isinstance(msg, pb.DisconnectRequest):
+            self._send_message(pb.DisconnectResponse())
+            was_connected = self._connected
+            self._close()
+            if was_connected and self.on_disconnect is not None:
+                self.on_disconnect(None)
+        elif isinstance(msg, pb.PingRequest):
+            self._send_message(pb.PingResponse())
+        elif isinstance(msg, pb.GetTimeRequest):
+            resp = pb.GetTimeResponse()
+            resp.epoch_seconds = int(time.time())
+            self._send_message(resp)
+
+
+def reconnect_delay(tries):
+    """Seconds to wait before the next connection attempt after tries failed attempts.
+
+    The delay grows exponentially and is randomized between half and the full
+    value, so that many clients that lost their devices at the same time (for
+    example after a power outage) don't all reconnect in lockstep.
+    """
+    delay = min(1.5 ** min(tries, 100), MAX_RECONNECT_WAIT)
+    return random.uniform(delay / 2, delay)
+
+
+async def stream_logs(address, port, password, on_log, log_level=7, stop=None):
+    """Stay subscribed to the logs of a device until stop is set, reconnecting as needed.
+
+    :param on_log: Called with each SubscribeLogsResponse of the device.
+    :param stop: An asyncio.Event that ends the subscription, runs forever if None.
+    """
+    stop = stop or asyncio.Event()
+    cli = APIClient(address, port, password)
+    disconnected = asyncio.Event()
+    has_connects = False
+    tries = 0
+
+    def on_disconnect(err):
+        if err:
+            _LOGGER.warning(u"Disconnected from API of %s: %s", address, err)
+        disconnected.set()
+
+    cli.on_disconnect = on_disconnect
+    stop_task = asyncio.ensure_future(stop.wait())
+    disconnected_task = None
+    try:
+        while not stop.is_set():
+            disconnected.clear()
+            try:
+                await cli.connect()
+                await cli.login()
+                cli.subscribe_logs(on_log, log_level=log_level, dump_config=not has_connects)
+            except APIConnectionError as err:
+                await cli.disconnect(on_disconnect=False)
+                wait_time = reconnect_delay(tries)
+                tries += 1
+                if not has_connects:
+                    _LOGGER.warning(u"Initial connection to %s failed. The ESP might not be "
+                                    u"connected to WiFi yet (%s). Re-Trying in %.1f seconds",
+                                    address, err, wait_time)
+                else:
+                    _LOGGER.warning(u"Couldn't connect to API of %s (%s). Trying to reconnect "
+                                    u"in %.1f seconds", address, err, wait_time)
+                await asyncio.wait([stop_task], timeout=wait_time)
+                continue
+
+            _LOGGER.info("Successfully connected to %s", address)
+            has_connects = True
+            tries = 0
+            disconnected_task = asyncio.ensure_future(disconnected.wait())
+            await asyncio.wait([stop_task, disconnected_task],
+                               return_when=asyncio.FIRST_COMPLETED)
+            disconnected_task.cancel()
+            if not stop.is_set():
+                # The device is most likely rebooting, spread out the reconnects
+                await asyncio.wait([stop_task], timeout=reconnect_delay(tries))
+    finally:
+        tasks = [task for task in (stop_task, disconnected_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.wait(tasks)
+        await cli.disconnect(on_disconnect=False)
+
+
+def run_until_interrupted(coro):
+    """Run coro on a new event loop, cancelling it on KeyboardInterrupt."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    task = loop.create_task(coro)
+    try:
+        return loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        return None
+    finally:
+        loop.close()
+
+
+def _print_log(msg):
+    time_ = datetime.now().time().strftime(u'[%H:%M:%S]')
+    text = msg.message
+    if msg.send_failed:
+        text = color('white', '(Message skipped because it was too big to fit in '
+                              'TCP buffer - This is only cosmetic)')
+    safe_print(time_ + text)
+
+
+def run_logs(config, address):
+    conf = config['api']
+    _LOGGER.info("Starting log output from %s using esphome API", address)
+    run_until_interrupted(stream_logs(address, conf[CONF_PORT], conf[CONF_PASSWORD], _print_log))
+    return 0
+
+
+def run_logs_many(targets, on_log):
+    """Subscribe to the logs of several devices from one event loop until interrupted.
+
+    :param targets: A list of (address, port, password) tuples.
+    :param on_log: Called with the address and the SubscribeLogsResponse of each message.
+    """
+    async def stream_all():
+        await asyncio.gather(*[
+            stream_logs(address, port, password,
+                        lambda msg, address=address: on_log(address, msg))
+            for address, port, password in targets])
+
+    run_until_interrupted(stream_all())
+    return 0
@@ -0,0 +1,71 @@
+"""Disk cache for generated assets like rendered fonts and converted images.
+
+Converting assets with pillow is slow for large glyph sets or images and the
+result only depends on the source file and a few options, so the result is
+stored in .esphome/assets/ next to the configuration, keyed by a hash of the
+source file contents and the options.
+"""
+import hashlib
+import logging
+import os
+import pickle
+
+from esphome.core import CORE
+from esphome.helpers import mkdir_p
+from esphome.py_compat import encode_text, text_type
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bump when the layout of the cached data changes
+CACHE_VERSION = 1
+
+
+def file_hash(path):  # type: (str) -> str
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f_handle:
+        for chunk in iter(lambda: f_handle.read(65536), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def compute_key(path, *options):
+    """Compute the cache key for the source file at path converted with options."""
+    hasher = hashlib.sha256()
+    for part in (CACHE_VERSION, file_hash(path)) + options:
+        hasher.update(encode_text(text_type(part)))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+def asset_cache_path(kind, key):  # type: (str, str) -> str
+    return CORE.relative_config_path('.esphome', 'assets', kind, '{}.pickle'.format(key))
+
+
+def load(kind, key):
+    """Return the cached asset of the given kind and key, None if it isn't cached."""
+    path = asset_cache_path(kind, key)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'rb') as f_handle:
+            return pickle.load(f_handle)
+    except Exception as err:  # pylint: disable=broad-except
+        _LOGGER.debug("Could not read cached %s %s: %s", kind, key, err)
+        return None
+
+
+def save(kind, key, data):
+    path = asset_cache_path(kind, key)
+    tmp_path = path + '.tmp'
+    try:
+        mkdir_p(os.path.dirname(path))
+        with open(tmp_path, 'wb') as f_handle:
+            pickle.dump(data, f_handle, pickle.HIGHEST_PROTOCOL)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except Exception as err:  # pylint: disable=broad-except
+        # Not being able to cache an asset is never fatal
+        _LOGGER.warning("Could not write %s cache: %s", kind, err)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,255 @@
+"""Manifest of the files esphome generated or copied into the build directory.
+
+For every file the manifest stores its size, modification time and content hash,
+and for copied files also the source path with its size and modification time.
+Then an unchanged file is recognized from the metadata alone: neither the source
+nor the old file in the build directory have to be read. Only files whose
+metadata changed are hashed, and only files whose hash changed are written.
+
+A file whose modification time is close to the time it was recorded could still
+change within the resolution of the timestamps. Its metadata is not trusted and
+it is hashed again, like git does for racily clean files.
+
+verify() re-hashes all files of the manifest, for example after the build
+directory was modified outside of esphome (esphome compile --verify-build-tree).
+
+The manifest is stored as .build_manifest.json in the build directory.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+from esphome.core import CORE, EsphomeError
+from esphome.helpers import mkdir_p, write_file
+from esphome.py_compat import encode_text
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bump when the layout of an entry changes
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = '.build_manifest.json'
+# Files modified less than this many seconds before they were recorded are hashed again
+_RACY_WINDOW = 2.0
+
+# The loaded manifests, by build path
+_MANIFESTS = {}
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime]
+
+
+def _hash_data(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f_handle:
+            for block in iter(lambda: f_handle.read(65536), b''):
+                hasher.update(block)
+    except (IOError, OSError):
+        return None
+    return hasher.hexdigest()
+
+
+def _hash_inputs(inputs):
+    hasher = hashlib.sha256()
+    for part in inputs:
+        hasher.update(encode_text(part))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+class BuildManifest(object):
+    def __init__(self, build_path, entries):
+        self.build_path = build_path
+        self._prefix = os.path.join(build_path, '')
+        self.entries = entries
+        self.dirty = False
+        # Statistics of this process
+        self.skipped = 0
+        self.hashed = 0
+        self.written = 0
+
+    @property
+    def path(self):
+        return os.path.join(self.build_path, MANIFEST_FILENAME)
+
+    def _key(self, path):
+        if path.startswith(self._prefix):
+            # The paths of CORE.relative_build_path, without the cost of relpath
+            path = path[len(self._prefix):]
+        else:
+            path = os.path.relpath(path, self.build_path)
+        return path.replace(os.path.sep, '/')
+
+    def _record(self, path, content_hash, source=None, source_stamp=None, input=None):
+        # pylint: disable=redefined-builtin
+        self.entries[self._key(path)] = {
+            'stamp': _stamp(path),
+            'hash': content_hash,
+            'checked': time.time(),
+            'source': source,
+            'source_stamp': source_stamp,
+            'input': input,
+        }
+        self.dirty = True
+
+    def _trusted(self, entry, stamp):
+        """Return True if stamp equals the recorded one and isn't racy."""
+        return stamp is not None and entry['stamp'] == stamp and \
+            entry['checked'] - stamp[1] >= _RACY_WINDOW
+
+    def _current_hash(self, path, entry, stamp):
+        """Return the content hash of the file at path, from the manifest if possible."""
+        if entry is not None and self._trusted(entry, stamp):
+            return entry['hash']
+        if stamp is None:
+            return None
+        self.hashed += 1
+        return _hash_file(path)
+
+    def copy_file(self, src, dst):
+        """Copy src to dst unless dst already has the same contents."""
+        key = self._key(dst)
+        entry = self.entries.get(key)
+        src_stamp = _stamp(src)
+        dst_stamp = _stamp(dst)
+        if entry is not None and entry.get('source') == src and \
+                entry.get('source_stamp') == src_stamp and \
+                entry['checked'] - src_stamp[1] >= _RACY_WINDOW and \
+                self._trusted(entry, dst_stamp):
+            self.skipped += 1
+            return
+
+        self.hashed += 1
+        src_hash = _hash_file(src)
+        if src_hash is not None and self._current_hash(dst, entry, dst_stamp) == src_hash:
+            self.skipped += 1
+        else:
+            mkdir_p(os.path.dirname(dst))
+            try:
+                shutil.copy(src, dst)
+            except (IOError, OSError) as err:
+                raise EsphomeError(u"Error copying file {} to {}: {}".format(src, dst, err))
+            self.written += 1
+        self._record(dst, src_hash, source=src, source_stamp=src_stamp)
+
+    def write_file(self, path, text, inputs=None):
+        """Write text to path unless the file already has this content.
+
+        inputs are what text was generated from, see is_current.
+        """
+        content_hash = _hash_data(encode_text(text))
+        input_hash = None if inputs is None else _hash_inputs(inputs)
+        entry = self.entries.get(self._key(path))
+        stamp = _stamp(path)
+        if self._current_hash(path, entry, stamp) == content_hash:
+            self.skipped += 1
+            if self._trusted(entry, stamp) and entry.get('input') == input_hash:
+                return
+        else:
+            write_file(path, text)
+            self.written += 1
+        self._record(path, content_hash, input=input_hash)
+
+    def is_current(self, path, inputs):
+        """Return True if path was generated from inputs by write_file and is unchanged since.
+
+        Allows skipping files that are generated from their old contents (like the
+        user sections of main.cpp) without reading them.
+        """
+        entry = self.entries.get(self._key(path))
+        if entry is None or entry.get('input') != _hash_inputs(inputs):
+            return False
+        if self._trusted(entry, _stamp(path)):
+            self.skipped += 1
+            return True
+        return False
+
+    def content_hash(self, path):
+        """Return the hash of the contents path was last written with, None if not recorded."""
+        entry = self.entries.get(self._key(path))
+        return None if entry is None else entry['hash']
+
+    def remove(self, path):
+        """Remove the file at path and its entry."""
+        if os.path.isfile(path):
+            os.remove(path)
+        if self.entries.pop(self._key(path), None) is not None:
+            self.dirty = True
+
+    def verify(self):
+        """Re-hash all files of the manifest, returns the paths of the changed or missing ones.
+
+        The entries of these files are dropped, so they're written again. All
+        other entries are refreshed.
+        """
+        changed = []
+        for key, entry in sorted(self.entries.items()):
+            path = os.path.join(self.build_path, *key.split('/'))
+            self.hashed += 1
+            if _hash_file(path) != entry['hash']:
+                changed.append(path)
+                del self.entries[key]
+                continue
+            entry['stamp'] = _stamp(path)
+            entry['checked'] = time.time()
+            if entry['source'] is not None:
+                # Hash the source again too when it's copied next
+                entry['source_stamp'] = None
+        self.dirty = True
+        return changed
+
+    def save(self):
+        """Write the manifest if entries changed."""
+        if not self.dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        try:
+            mkdir_p(self.build_path)
+            with open(tmp_path, 'w') as f_handle:
+                f_handle.write(json.dumps({
+                    'version': MANIFEST_VERSION,
+                    'files': self.entries,
+                }, sort_keys=True))
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(tmp_path, self.path)
+            self.dirty = False
+        except (IOError, OSError) as err:
+            # Not being able to write the manifest is never fatal, all files are
+            # just compared by their contents next time
+            _LOGGER.warning("Could not write build manifest: %s", err)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def get_manifest():  # type: () -> BuildManifest
+    """Return the manifest of the build directory of the current configuration."""
+    build_path = CORE.build_path
+    manifest = _MANIFESTS.get(os.path.abspath(build_path))
+    if manifest is not None:
+        return manifest
+    entries = {}
+    path = os.path.join(build_path, MANIFEST_FILENAME)
+    if os.path.isfile(path):
+        try:
+            with open(path) as f_handle:
+                data = json.load(f_handle)
+            if data.get('version') == MANIFEST_VERSION:
+                entries = data['files']
+        except (IOError, OSError, ValueError, KeyError) as err:
+            _LOGGER.debug("Could not read build manifest: %s", err)
+    manifest = BuildManifest(build_path, entries)
+    _MANIFESTS[os.path.abspath(build_path)] = manifest
+    return manifest
@@ -0,0 +1,182 @@
+"""Content-addressed object cache shared between the builds of all nodes.
+
+Every node gets its own copy of the esphome core and component sources, so a
+fleet of nodes compiles the same translation units over and over again. This
+module is a compiler launcher (similar to ccache) that is hooked into the
+PlatformIO build through an extra script written by esphome.writer:
+
+    python compile_cache.py --cache-dir DIR --base-dir BUILD_PATH ... -- gcc -c ...
+
+The cache key of an object is computed from the preprocessed source (which
+covers the source file, all included headers and the generated defines.h), the
+compiler binary, the compile flags and an extra key for the board/framework.
+Paths of the node's build directories are replaced by a placeholder first, so
+nodes with the same platform and flags share their objects.
+
+This file is executed by the Python interpreter of PlatformIO, so it may only
+use the standard library.
+"""
+from __future__ import print_function
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Bump when the way keys are computed changes
+CACHE_VERSION = 1
+CACHEABLE_EXTENSIONS = ('.c', '.cpp', '.cc', '.cxx')
+BASE_DIR_PLACEHOLDER = b'@ESPHOME_BUILD_PATH@'
+
+
+def _find_executable(name):
+    if os.path.dirname(name):
+        return name if os.path.isfile(name) else None
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            return path
+        if os.path.isfile(path + '.exe'):
+            return path + '.exe'
+    return None
+
+
+def parse_compile_command(cmd):
+    """Split a compiler command into its preprocessor arguments, source and output.
+
+    Returns None if the command is not a single-source compile to an object file
+    (linking, dependency file generation, ...), these are never cached.
+    """
+    args = []
+    source = None
+    output = None
+    compile_only = False
+    i = 1
+    while i < len(cmd):
+        arg = cmd[i]
+        if arg == '-o' and i + 1 < len(cmd):
+            if output is not None:
+                return None
+            output = cmd[i + 1]
+            i += 2
+            continue
+        if arg == '-c':
+            compile_only = True
+        elif arg.startswith('-M'):
+            # Dependency files are written as a side effect, can't restore them from cache
+            return None
+        elif not arg.startswith('-') and os.path.splitext(arg)[1] in CACHEABLE_EXTENSIONS:
+            if source is not None:
+                return None
+            source = arg
+            args.append(arg)
+        else:
+            args.append(arg)
+        i += 1
+    if not compile_only or source is None or output is None:
+        return None
+    return args, source, output
+
+
+def _normalize(data, base_dirs):
+    for base_dir in base_dirs:
+        data = data.replace(base_dir, BASE_DIR_PLACEHOLDER)
+    return data
+
+
+def compute_key(cmd, args, base_dirs, extra_key):
+    """Compute the cache key of a compile command, None if it can't be cached."""
+    compiler = _find_executable(cmd[0])
+    if compiler is None:
+        return None
+    compiler = os.path.realpath(compiler)
+    stat = os.stat(compiler)
+
+    proc = subprocess.Popen([cmd[0]] + args + ['-E'], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    preprocessed, _ = proc.communicate()
+    if proc.returncode != 0:
+        # Let the real compiler invocation report the error
+        return None
+
+    hasher = hashlib.sha256()
+    for part in (str(CACHE_VERSION), compiler, str(stat.st_size), str(int(stat.st_mtime)),
+                 extra_key):
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\0')
+    for arg in args:
+        hasher.update(_normalize(arg.encode('utf-8'), base_dirs))
+        hasher.update(b'\0')
+    hasher.update(_normalize(preprocessed, base_dirs))
+    return hasher.hexdigest()
+
+
+def _store(cache_path, output):
+    directory = os.path.dirname(cache_path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Created by a parallel build
+            pass
+    # Write to a temporary file first so concurrent builds never see partial objects
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    os.close(fd)
+    try:
+        shutil.copyfile(output, tmp_path)
+        if os.path.exists(cache_path):
+            return
+        os.rename(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def run(cache_dir, base_dirs, extra_key, cmd):
+    parsed = parse_compile_command(cmd)
+    if parsed is None:
+        return subprocess.call(cmd)
+    args, source, output = parsed
+    base_dirs = [os.path.abspath(x).encode('utf-8') for x in base_dirs]
+    # Replace the longest paths first, they may be nested in each other
+    base_dirs.sort(key=len, reverse=True)
+    key = compute_key(cmd, args, base_dirs, extra_key)
+    if key is None:
+        return subprocess.call(cmd)
+
+    cache_path = os.path.join(cache_dir, key[:2], key[2:] + '.o')
+    if os.path.isfile(cache_path):
+        shutil.copyfile(cache_path, output)
+        print("Using cached object for {}".format(source))
+        return 0
+
+    rc = subprocess.call(cmd)
+    if rc == 0 and os.path.isfile(output):
+        try:
+            _store(cache_path, output)
+        except (IOError, OSError) as err:
+            print("Could not store {} in compile cache: {}".format(output, err), file=sys.stderr)
+    return rc
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ESPHome compile cache launcher.")
+    parser.add_argument('--cache-dir', required=True)
+    parser.add_argument('--base-dir', action='append', default=[])
+    parser.add_argument('--extra-key', default='')
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv[1:])
+    cmd = args.command
+    if cmd and cmd[0] == '--':
+        cmd = cmd[1:]
+    if not cmd:
+        parser.error("Missing compiler command")
+    return run(args.cache_dir, args.base_dir, args.extra_key, cmd)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
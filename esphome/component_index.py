@@ -0,0 +1,156 @@
+"""Cached index of the metadata of core and custom components.
+
+Finding out the dependencies, auto loads or supported platforms of a component
+requires importing its module, which also builds all of its schemas and C++
+class trees. The index stores this metadata (and the C++ source files of the
+component) in .esphome/component_index.json next to the configuration, so the
+loading and dependency stages of the validation don't need to import anything.
+Modules are then only imported once their schema or code generation is needed.
+
+Each entry is keyed by the module file and its modification time, plus the
+modification time of its directory (for the list of source files), so editing a
+component or adding a source file refreshes its entry.
+"""
+import json
+import logging
+import os
+
+from esphome import const
+from esphome.const import SOURCE_FILE_EXTENSIONS
+from esphome.core import CORE
+from esphome.helpers import mkdir_p
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bump when the layout of an entry changes
+INDEX_VERSION = 1
+# The module attributes that are stored as lists, with their default values
+_LIST_ATTRIBUTES = {
+    'AUTO_LOAD': [],
+    'DEPENDENCIES': [],
+    'CONFLICTS_WITH': [],
+    'ESP_PLATFORMS': list(const.ESP_PLATFORMS),
+}
+
+# The loaded index, by config directory
+_INDEXES = {}
+
+
+class _Index(object):
+    def __init__(self, path, entries):
+        self.path = path
+        self.entries = entries
+        self.dirty = False
+
+
+def index_path():  # type: () -> str
+    return CORE.relative_config_path('.esphome', 'component_index.json')
+
+
+def _get_index():
+    path = index_path()
+    index = _INDEXES.get(path)
+    if index is not None:
+        return index
+    entries = {}
+    if os.path.isfile(path):
+        try:
+            with open(path) as f_handle:
+                data = json.load(f_handle)
+            if data.get('version') == INDEX_VERSION and \
+                    data.get('esphome_version') == const.__version__:
+                entries = data['components']
+        except (IOError, OSError, ValueError, KeyError) as err:
+            _LOGGER.debug("Could not read component index: %s", err)
+    index = _Index(path, entries)
+    _INDEXES[path] = index
+    return index
+
+
+def module_file(base_path, parts):
+    """Return the file of the module at base_path/parts, without importing it.
+
+    None if there is no such module.
+    """
+    path = os.path.join(base_path, *parts)
+    if os.path.isfile(path + '.py'):
+        return path + '.py'
+    init_path = os.path.join(path, '__init__.py')
+    if os.path.isfile(init_path):
+        return init_path
+    return None
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+        dir_stat = os.stat(os.path.dirname(path))
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size, dir_stat.st_mtime]
+
+
+def lookup(module_name, path):
+    """Return the index entry of the module at path, None if it's missing or outdated."""
+    entry = _get_index().entries.get(module_name)
+    if entry is None or entry['file'] != path or entry['stamp'] != _stamp(path):
+        return None
+    return entry
+
+
+def _find_source_files(path):
+    directory = os.path.dirname(path)
+    return sorted(f for f in os.listdir(directory)
+                  if os.path.splitext(f)[1].lower() in SOURCE_FILE_EXTENSIONS and
+                  os.path.isfile(os.path.join(directory, f)))
+
+
+def add(module_name, module):
+    """Add the metadata of the imported module to the index."""
+    path = os.path.abspath(module.__file__)
+    if path.endswith('.pyc'):
+        path = path[:-1]
+    entry = {
+        'file': path,
+        'stamp': _stamp(path),
+        'is_platform_component': bool(getattr(module, 'IS_PLATFORM_COMPONENT', False)),
+        'multi_conf': bool(getattr(module, 'MULTI_CONF', False)),
+        'has_config_schema': getattr(module, 'CONFIG_SCHEMA', None) is not None,
+        'has_to_code': getattr(module, 'to_code', None) is not None,
+        'source_files': _find_source_files(path),
+    }
+    for name, default in _LIST_ATTRIBUTES.items():
+        value = getattr(module, name, default)
+        if not isinstance(value, (list, tuple)):
+            # Computed at runtime, this module can't be indexed
+            return
+        entry[name.lower()] = list(value)
+    index = _get_index()
+    if index.entries.get(module_name) != entry:
+        index.entries[module_name] = entry
+        index.dirty = True
+
+
+def save():
+    """Write the index of the current config directory if entries were added."""
+    index = _get_index()
+    if not index.dirty:
+        return
+    tmp_path = index.path + '.tmp'
+    try:
+        mkdir_p(os.path.dirname(index.path))
+        with open(tmp_path, 'w') as f_handle:
+            json.dump({
+                'version': INDEX_VERSION,
+                'esphome_version': const.__version__,
+                'components': index.entries,
+            }, f_handle, indent=1, sort_keys=True)
+        if os.path.exists(index.path):
+            os.remove(index.path)
+        os.rename(tmp_path, index.path)
+        index.dirty = False
+    except (IOError, OSError) as err:
+        # Not being able to write the index is never fatal
+        _LOGGER.warning("Could not write component index: %s", err)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
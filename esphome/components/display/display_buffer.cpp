@@ -427,14 +427,51 @@ Font::Font(std::vector<Glyph> &&glyphs, int baseline, int bottom)
 bool Image::get_pixel(int x, int y) const {
   if (x < 0 || x >= this->width_ || y < 0 || y >= this->height_)
     return false;
+  if (this->type_ != IMAGE_TYPE_BINARY)
+    return this->get_grayscale_pixel(x, y) < 128;
   const uint32_t width_8 = ((this->width_ + 7u) / 8u) * 8u;
   const uint32_t pos = x + y * width_8;
   return pgm_read_byte(this->data_start_ + (pos / 8u)) & (0x80 >> (pos % 8u));
 }
+uint8_t Image::get_grayscale_pixel(int x, int y) const {
+  if (x < 0 || x >= this->width_ || y < 0 || y >= this->height_)
+    return 0;
+  switch (this->type_) {
+    case IMAGE_TYPE_GRAYSCALE4: {
+      const uint32_t width_2 = (this->width_ + 1u) / 2u;
+      const uint8_t value = pgm_read_byte(this->data_start_ + x / 2u + y * width_2);
+      const uint8_t nibble = (x % 2u) ? (value & 0x0F) : (value >> 4);
+      return nibble * 17;
+    }
+    case IMAGE_TYPE_GRAYSCALE8:
+      return pgm_read_byte(this->data_start_ + x + y * this->width_);
+    case IMAGE_TYPE_RGB565: {
+      const uint16_t color = this->get_rgb565_pixel(x, y);
+      const uint32_t red = (color >> 11) * 255u / 31u;
+      const uint32_t green = ((color >> 5) & 0x3F) * 255u / 63u;
+      const uint32_t blue = (color & 0x1F) * 255u / 31u;
+      return (red * 77u + green * 150u + blue * 29u) >> 8;
+    }
+    case IMAGE_TYPE_BINARY:
+    default:
+      return this->get_pixel(x, y) ? 0 : 255;
+  }
+}
+uint16_t Image::get_rgb565_pixel(int x, int y) const {
+  if (x < 0 || x >= this->width_ || y < 0 || y >= this->height_)
+    return 0;
+  if (this->type_ != IMAGE_TYPE_RGB565) {
+    const uint8_t gray = this->get_grayscale_pixel(x, y);
+    return ((gray >> 3) << 11) | ((gray >> 2) << 5) | (gray >> 3);
+  }
+  const uint32_t pos = (x + y * this->width_) * 2u;
+  return (pgm_read_byte(this->data_start_ + pos) << 8) | pgm_read_byte(this->data_start_ + pos + 1);
+}
 int Image::get_width() const { return this->width_; }
 int Image::get_height() const { return this->height_; }
-Image::Image(const uint8_t *data_start, int width, int height)
-    : width_(width), height_(height), data_start_(data_start) {}
+ImageType Image::get_type() const { return this->type_; }
+Image::Image(const uint8_t *data_start, int width, int height, ImageType type)
+    : width_(width), height_(height), type_(type), data_start_(data_start) {}
 
 DisplayPage::DisplayPage(const display_writer_t &writer) : writer_(writer) {}
 void DisplayPage::show() { this->parent_->show_page(this); }
@@ -74,6 +74,17 @@ enum DisplayRotation {
   DISPLAY_ROTATION_270_DEGREES = 270,
 };
 
+enum ImageType {
+  /// 1 bit per pixel, set bits are ON
+  IMAGE_TYPE_BINARY = 0,
+  /// 4 bit grayscale, two pixels per byte
+  IMAGE_TYPE_GRAYSCALE4 = 1,
+  /// 8 bit grayscale, one byte per pixel
+  IMAGE_TYPE_GRAYSCALE8 = 2,
+  /// 16 bit RGB565 color, big endian
+  IMAGE_TYPE_RGB565 = 3,
+};
+
 class Font;
 class Image;
 class DisplayBuffer;
@@ -377,14 +388,21 @@ class Font {
 
 class Image {
  public:
-  Image(const uint8_t *data_start, int width, int height);
+  Image(const uint8_t *data_start, int width, int height, ImageType type = IMAGE_TYPE_BINARY);
+  /// Whether the pixel is ON, for grayscale and color images dark pixels are ON.
   bool get_pixel(int x, int y) const;
+  /// Get the brightness of the pixel from 0 (black) to 255 (white).
+  uint8_t get_grayscale_pixel(int x, int y) const;
+  /// Get the color of the pixel in RGB565 format.
+  uint16_t get_rgb565_pixel(int x, int y) const;
   int get_width() const;
   int get_height() const;
+  ImageType get_type() const;
 
  protected:
   int width_;
   int height_;
+  ImageType type_;
   const uint8_t *data_start_;
 };
 
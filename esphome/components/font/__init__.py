@@ -1,10 +1,10 @@
 # coding=utf-8
-from esphome import core
+from esphome import asset_cache, core
 from esphome.components import display
 import esphome.config_validation as cv
 import esphome.codegen as cg
 from esphome.const import CONF_FILE, CONF_GLYPHS, CONF_ID, CONF_SIZE
-from esphome.core import CORE, HexInt
+from esphome.core import CORE
 from esphome.py_compat import sort_by_cmp
 
 DEPENDENCIES = ['display']
@@ -77,39 +77,61 @@ FONT_SCHEMA = cv.Schema({
 CONFIG_SCHEMA = cv.All(validate_pillow_installed, FONT_SCHEMA)
 
 
-def to_code(config):
+def _render_glyph(font, glyph):
+    """Render glyph to a bitmap with rows padded to full bytes, MSB is the leftmost pixel."""
+    from PIL import Image
+
+    mask = font.getmask(glyph, mode='1')
+    _, (offset_x, offset_y) = font.font.getsize(glyph)
+    width, height = mask.size
+    # Mode 1 images are stored exactly like that, so let pillow do the packing
+    image = Image.Image()._new(mask)  # pylint: disable=protected-access
+    if image.mode != '1':
+        image = image.point(lambda x: 255 if x else 0, '1')
+    return image.tobytes(), offset_x, offset_y, width, height
+
+
+def render_font(path, size, glyphs):
+    """Render all glyphs of the font, the result is cached on disk.
+
+    Returns the font ascent and descent, the raw bitmap data of all glyphs and
+    a (data offset, offset x, offset y, width, height) tuple for each glyph.
+    """
+    import PIL
     from PIL import ImageFont
 
-    path = CORE.relative_config_path(config[CONF_FILE])
+    key = asset_cache.compute_key(path, size, PIL.__version__, *glyphs)
+    cached = asset_cache.load('font', key)
+    if cached is not None:
+        return cached
+
     try:
-        font = ImageFont.truetype(path, config[CONF_SIZE])
+        font = ImageFont.truetype(path, size)
     except Exception as e:
         raise core.EsphomeError(u"Could not load truetype file {}: {}".format(path, e))
 
     ascent, descent = font.getmetrics()
-
-    glyph_args = {}
-    data = []
-    for glyph in config[CONF_GLYPHS]:
-        mask = font.getmask(glyph, mode='1')
-        _, (offset_x, offset_y) = font.font.getsize(glyph)
-        width, height = mask.size
-        width8 = ((width + 7) // 8) * 8
-        glyph_data = [0 for _ in range(height * width8 // 8)]  # noqa: F812
-        for y in range(height):
-            for x in range(width):
-                if not mask.getpixel((x, y)):
-                    continue
-                pos = x + y * width8
-                glyph_data[pos // 8] |= 0x80 >> (pos % 8)
-        glyph_args[glyph] = (len(data), offset_x, offset_y, width, height)
+    data = bytearray()
+    glyph_args = []
+    for glyph in glyphs:
+        glyph_data, offset_x, offset_y, width, height = _render_glyph(font, glyph)
+        glyph_args.append((len(data), offset_x, offset_y, width, height))
         data += glyph_data
 
-    rhs = [HexInt(x) for x in data]
-    prog_arr = cg.progmem_array(config[CONF_RAW_DATA_ID], rhs)
+    result = (ascent, descent, bytes(data), glyph_args)
+    asset_cache.save('font', key, result)
+    return result
+
+
+def to_code(config):
+    path = CORE.relative_config_path(config[CONF_FILE])
+    ascent, descent, data, glyph_args = render_font(path, config[CONF_SIZE],
+                                                    config[CONF_GLYPHS])
+
+    prog_arr = cg.progmem_array(config[CONF_RAW_DATA_ID], cg.BinaryBlob(data))
 
     glyphs = []
-    for glyph in config[CONF_GLYPHS]:
-        glyphs.append(Glyph(glyph, prog_arr, *glyph_args[glyph]))
+    for glyph, args in zip(config[CONF_GLYPHS], glyph_args):
+        glyphs.append(Glyph(glyph, prog_arr, *args))
 
     cg.new_Pvariable(config[CONF_ID], glyphs, ascent, ascent + descent)
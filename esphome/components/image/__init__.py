@@ -1,57 +1,140 @@
 # coding=utf-8
 import logging
 
-from esphome import core
+from esphome import asset_cache, core
 from esphome.components import display, font
 import esphome.config_validation as cv
 import esphome.codegen as cg
-from esphome.const import CONF_FILE, CONF_ID, CONF_RESIZE
-from esphome.core import CORE, HexInt
+from esphome.const import CONF_FILE, CONF_ID, CONF_RESIZE, CONF_TYPE
+from esphome.core import CORE
+
 _LOGGER = logging.getLogger(__name__)
 
 DEPENDENCIES = ['display']
 MULTI_CONF = True
 
 Image_ = display.display_ns.class_('Image')
+ImageType = display.display_ns.enum('ImageType')
+IMAGE_TYPE = {
+    'BINARY': ImageType.IMAGE_TYPE_BINARY,
+    'GRAYSCALE4': ImageType.IMAGE_TYPE_GRAYSCALE4,
+    'GRAYSCALE8': ImageType.IMAGE_TYPE_GRAYSCALE8,
+    'RGB565': ImageType.IMAGE_TYPE_RGB565,
+}
 
 CONF_RAW_DATA_ID = 'raw_data_id'
+# Warn if an image needs more flash than this
+LARGE_IMAGE_BYTES = 64 * 1024
 
 IMAGE_SCHEMA = cv.Schema({
     cv.Required(CONF_ID): cv.declare_id(Image_),
     cv.Required(CONF_FILE): cv.file_,
     cv.Optional(CONF_RESIZE): cv.dimensions,
+    cv.Optional(CONF_TYPE, default='BINARY'): cv.enum(IMAGE_TYPE, upper=True),
     cv.GenerateID(CONF_RAW_DATA_ID): cv.declare_id(cg.uint8),
 })
 
 CONFIG_SCHEMA = cv.All(font.validate_pillow_installed, IMAGE_SCHEMA)
 
 
-def to_code(config):
+def _pad_width(image, multiple):
+    """Pad the rows of image with black pixels to a multiple of the given width."""
     from PIL import Image
 
-    path = CORE.relative_config_path(config[CONF_FILE])
+    width, height = image.size
+    padded_width = ((width + multiple - 1) // multiple) * multiple
+    if padded_width == width:
+        return image
+    padded = Image.new(image.mode, (padded_width, height))
+    padded.paste(image, (0, 0))
+    return padded
+
+
+def _interleave(high, low):
+    """Return the bytes of two L images of the same size interleaved pixel by pixel."""
+    from PIL import Image
+
+    return Image.merge('LA', (high, low)).tobytes()
+
+
+def _convert_binary(image):
+    from PIL import Image, ImageChops
+
+    # One bit per pixel, rows are padded to full bytes, set bits are dark pixels
+    image = image.convert('1', dither=Image.NONE)
+    return ImageChops.invert(image).tobytes()
+
+
+def _convert_grayscale4(image):
+    from PIL import Image, ImageChops
+
+    # Two pixels per byte, the left one in the high nibble, rows are padded to full bytes
+    image = _pad_width(image.convert('L'), 2)
+    width, height = image.size
+    # Reinterpret each pair of pixels as one two-band pixel to split even and odd columns
+    pairs = Image.frombytes('LA', (width // 2, height), image.tobytes())
+    left, right = pairs.split()
+    left = left.point(lambda x: x & 0xF0)
+    right = right.point(lambda x: x >> 4)
+    return ImageChops.add(left, right).tobytes()
+
+
+def _convert_grayscale8(image):
+    return image.convert('L').tobytes()
+
+
+def _convert_rgb565(image):
+    from PIL import ImageChops
+
+    # Two bytes per pixel, big endian: RRRRRGGG GGGBBBBB
+    red, green, blue = image.convert('RGB').split()
+    high = ImageChops.add(red.point(lambda x: x & 0xF8), green.point(lambda x: x >> 5))
+    low = ImageChops.add(green.point(lambda x: (x << 3) & 0xE0), blue.point(lambda x: x >> 3))
+    return _interleave(high, low)
+
+
+IMAGE_CONVERTERS = {
+    'BINARY': _convert_binary,
+    'GRAYSCALE4': _convert_grayscale4,
+    'GRAYSCALE8': _convert_grayscale8,
+    'RGB565': _convert_rgb565,
+}
+
+
+def convert_image(path, image_type, resize=None):
+    """Convert the image file at path to the raw data of image_type, the result is cached on disk.
+
+    Returns the width, height and the raw pixel data.
+    """
+    import PIL
+    from PIL import Image
+
+    key = asset_cache.compute_key(path, image_type, resize, PIL.__version__)
+    cached = asset_cache.load('image', key)
+    if cached is not None:
+        return cached
+
     try:
         image = Image.open(path)
     except Exception as e:
         raise core.EsphomeError(u"Could not load image file {}: {}".format(path, e))
 
-    if CONF_RESIZE in config:
-        image.thumbnail(config[CONF_RESIZE])
+    if resize is not None:
+        image.thumbnail(resize)
 
-    image = image.convert('1', dither=Image.NONE)
     width, height = image.size
-    if width > 500 or height > 500:
-        _LOGGER.warning("The image you requested is very big. Please consider using the resize "
-                        "parameter")
-    width8 = ((width + 7) // 8) * 8
-    data = [0 for _ in range(height * width8 // 8)]
-    for y in range(height):
-        for x in range(width):
-            if image.getpixel((x, y)):
-                continue
-            pos = x + y * width8
-            data[pos // 8] |= 0x80 >> (pos % 8)
-
-    rhs = [HexInt(x) for x in data]
-    prog_arr = cg.progmem_array(config[CONF_RAW_DATA_ID], rhs)
-    cg.new_Pvariable(config[CONF_ID], prog_arr, width, height)
+    result = (width, height, IMAGE_CONVERTERS[image_type](image))
+    asset_cache.save('image', key, result)
+    return result
+
+
+def to_code(config):
+    path = CORE.relative_config_path(config[CONF_FILE])
+    width, height, data = convert_image(path, config[CONF_TYPE], config.get(CONF_RESIZE))
+    if len(data) > LARGE_IMAGE_BYTES:
+        _LOGGER.warning("The image %s uses %s KiB of flash. Please consider using the resize "
+                        "parameter or a type with fewer bits per pixel", config[CONF_FILE],
+                        len(data) // 1024)
+
+    prog_arr = cg.progmem_array(config[CONF_RAW_DATA_ID], cg.BinaryBlob(data))
+    cg.new_Pvariable(config[CONF_ID], prog_arr, width, height, config[CONF_TYPE])
@@ -12,16 +12,17 @@ from contextlib import contextmanager
 
 import voluptuous as vol
 
-from esphome import core, core_config, yaml_util
+import esphome.config_validation as cv
+from esphome import component_index, core, core_config, profiling, yaml_util
 from esphome.components import substitutions
 from esphome.components.substitutions import CONF_SUBSTITUTIONS
-from esphome.const import CONF_ESPHOME, CONF_PLATFORM, ESP_PLATFORMS
+from esphome.const import CONF_ESPHOME, CONF_PLATFORM, CONF_THEN, ESP_PLATFORMS
 from esphome.core import CORE, EsphomeError  # noqa
 from esphome.helpers import color, indent
 from esphome.py_compat import text_type, IS_PY2, decode_text
 from esphome.util import safe_print, OrderedDict
 
-from typing import List, Optional, Tuple, Union  # noqa
+from typing import Dict, List, Optional, Tuple, Union  # noqa
 from esphome.core import ConfigType  # noqa
 from esphome.yaml_util import is_secret, ESPHomeDataBase
 from esphome.voluptuous_schema import ExtraKeysInvalid
@@ -33,11 +34,19 @@ _COMPONENT_CACHE = {}
 
 class ComponentManifest(object):
     def __init__(self, module, base_components_path, is_core=False, is_platform=False):
-        self.module = module
+        self._module = module
         self._is_core = is_core
         self.is_platform = is_platform
         self.base_components_path = base_components_path
 
+    @property
+    def module(self):
+        return self._module
+
+    @property
+    def module_file(self):
+        return os.path.abspath(self.module.__file__)
+
     @property
     def is_platform_component(self):
         return getattr(self.module, 'IS_PLATFORM_COMPONENT', False)
@@ -106,6 +115,83 @@ class ComponentManifest(object):
         return ret
 
 
+class IndexedComponentManifest(ComponentManifest):
+    """A manifest backed by an entry of the component index.
+
+    The metadata used by the loading and dependency stages comes from the index, the
+    module is only imported once its schema, code generation or another attribute is
+    needed.
+    """
+
+    def __init__(self, module_name, entry, base_components_path, is_platform=False):
+        super(IndexedComponentManifest, self).__init__(None, base_components_path,
+                                                       is_platform=is_platform)
+        self._module_name = module_name
+        self._entry = entry
+
+    @property
+    def module(self):
+        if self._module is None:
+            try:
+                self._module = importlib.import_module(self._module_name)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.error("Unable to load component %s:", self._module_name, exc_info=True)
+                raise EsphomeError(u"Unable to load component {}".format(self._module_name))
+        return self._module
+
+    @property
+    def module_file(self):
+        return self._entry['file']
+
+    @property
+    def is_platform_component(self):
+        return self._entry['is_platform_component']
+
+    @property
+    def config_schema(self):
+        if not self._entry['has_config_schema']:
+            return None
+        return super(IndexedComponentManifest, self).config_schema
+
+    @property
+    def is_multi_conf(self):
+        return self._entry['multi_conf']
+
+    @property
+    def to_code(self):
+        if not self._entry['has_to_code']:
+            return None
+        return super(IndexedComponentManifest, self).to_code
+
+    @property
+    def esp_platforms(self):
+        return self._entry['esp_platforms']
+
+    @property
+    def dependencies(self):
+        return self._entry['dependencies']
+
+    @property
+    def conflicts_with(self):
+        return self._entry['conflicts_with']
+
+    @property
+    def auto_load(self):
+        return self._entry['auto_load']
+
+    @property
+    def source_files(self):
+        ret = {}
+        directory = os.path.dirname(self.module_file)
+        for x in self._entry['source_files']:
+            full_file = os.path.join(directory, x)
+            rel = os.path.relpath(full_file, self.base_components_path)
+            # Always use / for C++ include names
+            rel = rel.replace(os.sep, '/')
+            ret['esphome/components/{}'.format(rel)] = full_file
+        return ret
+
+
 CORE_COMPONENTS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'components'))
 _UNDEF = object()
 CUSTOM_COMPONENTS_PATH = _UNDEF
@@ -130,14 +216,38 @@ def _mount_config_dir():
     CUSTOM_COMPONENTS_PATH = custom_path
 
 
+def _lookup_indexed(domain, is_platform):
+    """Look up the manifest of domain in the component index, None if it's not indexed."""
+    parts = domain.split('.')
+    for package, base_path in [('custom_components', CUSTOM_COMPONENTS_PATH),
+                               ('esphome.components', CORE_COMPONENTS_PATH)]:
+        if base_path is None:
+            continue
+        path = component_index.module_file(base_path, parts)
+        if path is None:
+            continue
+        module_name = '{}.{}'.format(package, domain)
+        entry = component_index.lookup(module_name, path)
+        if entry is None:
+            return None
+        return IndexedComponentManifest(module_name, entry, base_path, is_platform=is_platform)
+    return None
+
+
 def _lookup_module(domain, is_platform):
     if domain in _COMPONENT_CACHE:
         return _COMPONENT_CACHE[domain]
 
     _mount_config_dir()
+    manif = _lookup_indexed(domain, is_platform)
+    if manif is not None:
+        _COMPONENT_CACHE[domain] = manif
+        return manif
+
     # First look for custom_components
+    module_name = 'custom_components.{}'.format(domain)
     try:
-        module = importlib.import_module('custom_components.{}'.format(domain))
+        module = importlib.import_module(module_name)
     except ImportError as e:
         # ImportError when no such module
         if 'No module named' not in str(e):
@@ -148,12 +258,14 @@ def _lookup_module(domain, is_platform):
         return None
     else:
         # Found in custom components
+        component_index.add(module_name, module)
         manif = ComponentManifest(module, CUSTOM_COMPONENTS_PATH, is_platform=is_platform)
         _COMPONENT_CACHE[domain] = manif
         return manif
 
+    module_name = 'esphome.components.{}'.format(domain)
     try:
-        module = importlib.import_module('esphome.components.{}'.format(domain))
+        module = importlib.import_module(module_name)
     except ImportError as e:
         if 'No module named' not in str(e):
             _LOGGER.error("Unable to import component %s:", domain, exc_info=True)
@@ -162,6 +274,7 @@ def _lookup_module(domain, is_platform):
         _LOGGER.error("Unable to load component %s:", domain, exc_info=True)
         return None
     else:
+        component_index.add(module_name, module)
         manif = ComponentManifest(module, CORE_COMPONENTS_PATH, is_platform=is_platform)
         _COMPONENT_CACHE[domain] = manif
         return manif
@@ -303,6 +416,81 @@ class Config(OrderedDict):
         return part
 
 
+def _same_data(first, second):
+    """Return whether two loaded configs are equal, including the document ranges."""
+    if type(first) is not type(second):
+        return False
+    if isinstance(first, ESPHomeDataBase) and first.esp_range != second.esp_range:
+        return False
+    if isinstance(first, dict):
+        if list(first.keys()) != list(second.keys()):
+            return False
+        return all(_same_data(first[key], second[key]) for key in first)
+    if isinstance(first, list):
+        if len(first) != len(second):
+            return False
+        return all(_same_data(x, y) for x, y in zip(first, second))
+    if isinstance(first, core.Lambda):
+        return first.value == second.value
+    return first == second
+
+
+class _SchemaCacheEntry(object):
+    def __init__(self, conf, comp, validated, errors):
+        self.conf = conf
+        self.comp = comp
+        self.validated = validated
+        self.errors = errors
+        # do_id_pass resolves IDs in place, remember their state before it ran
+        self.ids = [(id, id.id) for id, _ in iter_ids(validated)] if validated is not None else []
+
+
+class SchemaCache(object):
+    """The config_schema results of previous validate_config calls.
+
+    Used for the incremental validation of the editor server: validating a config
+    that was edited only re-runs the schemas of the domains and platform entries
+    whose input changed. An entry is reused if its input is unchanged, including the
+    document ranges (so that error locations stay correct). All entries are dropped
+    if something every schema can depend on changes, like the esphome: section or the
+    set of loaded integrations.
+    """
+
+    def __init__(self):
+        self._context = None
+        self._entries = {}  # type: Dict[Tuple[Union[str, int], ...], _SchemaCacheEntry]
+        # Statistics of the last validate_config call
+        self.reused = 0
+        self.validated = 0
+
+    def begin(self, config):
+        context = [config.get(CONF_ESPHOME), list(config.keys()),
+                   sorted(CORE.loaded_integrations), CORE.esp_platform, CORE.board]
+        if self._context is None or not _same_data(context, self._context):
+            self._entries = {}
+            self._context = context
+        self.reused = 0
+        self.validated = 0
+
+    def restore(self, result, path, conf, comp):
+        # type: (Config, ConfigPath, ConfigType, ComponentManifest) -> bool
+        """Put the cached result for path into result, returns False if there is none."""
+        entry = self._entries.get(tuple(path))
+        if entry is None or entry.comp is not comp or not _same_data(entry.conf, conf):
+            return False
+        for id, id_name in entry.ids:
+            id.id = id_name
+        if entry.validated is not None:
+            result.set_by_path(path, entry.validated)
+        for err in entry.errors:
+            result.add_error(err)
+        self.reused += 1
+        return True
+
+    def store(self, path, conf, comp, validated, errors):
+        self._entries[tuple(path)] = _SchemaCacheEntry(conf, comp, validated, errors)
+
+
 def iter_ids(config, path=None):
     path = path or []
     if isinstance(config, core.ID):
@@ -321,34 +509,51 @@ def iter_ids(config, path=None):
 
 
 def do_id_pass(result):  # type: (Config) -> None
+    from esphome.config_validation import RESERVED_IDS
     from esphome.cpp_generator import MockObjClass
     from esphome.cpp_types import Component
+    from esphome.helpers import UniqueStringGenerator
 
     declare_ids = []  # type: List[Tuple[core.ID, ConfigPath]]
     searching_ids = []  # type: List[Tuple[core.ID, ConfigPath]]
+    # Manually declared IDs by name
+    manual_ids = {}  # type: Dict[str, Tuple[core.ID, ConfigPath]]
     for id, path in iter_ids(result):
         if id.is_declaration:
             if id.id is not None:
                 # Look for duplicate definitions
-                match = next((v for v in declare_ids if v[0].id == id.id), None)
+                match = manual_ids.get(id.id)
                 if match is not None:
                     opath = u'->'.join(text_type(v) for v in match[1])
                     result.add_str_error(u"ID {} redefined! Check {}".format(id.id, opath), path)
                     continue
+                manual_ids[id.id] = (id, path)
             declare_ids.append((id, path))
         else:
             searching_ids.append((id, path))
     # Resolve default ids after manual IDs
+    names = UniqueStringGenerator(list(manual_ids) + list(RESERVED_IDS))
     for id, _ in declare_ids:
-        id.resolve([v[0].id for v in declare_ids])
+        if id.id is None:
+            id.id = names.generate(id.default_name)
         if isinstance(id.type, MockObjClass) and id.type.inherits_from(Component):
             CORE.component_ids.add(id.id)
 
+    # All declared IDs by name, and the first declared ID for every type any of them
+    # inherits from, by C++ type name
+    declared = {}  # type: Dict[str, core.ID]
+    by_type = {}  # type: Dict[str, core.ID]
+    for id, _ in declare_ids:
+        declared.setdefault(id.id, id)
+        if isinstance(id.type, MockObjClass):
+            for type_name in id.type.type_names:
+                by_type.setdefault(type_name, id)
+
     # Check searched IDs
     for id, path in searching_ids:
         if id.id is not None:
             # manually declared
-            match = next((v[0] for v in declare_ids if v[0].id == id.id), None)
+            match = declared.get(id.id)
             if match is None:
                 # No declared ID with this name
                 import difflib
@@ -369,21 +574,25 @@ def do_id_pass(result):  # type: (Config) -> None
                                      "".format(id.id, match.type, id.type), path)
 
         if id.id is None and id.type is not None:
-            for v in declare_ids:
-                if v[0] is None or not isinstance(v[0].type, MockObjClass):
-                    continue
-                inherits = v[0].type.inherits_from(id.type)
-                if inherits:
-                    id.id = v[0].id
-                    break
+            match = by_type.get(id.type.base)
+            if match is not None:
+                id.id = match.id
             else:
                 result.add_str_error("Couldn't resolve ID for type '{}'".format(id.type), path)
 
 
-def validate_config(config):
+def validate_config(config, schema_cache=None, id_pass=True):
+    # type: (ConfigType, Optional[SchemaCache], bool) -> Config
+    with profiling.span(u'validate_config'):
+        return _validate_config(config, schema_cache, id_pass)
+
+
+def _validate_config(config, schema_cache, id_pass):
+    # type: (ConfigType, Optional[SchemaCache], bool) -> Config
     result = Config()
 
     # 1. Load substitutions
+    profiling.step(u'1. substitutions')
     if CONF_SUBSTITUTIONS in config:
         result[CONF_SUBSTITUTIONS] = config[CONF_SUBSTITUTIONS]
         result.add_output_path([CONF_SUBSTITUTIONS], CONF_SUBSTITUTIONS)
@@ -404,6 +613,7 @@ def validate_config(config):
         return result
 
     # 2. Load partial core config
+    profiling.step(u'2. core config')
     result[CONF_ESPHOME] = config[CONF_ESPHOME]
     result.add_output_path([CONF_ESPHOME], CONF_ESPHOME)
     try:
@@ -415,6 +625,7 @@ def validate_config(config):
     result.remove_output_path([CONF_ESPHOME], CONF_ESPHOME)
 
     # 3. Load components.
+    profiling.step(u'3. load components')
     # Load components (also AUTO_LOAD) and set output paths of result
     # Queue of items to load, FIFO
     load_queue = collections.deque()
@@ -503,6 +714,7 @@ def validate_config(config):
     # - Dependencies
     # - Conflicts
     # - Supported ESP Platform
+    profiling.step(u'4. component metadata')
 
     # List of items to proceed to next stage
     validate_queue = []  # type: List[Tuple[ConfigPath, ConfigType, ComponentManifest]]
@@ -550,33 +762,55 @@ def validate_config(config):
         validate_queue.append((path, conf, comp))
 
     # 5. Validate configuration schema
+    profiling.step(u'5. schemas')
+    if schema_cache is not None:
+        schema_cache.begin(config)
     for path, conf, comp in validate_queue:
         if comp.config_schema is None:
             continue
-        with result.catch_error(path):
-            if comp.is_platform:
-                # Remove 'platform' key for validation
-                input_conf = OrderedDict(conf)
-                platform_val = input_conf.pop('platform')
-                validated = comp.config_schema(input_conf)
-                # Ensure result is OrderedDict so we can call move_to_end
-                if not isinstance(validated, OrderedDict):
-                    validated = OrderedDict(validated)
-                validated['platform'] = platform_val
-                validated.move_to_end('platform', last=False)
-                result.set_by_path(path, validated)
-            else:
-                validated = comp.config_schema(conf)
-                result.set_by_path(path, validated)
+        name = path[0]
+        if comp.is_platform:
+            name = u'{}.{}'.format(name, conf[CONF_PLATFORM])
+        with profiling.schema_span(name):
+            _validate_schema(result, path, conf, comp, schema_cache)
 
     # 6. If no validation errors, check IDs
-    if not result.errors:
+    if id_pass and not result.errors:
+        profiling.step(u'6. IDs')
         # Only parse IDs if no validation error. Otherwise
         # user gets confusing messages
         do_id_pass(result)
     return result
 
 
+def _validate_schema(result, path, conf, comp, schema_cache):
+    # type: (Config, ConfigPath, ConfigType, ComponentManifest, Optional[SchemaCache]) -> None
+    if schema_cache is not None:
+        if schema_cache.restore(result, path, conf, comp):
+            return
+        schema_cache.validated += 1
+    validated = None
+    num_errors = len(result.errors)
+    file_checks = cv.file_check_count()
+    with result.catch_error(path):
+        if comp.is_platform:
+            # Remove 'platform' key for validation
+            input_conf = OrderedDict(conf)
+            platform_val = input_conf.pop('platform')
+            validated = comp.config_schema(input_conf)
+            # Ensure result is OrderedDict so we can call move_to_end
+            if not isinstance(validated, OrderedDict):
+                validated = OrderedDict(validated)
+            validated['platform'] = platform_val
+            validated.move_to_end('platform', last=False)
+            result.set_by_path(path, validated)
+        else:
+            validated = comp.config_schema(conf)
+            result.set_by_path(path, validated)
+    if schema_cache is not None and cv.file_check_count() == file_checks:
+        schema_cache.store(path, conf, comp, validated, result.errors[num_errors:])
+
+
 def _nested_getitem(data, path):
     for item_index in path:
         try:
@@ -645,31 +879,96 @@ class InvalidYAMLError(EsphomeError):
         self.base_exc = base_exc
 
 
-def _load_config():
-    try:
-        config = yaml_util.load_yaml(CORE.config_path)
-    except EsphomeError as e:
-        raise InvalidYAMLError(e)
-    CORE.raw_config = config
+def _custom_component_files():
+    files = []
+    for manif in _COMPONENT_CACHE.values():
+        if manif is None or manif.base_components_path != CUSTOM_COMPONENTS_PATH:
+            continue
+        files.append(manif.module_file)
+    return files
 
-    try:
-        result = validate_config(config)
-    except EsphomeError:
-        raise
-    except Exception:
-        _LOGGER.error(u"Unexpected exception while reading configuration:")
-        raise
 
+def _load_config(use_cache, schema_cache):
+    from esphome import config_cache, device_profile
+
+    if use_cache:
+        with profiling.span(u'config cache'):
+            cached = config_cache.load()
+        if cached is not None:
+            return cached
+
+    with config_cache.record_warnings() as warnings:
+        try:
+            with profiling.span(u'load_yaml'):
+                config = yaml_util.load_yaml(CORE.config_path)
+        except EsphomeError as e:
+            raise InvalidYAMLError(e)
+        CORE.raw_config = config
+
+        try:
+            result = validate_config(config, schema_cache)
+        except EsphomeError:
+            raise
+        except Exception:
+            _LOGGER.error(u"Unexpected exception while reading configuration:")
+            raise
+    component_index.save()
+
+    if use_cache and not result.errors:
+        config_cache.save(result, _custom_component_files(), warnings)
+        # Also keeps the MQTT topics the dashboard tracks up to date after compile and run
+        device_profile.save(device_profile.profile_config(result))
     return result
 
 
-def load_config():
+def load_config(use_cache=False, schema_cache=None):
     try:
-        return _load_config()
+        return _load_config(use_cache, schema_cache)
     except vol.Invalid as err:
         raise EsphomeError("Error while parsing config: {}".format(err))
 
 
+def _is_automation(key, value):
+    if text_type(key).startswith(u'on_'):
+        return True
+    if isinstance(value, dict):
+        return CONF_THEN in value
+    if isinstance(value, list):
+        return any(isinstance(x, dict) and CONF_THEN in x for x in value)
+    return False
+
+
+def load_partial_config(domains):  # type: (List[str]) -> Config
+    """Validate only the esphome: section and the given components of the configuration.
+
+    The automations of the components are left out too, as their actions can belong
+    to any other component. The IDs are not checked, as they may refer to components
+    that are left out.
+    """
+    try:
+        with profiling.span(u'load_yaml'):
+            config = yaml_util.load_yaml(CORE.config_path)
+    except EsphomeError as e:
+        raise InvalidYAMLError(e)
+    CORE.raw_config = config
+
+    partial = OrderedDict()
+    for key, value in config.items():
+        if key == CONF_SUBSTITUTIONS:
+            partial[key] = value
+        elif key in [CONF_ESPHOME, 'esphomeyaml'] or key in domains:
+            if isinstance(value, dict):
+                value = OrderedDict((k, v) for k, v in value.items()
+                                    if not _is_automation(k, v))
+            partial[key] = value
+    try:
+        result = validate_config(partial, id_pass=False)
+    except vol.Invalid as err:
+        raise EsphomeError("Error while parsing config: {}".format(err))
+    component_index.save()
+    return result
+
+
 def line_info(obj, highlight=True):
     """Display line config source."""
     if not highlight:
@@ -802,10 +1101,10 @@ def strip_default_ids(config):
     return config
 
 
-def read_config():
+def read_config(use_cache=False):
     _LOGGER.info("Reading configuration %s...", CORE.config_path)
     try:
-        res = load_config()
+        res = load_config(use_cache)
     except EsphomeError as err:
         _LOGGER.error(u"Error while reading config: %s", err)
         return None
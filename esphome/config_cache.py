@@ -0,0 +1,193 @@
+"""Persistent cache of validated configurations.
+
+Validating a configuration imports every component and runs all schemas, which is
+by far the slowest part of commands like `logs` or `upload`. The result of a
+successful validation is stored in .esphome/ next to the configuration, together
+with the parts of CORE that validation fills in. The entry is keyed by the contents
+of every YAML file that was read (the main file, includes and secrets), the listing
+of !include_dir_* directories, the used environment variables, the custom component
+modules, the ESPHome version and the timezone of the host (time: stores the detected
+one), so any change to one of them invalidates it.
+
+The warnings logged while the configuration was loaded and validated are stored
+with it and logged again on a cache hit.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import sys
+from contextlib import contextmanager
+
+import tzlocal
+
+from esphome import const, yaml_util
+from esphome.core import CORE
+from esphome.helpers import mkdir_p
+from esphome.py_compat import encode_text, text_type
+
+# pylint: disable=unused-import, wrong-import-order
+from typing import Optional  # noqa
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bump when the layout of a cache entry changes
+CACHE_VERSION = 3
+
+
+class _WarningRecorder(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.warnings = []
+
+    def emit(self, record):
+        self.warnings.append((record.name, record.levelno, record.getMessage()))
+
+
+@contextmanager
+def record_warnings():
+    """Collect the warnings esphome logs in the with block, yields the list of them."""
+    recorder = _WarningRecorder()
+    logger = logging.getLogger('esphome')
+    logger.addHandler(recorder)
+    try:
+        yield recorder.warnings
+    finally:
+        logger.removeHandler(recorder)
+
+
+def config_cache_path():  # type: () -> str
+    return CORE.relative_config_path('.esphome', '{}.config.cache'.format(CORE.config_filename))
+
+
+def _hash_file(path):  # type: (str) -> Optional[str]
+    try:
+        with open(path, 'rb') as f_handle:
+            return hashlib.sha256(f_handle.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def _local_timezone():  # type: () -> Optional[str]
+    try:
+        return text_type(tzlocal.get_localzone())
+    except Exception:  # pylint: disable=broad-except
+        # time: falls back to UTC then
+        return None
+
+
+def compute_key(files, directories, env_vars):
+    """Compute the cache key for the given dependencies in their current state."""
+    hasher = hashlib.sha256()
+
+    def update(*parts):
+        for part in parts:
+            hasher.update(encode_text(text_type(part)))
+            hasher.update(b'\0')
+
+    update(CACHE_VERSION, const.__version__, sys.version, os.path.abspath(CORE.config_path))
+    # The default of time: timezone is detected from the host
+    update(os.environ.get('TZ'), _local_timezone(), _hash_file('/etc/localtime'))
+    for path in files:
+        update(path, _hash_file(path))
+    for directory in directories:
+        update(directory, *sorted(yaml_util.list_include_dir(directory)))
+    for name, value in sorted(env_vars.items()):
+        update(name, value)
+    return hasher.hexdigest()
+
+
+def load():
+    """Load the cached validation result of the current configuration.
+
+    On a hit this also restores the CORE metadata and secrets of the cached
+    configuration. Returns None if there is no valid cache entry.
+    """
+    path = config_cache_path()
+    if not os.path.isfile(path):
+        _LOGGER.info("Configuration cache miss: no cache entry")
+        return None
+    try:
+        with open(path, 'rb') as f_handle:
+            header = pickle.load(f_handle)
+            if header.get('version') != CACHE_VERSION:
+                _LOGGER.info("Configuration cache miss: cache format changed")
+                return None
+            key = compute_key(header['files'], header['directories'], header['env_vars'])
+            if key != header['key']:
+                _LOGGER.info("Configuration cache miss: configuration changed")
+                return None
+            data = pickle.load(f_handle)
+    except Exception as err:  # pylint: disable=broad-except
+        _LOGGER.info("Configuration cache miss: could not read cache entry (%s)", err)
+        return None
+
+    core_data = data['core']
+    CORE.name = core_data['name']
+    CORE.esp_platform = core_data['esp_platform']
+    CORE.board = core_data['board']
+    CORE.build_path = core_data['build_path']
+    CORE.loaded_integrations = core_data['loaded_integrations']
+    CORE.component_ids = core_data['component_ids']
+    CORE.raw_config = data['raw_config']
+    # pylint: disable=protected-access
+    yaml_util._SECRET_VALUES.clear()
+    yaml_util._SECRET_VALUES.update(data['secret_values'])
+    _LOGGER.info("Configuration cache hit, skipping validation")
+    for name, level, message in data['warnings']:
+        logging.getLogger(name).log(level, u"%s", message)
+    return data['config']
+
+
+def save(result, extra_files, warnings):
+    """Store the validation result of the current configuration.
+
+    :param result: The validated configuration, must not contain errors.
+    :param extra_files: Other files the validation depends on (custom components).
+    :param warnings: The warnings logged during validation, see record_warnings.
+    """
+    files, directories, env_vars = yaml_util.loaded_dependencies()
+    files = sorted(set(files) | set(extra_files))
+    header = {
+        'version': CACHE_VERSION,
+        'files': files,
+        'directories': directories,
+        'env_vars': env_vars,
+        'key': compute_key(files, directories, env_vars),
+    }
+    data = {
+        'config': result,
+        'raw_config': CORE.raw_config,
+        'core': {
+            'name': CORE.name,
+            'esp_platform': CORE.esp_platform,
+            'board': CORE.board,
+            'build_path': CORE.build_path,
+            'loaded_integrations': CORE.loaded_integrations,
+            'component_ids': CORE.component_ids,
+        },
+        # pylint: disable=protected-access
+        'secret_values': dict(yaml_util._SECRET_VALUES),
+        'warnings': warnings,
+    }
+    path = config_cache_path()
+    tmp_path = path + '.tmp'
+    try:
+        mkdir_p(os.path.dirname(path))
+        with open(tmp_path, 'wb') as f_handle:
+            pickle.dump(header, f_handle, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, f_handle, pickle.HIGHEST_PROTOCOL)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except Exception as err:  # pylint: disable=broad-except
+        # Not being able to cache the config is never fatal
+        _LOGGER.warning("Could not write configuration cache: %s", err)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def clear():
+    path = config_cache_path()
+    if os.path.isfile(path):
+        os.remove(path)
@@ -8,10 +8,16 @@ from esphome.helpers import read_file
 from esphome.py_compat import safe_input
 
 
+def is_editor_file(path):
+    # type: (basestring) -> bool
+    """Return whether the content of path is read from the editor instead of the disk."""
+    return CORE.vscode and (not CORE.ace or
+                            os.path.abspath(path) == os.path.abspath(CORE.config_path))
+
+
 def read_config_file(path):
     # type: (basestring) -> unicode
-    if CORE.vscode and (not CORE.ace or
-                        os.path.abspath(path) == os.path.abspath(CORE.config_path)):
+    if is_editor_file(path):
         print(json.dumps({
             'type': 'read_file',
             'path': path,
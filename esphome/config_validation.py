@@ -190,7 +190,9 @@ def ensure_list(*validators):
 
     None and empty dictionaries are converted to empty lists.
     """
-    user = All(*validators)
+    # Plain dicts would be compiled by voluptuous' Schema, which inserts defaults in
+    # random order
+    user = All(*[Schema(x) if isinstance(x, dict) else x for x in validators])
 
     def validator(value):
         check_not_templatable(value)
@@ -1025,11 +1027,23 @@ def dimensions(value):
     return dimensions([match.group(1), match.group(2)])
 
 
+# Number of file system checks done by directory and file_. Their result can change
+# without the configuration changing, the incremental validation of the editor
+# server uses this to never reuse schema results that depend on one.
+_FILE_CHECKS = 0
+
+
+def file_check_count():
+    return _FILE_CHECKS
+
+
 def directory(value):
     import json
     from esphome.py_compat import safe_input
+    global _FILE_CHECKS  # pylint: disable=global-statement
     value = string(value)
     path = CORE.relative_config_path(value)
+    _FILE_CHECKS += 1
 
     if CORE.vscode and (not CORE.ace or
                         os.path.abspath(path) == os.path.abspath(CORE.config_path)):
@@ -1056,8 +1070,10 @@ def directory(value):
 def file_(value):
     import json
     from esphome.py_compat import safe_input
+    global _FILE_CHECKS  # pylint: disable=global-statement
     value = string(value)
     path = CORE.relative_config_path(value)
+    _FILE_CHECKS += 1
 
     if CORE.vscode and (not CORE.ace or
                         os.path.abspath(path) == os.path.abspath(CORE.config_path)):
@@ -8,11 +8,12 @@ import os
 import re
 
 # pylint: disable=unused-import, wrong-import-order
-from typing import Any, Dict, List  # noqa
+from typing import Any, Dict, List, Optional  # noqa
 
 from esphome.const import CONF_ARDUINO_VERSION, SOURCE_FILE_EXTENSIONS, \
     CONF_COMMENT, CONF_ESPHOME, CONF_USE_ADDRESS, CONF_WIFI
 from esphome.helpers import ensure_unique_string, is_hassio
+from esphome.profiling import get_profiler
 from esphome.py_compat import IS_PY2, integer_types, text_type, string_types
 from esphome.util import OrderedDict
 
@@ -273,14 +274,18 @@ class ID(object):
         self.is_declaration = is_declaration
         self.type = type  # type: Optional[MockObjClass]
 
+    @property
+    def default_name(self):
+        """The name an automatically named ID is based on, derived from its type."""
+        base = str(self.type).replace('::', '_').lower()
+        return ''.join(c for c in base if c.isalnum() or c == '_')
+
     def resolve(self, registered_ids):
         from esphome.config_validation import RESERVED_IDS
 
         if self.id is None:
-            base = str(self.type).replace('::', '_').lower()
-            name = ''.join(c for c in base if c.isalnum() or c == '_')
             used = set(registered_ids) | set(RESERVED_IDS)
-            self.id = ensure_unique_string(name, used)
+            self.id = ensure_unique_string(self.default_name, used)
         return self.id
 
     def __str__(self):
@@ -323,6 +328,19 @@ class DocumentLocation(object):
     def __str__(self):
         return u'{} {}:{}'.format(self.document, self.line, self.column)
 
+    @property
+    def as_tuple(self):
+        return self.document, self.line, self.column
+
+    def __hash__(self):
+        return hash(self.as_tuple)
+
+    def __eq__(self, other):
+        return isinstance(self, type(other)) and self.as_tuple == other.as_tuple
+
+    def __ne__(self, other):
+        return not self == other
+
 
 class DocumentRange(object):
     def __init__(self, start_mark, end_mark):
@@ -340,6 +358,16 @@ class DocumentRange(object):
     def __str__(self):
         return u'[{} - {}]'.format(self.start_mark, self.end_mark)
 
+    def __hash__(self):
+        return hash((self.start_mark, self.end_mark))
+
+    def __eq__(self, other):
+        return isinstance(self, type(other)) and self.start_mark == other.start_mark and \
+            self.end_mark == other.end_mark
+
+    def __ne__(self, other):
+        return not self == other
+
 
 class Define(object):
     def __init__(self, name, value=None):
@@ -488,12 +516,27 @@ class EsphomeCore(object):
         self.pending_tasks = []
         # Task counter for pending tasks
         self.task_counter = 0
+        # Tasks that are blocked on an ID that has not been registered yet, indexed by that ID.
+        # Each item is a list of pending task tuples, they're re-queued by register_variable.
+        self.waiting_tasks = {}  # type: Dict[ID, List[Any]]
+        # The ID the currently running task is blocked on (set by get_variable)
+        self.awaited_id = None  # type: Optional[ID]
+        # The name of the component each to_code task generates code for
+        self.task_units = {}  # type: Dict[Any, str]
+        # The component of the currently running task, None outside of to_code tasks
+        self.current_unit = None  # type: Optional[str]
         # The variable cache, for each ID this holds a MockObj of the variable obj
         self.variables = {}  # type: Dict[str, MockObj]
         # A list of statements that go in the main setup() block
         self.main_statements = []  # type: List[Statement]
+        # For each statement of main_statements the component it was generated by, the
+        # statements of each component are written to their own source file
+        self.main_statement_units = []  # type: List[Optional[str]]
         # A list of statements to insert in the global block (includes and global variables)
         self.global_statements = []  # type: List[Statement]
+        # A list of statements defining large constant arrays, these are written to a
+        # separate source file so that main.cpp stays small
+        self.binary_blob_statements = []  # type: List[Statement]
         # A set of platformio libraries to add to the project
         self.libraries = []  # type: List[Library]
         # A set of build flags to set in the platformio project
@@ -521,9 +564,15 @@ class EsphomeCore(object):
         self.config = None
         self.pending_tasks = []
         self.task_counter = 0
+        self.waiting_tasks = {}
+        self.awaited_id = None
+        self.task_units = {}
+        self.current_unit = None
         self.variables = {}
         self.main_statements = []
+        self.main_statement_units = []
         self.global_statements = []
+        self.binary_blob_statements = []
         self.libraries = []
         self.build_flags = set()
         self.defines = set()
@@ -612,25 +661,43 @@ class EsphomeCore(object):
         return task
 
     def flush_tasks(self):
-        i = 0
+        profiler = get_profiler()
         while self.pending_tasks:
-            i += 1
-            if i > 1000000:
-                raise EsphomeError("Circular dependency detected!")
-
             inv_priority, num, task = heapq.heappop(self.pending_tasks)
             priority = -inv_priority
             _LOGGER.debug("Running %s (num %s)", task, num)
+            self.awaited_id = None
+            self.current_unit = self.task_units.get(task)
             try:
-                next(task)
-                # Decrease priority over time, so that if this task is blocked
-                # due to a dependency others will clear the dependency
-                # This could be improved with a less naive approach
-                priority -= 1
-                item = (-priority, num, task)
-                heapq.heappush(self.pending_tasks, item)
+                if profiler is None:
+                    next(task)
+                else:
+                    profiler.run_task_step(self, task)
             except StopIteration:
                 _LOGGER.debug(" -> finished")
+                continue
+            if profiler is not None:
+                profiler.task_requeued(self, task, waiting=self.awaited_id is not None)
+            # Decrease priority over time, so that other tasks with the same
+            # priority get a chance to run in between steps of this task
+            item = (-(priority - 1), num, task)
+            if self.awaited_id is None:
+                heapq.heappush(self.pending_tasks, item)
+                continue
+            # Task is blocked on an ID, park it until register_variable wakes it up
+            _LOGGER.debug(" -> waiting for %s", self.awaited_id)
+            self.waiting_tasks.setdefault(self.awaited_id, []).append(item)
+        self.awaited_id = None
+        self.current_unit = None
+
+        if self.waiting_tasks:
+            # Nothing is runnable anymore but some tasks are still waiting, the IDs
+            # they're waiting for can only be registered by one of the blocked tasks.
+            for id, items in self.waiting_tasks.items():
+                names = u', '.join(u"'{}'".format(task.__name__) for _, _, task in items)
+                _LOGGER.error(u"ID '%s' is required by %s but was never registered.", id, names)
+            ids = u', '.join(u"'{}'".format(id) for id in self.waiting_tasks)
+            raise EsphomeError(u"Circular dependency detected! Involved IDs: {}".format(ids))
 
         # Print not-awaited coroutines
         for obj in self.active_coroutines.values():
@@ -656,6 +723,7 @@ class EsphomeCore(object):
                              u"".format(expression, type(expression)))
 
         self.main_statements.append(expression)
+        self.main_statement_units.append(self.current_unit)
         _LOGGER.debug("Adding: %s", expression)
         return expression
 
@@ -671,6 +739,14 @@ class EsphomeCore(object):
         _LOGGER.debug("Adding global: %s", expression)
         return expression
 
+    def add_binary_blob(self, expression):
+        from esphome.cpp_generator import statement
+
+        _LOGGER.debug("Adding binary blob: %s", expression.name)
+        expression = statement(expression)
+        self.binary_blob_statements.append(expression)
+        return expression
+
     def add_library(self, library):
         if not isinstance(library, Library):
             raise ValueError(u"Library {} must be instance of Library, not {}"
@@ -721,6 +797,7 @@ class EsphomeCore(object):
                 yield self.variables[id]
                 return
             _LOGGER.debug("Waiting for variable %s (%r)", id, id)
+            self.awaited_id = id
             yield None
 
     def get_variable_with_full_id(self, id):
@@ -731,6 +808,7 @@ class EsphomeCore(object):
                         yield (k, v)
                         return
             _LOGGER.debug("Waiting for variable %s", id)
+            self.awaited_id = id
             yield None, None
 
     def register_variable(self, id, obj):
@@ -738,6 +816,9 @@ class EsphomeCore(object):
             raise EsphomeError("ID {} is already registered".format(id))
         _LOGGER.debug("Registered variable %s of type %s", id.id, id.type)
         self.variables[id] = obj
+        # Resume all tasks that were blocked on this ID
+        for item in self.waiting_tasks.pop(id, []):
+            heapq.heappush(self.pending_tasks, item)
 
     def has_id(self, id):
         return id in self.variables
@@ -764,6 +845,17 @@ class EsphomeCore(object):
             global_code.append(text)
         return u'\n'.join(global_code) + u'\n'
 
+    @property
+    def cpp_binary_blob_section(self):
+        from esphome.cpp_generator import statement
+
+        blob_code = []
+        for exp in self.binary_blob_statements:
+            text = text_type(statement(exp))
+            text = text.rstrip()
+            blob_code.append(text)
+        return u'\n'.join(blob_code) + u'\n'
+
 
 class AutoLoad(OrderedDict):
     pass
@@ -779,6 +871,18 @@ class EnumValue(object):
     def enum_value(self, value):
         setattr(self, '_enum_value', value)
 
+    def __reduce__(self):
+        # Enum value classes are created on the fly by cv.enum, so they can't be
+        # looked up by name when unpickling. Re-create them from the base type instead.
+        base = type(self).__bases__[0]
+        return _restore_enum_value, (base, base(self), self.__dict__)
+
+
+def _restore_enum_value(base, value, state):
+    value.__class__ = type(base.__name__ + 'Enum', (base, EnumValue), {})
+    value.__dict__.update(state)
+    return value
+
 
 CORE = EsphomeCore()
 
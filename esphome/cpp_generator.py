@@ -150,6 +150,66 @@ class ArrayInitializer(Expression):
         return cpp
 
 
+_HEX_BYTES = [u'0x{:02X}'.format(x) for x in range(256)]
+
+
+class ByteArrayInitializer(Expression):
+    """Array initializer for raw byte data, renders like an ArrayInitializer of HexInts.
+
+    The data is kept as a bytearray instead of one expression per element, which
+    makes building and rendering large arrays (fonts, images) much cheaper.
+    """
+    def __init__(self, data):  # type: (Union[bytes, bytearray]) -> None
+        super(ByteArrayInitializer, self).__init__()
+        self.data = bytearray(data)
+
+    def __str__(self):
+        if not self.data:
+            return u'{}'
+        hex_bytes = _HEX_BYTES
+        return u'{' + u', '.join([hex_bytes[x] for x in self.data]) + u'}'
+
+
+def _blob_char(value):
+    char = chr(value)
+    if 0x20 <= value < 0x7F and char not in u'"\\?':
+        return char
+    # Always use three digits, so a following digit can't become part of the escape
+    return u'\\{:03o}'.format(value)
+
+
+_BLOB_CHARS = [_blob_char(x) for x in range(256)]
+
+
+class BinaryBlob(Expression):
+    """Raw byte data for large constant arrays (fonts, images, ...).
+
+    Rendered as a string literal, which is much shorter than an initializer list
+    and cheaper for the compiler to parse. When used with progmem_array the array
+    is defined in a separate source file instead of main.cpp (see
+    CORE.binary_blob_statements).
+    """
+    BYTES_PER_LINE = 64
+
+    def __init__(self, data):  # type: (Union[bytes, bytearray]) -> None
+        super(BinaryBlob, self).__init__()
+        self.data = bytes(data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __str__(self):
+        data = bytearray(self.data)
+        if not data:
+            return u'""'
+        chars = _BLOB_CHARS
+        lines = []
+        for i in range(0, len(data), self.BYTES_PER_LINE):
+            lines.append(u'"' + u''.join([chars[x] for x in data[i:i + self.BYTES_PER_LINE]]) +
+                         u'"')
+        return u'\n    '.join(lines)
+
+
 class ParameterExpression(Expression):
     def __init__(self, type, id):
         super(ParameterExpression, self).__init__()
@@ -269,6 +329,8 @@ def safe_exp(
         return safe_exp(obj.enum_value)
     if isinstance(obj, bool):
         return BoolLiteral(obj)
+    if isinstance(obj, bytearray):
+        return ByteArrayInitializer(obj)
     if isinstance(obj, string_types):
         return StringLiteral(obj)
     if isinstance(obj, HexInt):
@@ -350,11 +412,25 @@ class ProgmemAssignmentExpression(AssignmentExpression):
         return u"static const {} {}[] PROGMEM = {}".format(type_, self.name, self.rhs)
 
 
+class BinaryBlobAssignmentExpression(AssignmentExpression):
+    def __init__(self, type, name, rhs, obj):
+        super(BinaryBlobAssignmentExpression, self).__init__(
+            type, '', name, rhs, obj
+        )
+
+    def __str__(self):
+        return u"extern const {} {}[] PROGMEM = {}".format(self.type, self.name, self.rhs)
+
+
 def progmem_array(id, rhs):
     rhs = safe_exp(rhs)
     obj = MockObj(id, u'.')
-    assignment = ProgmemAssignmentExpression(id.type, id, rhs, obj)
-    CORE.add(assignment)
+    if isinstance(rhs, BinaryBlob):
+        CORE.add_binary_blob(BinaryBlobAssignmentExpression(id.type, id, rhs, obj))
+        CORE.add_global(RawStatement(u"extern const {} {}[];".format(id.type, id)))
+    else:
+        assignment = ProgmemAssignmentExpression(id.type, id, rhs, obj)
+        CORE.add(assignment)
     CORE.register_variable(id, obj)
     return obj
 
@@ -667,6 +743,11 @@ class MockObj(Expression):
             next_op = u'->'
         return MockObj(u'{}[{}]'.format(self.base, item), next_op)
 
+    def __reduce__(self):
+        # Pickle through the constructor, __getattr__ would otherwise answer
+        # the attribute lookups pickle does on a not-yet-initialized object.
+        return MockObj, (self.base, self.op)
+
 
 class MockObjEnum(MockObj):
     def __init__(self, *args, **kwargs):
@@ -687,6 +768,16 @@ class MockObjEnum(MockObj):
     def __repr__(self):
         return u'MockObj<{}>'.format(text_type(self.base))
 
+    def __reduce__(self):
+        base = self.base
+        if self._is_class:
+            base = base[:-len('::' + self._enum)]
+        return _restore_mock_obj_enum, (self._enum, self._is_class, base, self.op)
+
+
+def _restore_mock_obj_enum(enum, is_class, base, op):
+    return MockObjEnum(enum=enum, is_class=is_class, base=base, op=op)
+
 
 class MockObjClass(MockObj):
     def __init__(self, *args, **kwargs):
@@ -700,11 +791,18 @@ class MockObjClass(MockObj):
             # pylint: disable=protected-access
             self._parents += paren._parents
 
+    @property
+    def type_names(self):  # type: () -> List[str]
+        """The C++ type names of this class and all its parents, see inherits_from."""
+        return [self.base] + [parent.base for parent in self._parents]
+
     def inherits_from(self, other):  # type: (MockObjClass) -> bool
-        if self == other:
+        # Compare by C++ type name so that unpickled classes (from the config cache)
+        # still match the ones declared in the component modules.
+        if self is other or self.base == other.base:
             return True
         for parent in self._parents:
-            if parent == other:
+            if parent is other or parent.base == other.base:
                 return True
         return False
 
@@ -720,3 +818,13 @@ class MockObjClass(MockObj):
 
     def __repr__(self):
         return u'MockObjClass<{}, parents={}>'.format(text_type(self.base), self._parents)
+
+    def __reduce__(self):
+        return _restore_mock_obj_class, (self.base, self.op, self._parents)
+
+
+def _restore_mock_obj_class(base, op, parents):
+    obj = MockObjClass(base, op, parents=())
+    # pylint: disable=protected-access
+    obj._parents = parents
+    return obj
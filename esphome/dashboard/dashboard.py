@@ -10,9 +10,11 @@ import json
 import logging
 import multiprocessing
 import os
+import re
 import shutil
 import subprocess
 import threading
+import time
 
 import tornado
 import tornado.concurrent
@@ -28,14 +30,15 @@ import tornado.websocket
 
 from esphome import const, util
 from esphome.__main__ import get_serial_ports
+from esphome.const import CONF_MQTT, CONF_TOPIC_PREFIX
 from esphome.helpers import mkdir_p, get_bool_env, run_system_command
-from esphome.py_compat import IS_PY2, decode_text, encode_text
+from esphome.py_compat import IS_PY2, decode_text, encode_text, text_type
 from esphome.storage_json import EsphomeStorageJSON, StorageJSON, \
     esphome_storage_path, ext_storage_path, trash_storage_path
 from esphome.util import shlex_quote
 
 # pylint: disable=unused-import, wrong-import-order
-from typing import Optional  # noqa
+from typing import List, Optional  # noqa
 
 from esphome.zeroconf import DashboardStatus, Zeroconf
 
@@ -50,6 +53,11 @@ class DashboardSettings(object):
         self.using_password = False
         self.on_hassio = False
         self.cookie_secret = None
+        self.mqtt_broker = ''
+        self.mqtt_port = 1883
+        self.mqtt_username = ''
+        self.mqtt_password = ''
+        self.status_interval = 5.0
 
     def parse_args(self, args):
         self.on_hassio = args.hassio
@@ -63,6 +71,16 @@ class DashboardSettings(object):
             else:
                 self.password_digest = hmac.new(password.encode()).digest()
         self.config_dir = args.configuration[0]
+        # (host, port) from esphome.__main__.mqtt_broker_address
+        self.mqtt_broker, port = args.mqtt_broker
+        if port is not None:
+            self.mqtt_port = port
+        self.mqtt_username = args.mqtt_username or \
+            os.getenv('ESPHOME_DASHBOARD_MQTT_USERNAME', '')
+        self.mqtt_password = args.mqtt_password or \
+            os.getenv('ESPHOME_DASHBOARD_MQTT_PASSWORD', '')
+        self.status_interval = args.status_interval or \
+            float(os.getenv('ESPHOME_DASHBOARD_STATUS_INTERVAL', '5'))
 
     @property
     def relative_url(self):
@@ -72,6 +90,10 @@ class DashboardSettings(object):
     def status_use_ping(self):
         return get_bool_env('ESPHOME_DASHBOARD_USE_PING')
 
+    @property
+    def status_use_mqtt(self):
+        return bool(self.mqtt_broker)
+
     @property
     def using_hassio_auth(self):
         if not self.on_hassio:
@@ -305,7 +327,8 @@ class EsphomeVscodeHandler(EsphomeCommandWebSocket):
 
 class EsphomeAceEditorHandler(EsphomeCommandWebSocket):
     def build_command(self, json_message):
-        return ["esphome", "--dashboard", "-q", settings.config_dir, "vscode", "--ace"]
+        return ["esphome", "--dashboard", "-q", settings.config_dir, "vscode", "--ace",
+                "--incremental"]
 
 
 class EsphomeUpdateAllHandler(EsphomeCommandWebSocket):
@@ -366,9 +389,55 @@ class DownloadBinaryRequestHandler(BaseHandler):
         self.finish()
 
 
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+def _dir_changed(stamp, old_stamp):
+    if stamp != old_stamp:
+        return True
+    # Changes within the resolution of the modification time can't be told apart
+    return stamp is not None and time.time() - stamp[0] < 2
+
+
+class DashboardEntries(object):
+    """The dashboard entries of the config dir, kept in memory.
+
+    The config dir is only listed again when its modification time changed. The
+    storage and profile files are written by renaming a temporary file into
+    .esphome/, so the entries only check their own files for changes when the
+    modification time of .esphome/ changed. The handlers and the status thread
+    share one instance.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._dir_stamp = None
+        self._storage_dir_stamp = None
+        self._entries = {}
+
+    def all(self):  # type: () -> List[DashboardEntry]
+        with self.lock:
+            dir_stamp = _file_stamp(settings.config_dir)
+            refresh = _dir_changed(dir_stamp, self._dir_stamp)
+            if refresh:
+                self._dir_stamp = dir_stamp
+                self._entries = {path: self._entries.get(path) or DashboardEntry(path)
+                                 for path in settings.list_yaml_files()}
+            entries = [self._entries[path] for path in sorted(self._entries)]
+            storage_dir_stamp = _file_stamp(settings.rel_path('.esphome'))
+            if refresh or _dir_changed(storage_dir_stamp, self._storage_dir_stamp):
+                self._storage_dir_stamp = storage_dir_stamp
+                for entry in entries:
+                    entry.refresh()
+            return entries
+
+
 def _list_dashboard_entries():
-    files = settings.list_yaml_files()
-    return [DashboardEntry(file) for file in files]
+    return DASHBOARD_ENTRIES.all()
 
 
 class DashboardEntry(object):
@@ -376,18 +445,53 @@ class DashboardEntry(object):
         self.path = path
         self._storage = None
         self._loaded_storage = False
+        self._storage_stamp = None
+        self._profile_config = None
+        self._loaded_profile_config = False
+        self._profile_stamp = None
 
     @property
     def filename(self):
         return os.path.basename(self.path)
 
+    @property
+    def storage_path(self):
+        return ext_storage_path(settings.config_dir, self.filename)
+
+    @property
+    def profile_path(self):
+        from esphome.device_profile import ext_profile_path
+
+        return ext_profile_path(settings.config_dir, self.filename)
+
+    def refresh(self):
+        """Forget the loaded storage and profile if their files changed since."""
+        stamp = _file_stamp(self.storage_path)
+        if stamp != self._storage_stamp:
+            self._storage_stamp = stamp
+            self._loaded_storage = False
+        stamp = _file_stamp(self.profile_path)
+        if stamp != self._profile_stamp:
+            self._profile_stamp = stamp
+            self._loaded_profile_config = False
+
     @property
     def storage(self):  # type: () -> Optional[StorageJSON]
         if not self._loaded_storage:
-            self._storage = StorageJSON.load(ext_storage_path(settings.config_dir, self.filename))
+            self._storage = StorageJSON.load(self.storage_path)
             self._loaded_storage = True
         return self._storage
 
+    @property
+    def profile_config(self):
+        """The config of the device profile (see esphome.device_profile), None if unknown."""
+        if not self._loaded_profile_config:
+            from esphome.device_profile import load_stored_config
+
+            self._profile_config = load_stored_config(self.profile_path)
+            self._loaded_profile_config = True
+        return self._profile_config
+
     @property
     def address(self):
         if self.storage is None:
@@ -440,6 +544,19 @@ class DashboardEntry(object):
             return []
         return self.storage.loaded_integrations
 
+    def as_dict(self):
+        return {
+            'filename': self.filename,
+            'name': self.name,
+            'comment': self.comment,
+            'address': self.address,
+            'esp_platform': self.esp_platform,
+            'board': self.board,
+            'esphome_version': self.update_old or None,
+            'update_available': self.update_available,
+            'loaded_integrations': self.loaded_integrations,
+        }
+
 
 class MainRequestHandler(BaseHandler):
     @authenticated
@@ -451,50 +568,185 @@ class MainRequestHandler(BaseHandler):
                     **template_args())
 
 
+class DeviceStatus(object):
+    """The status of all devices, as found by the status thread.
+
+    Each device has its online status (None if unknown), the time it was last seen
+    online and the round trip time in ms of the last probe (None if the status backend
+    doesn't measure it). Changes are pushed to the status WebSocket clients, a change of
+    the RTT only once it's significant.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = {}
+        self.listeners = set()
+        self.io_loop = None
+        self.last_poll = 0
+
+    def set_keys(self, keys):
+        """Add the missing devices of keys with an unknown status, remove all others."""
+        with self.lock:
+            added = {key: self.new_result(None) for key in keys if key not in self.results}
+            self.results = {key: self.results.get(key) or added[key] for key in keys}
+        self._notify(added)
+
+    @staticmethod
+    def new_result(online, last_seen=None, rtt=None):
+        return {'online': online, 'last_seen': last_seen, 'rtt': rtt}
+
+    def update(self, key, online, rtt=None):
+        now = time.time()
+        with self.lock:
+            old = self.results.get(key) or self.new_result(None)
+            new = self.new_result(online, now if online else old['last_seen'],
+                                  rtt if online else None)
+            self.results[key] = new
+            if old['online'] == online and not _rtt_changed(old['rtt'], new['rtt']):
+                # Keep the RTT that was pushed to compare against it
+                new['rtt'] = old['rtt']
+                return
+        self._notify({key: new})
+
+    def as_dict(self):
+        with self.lock:
+            return {key: dict(result) for key, result in self.results.items()}
+
+    def online_status(self):
+        with self.lock:
+            return {key: result['online'] for key, result in self.results.items()}
+
+    def poll(self):
+        """Register that the status was polled through /ping."""
+        self.last_poll = time.time()
+
+    def has_viewers(self):
+        if self.listeners:
+            return True
+        # Polling clients count as viewers for some sweeps after their last poll
+        return time.time() - self.last_poll < 3 * settings.status_interval
+
+    def add_listener(self, listener):
+        self.listeners.add(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.discard(listener)
+
+    def _notify(self, changes):
+        if not changes or self.io_loop is None:
+            return
+        changes = {key: dict(result) for key, result in changes.items()}
+        # Called from the status threads, send from the IOLoop
+        self.io_loop.add_callback(self._send, changes)
+
+    def _send(self, changes):
+        for listener in list(self.listeners):
+            listener.send_status(changes)
+
+
+def _rtt_changed(old, new):
+    if old is None or new is None:
+        return old != new
+    return abs(new - old) > max(5.0, 0.25 * old)
+
+
+def _wait_for_sweep():
+    """Wait until the status thread should sweep again.
+
+    Sweeps run at a fixed cadence, but only while somebody has the dashboard open.
+    """
+    STOP_EVENT.wait(settings.status_interval)
+    while not STOP_EVENT.is_set() and not DEVICE_STATUS.has_viewers():
+        PING_REQUEST.wait()
+        PING_REQUEST.clear()
+
+
 def _ping_func(filename, address):
     if os.name == 'nt':
         command = ['ping', '-n', '1', address]
     else:
         command = ['ping', '-c', '1', address]
-    rc, _, _ = run_system_command(*command)
-    return filename, rc == 0
+    rc, stdout, _ = run_system_command(*command)
+    match = PING_RTT_RE.search(decode_text(stdout))
+    rtt = float(match.group(1)) if match is not None else None
+    return filename, rc == 0, rtt
 
 
 class MDNSStatusThread(threading.Thread):
     def run(self):
-        zc = Zeroconf()
-
         def on_update(dat):
             for key, b in dat.items():
-                PING_RESULT[key] = b
+                DEVICE_STATUS.update(key, b)
 
-        stat = DashboardStatus(zc, on_update)
+        if IS_PY2:
+            zc = Zeroconf()
+            stat = DashboardStatus(zc, on_update)
+        else:
+            from esphome import zeroconf_async
+
+            zc = None
+            stat = zeroconf_async.DashboardStatus(zeroconf_async.get_engine(), on_update)
         stat.start()
         while not STOP_EVENT.is_set():
             entries = _list_dashboard_entries()
+            DEVICE_STATUS.set_keys([entry.filename for entry in entries])
             stat.request_query({entry.filename: entry.name + '.local.' for entry in entries})
 
-            PING_REQUEST.wait()
-            PING_REQUEST.clear()
+            _wait_for_sweep()
+        stat.stop()
+        if zc is not None:
+            stat.join()
+            zc.close()
+
+
+def _mqtt_status_messages(entry):
+    from esphome import mqtt
+
+    config = entry.profile_config
+    if config is None:
+        # Not known yet if the device uses MQTT, try the default topics
+        return mqtt.get_status_messages({CONF_TOPIC_PREFIX: entry.name})
+    if CONF_MQTT not in config:
+        return []
+    return mqtt.get_status_messages(config[CONF_MQTT])
+
+
+class MqttStatusThread(threading.Thread):
+    def run(self):
+        from esphome import mqtt
+
+        def on_update(dat):
+            for key, b in dat.items():
+                DEVICE_STATUS.update(key, b)
+
+        stat = mqtt.DashboardStatus(settings.mqtt_broker, settings.mqtt_port, on_update,
+                                    settings.mqtt_username, settings.mqtt_password)
+        stat.start()
+        while not STOP_EVENT.is_set():
+            entries = _list_dashboard_entries()
+            messages = {entry.filename: _mqtt_status_messages(entry) for entry in entries}
+            DEVICE_STATUS.set_keys(list(messages))
+            stat.request_query(messages)
+            # The broker connection confirms the last status, refresh when they were seen
+            for key, online in dict(stat.status).items():
+                DEVICE_STATUS.update(key, online)
+
+            _wait_for_sweep()
         stat.stop()
-        stat.join()
-        zc.close()
 
 
 class PingStatusThread(threading.Thread):
     def run(self):
         pool = multiprocessing.Pool(processes=8)
         while not STOP_EVENT.is_set():
-            # Only do pings if somebody has the dashboard open
-
             def callback(ret):
-                PING_RESULT[ret[0]] = ret[1]
+                DEVICE_STATUS.update(ret[0], ret[1], ret[2])
 
             entries = _list_dashboard_entries()
+            DEVICE_STATUS.set_keys([entry.filename for entry in entries])
             queue = collections.deque()
             for entry in entries:
                 if entry.address is None:
-                    PING_RESULT[entry.filename] = None
+                    DEVICE_STATUS.update(entry.filename, None)
                     continue
 
                 result = pool.apply_async(_ping_func, (entry.filename, entry.address),
@@ -519,15 +771,77 @@ class PingStatusThread(threading.Thread):
                     pool.terminate()
                     return
 
-            PING_REQUEST.wait()
-            PING_REQUEST.clear()
+            _wait_for_sweep()
+
+
+def _matches_filters(device, filters):
+    for key, values in filters.items():
+        if key not in device:
+            return False
+        value = device[key]
+        if isinstance(value, list):
+            if not all(x in value for x in values):
+                return False
+        elif isinstance(value, bool) or value is None:
+            if json.dumps(value) not in values:
+                return False
+        elif text_type(value) not in values:
+            return False
+    return True
+
+
+class DevicesRequestHandler(BaseHandler):
+    """List the devices of the dashboard as JSON, with their current status.
+
+    Query arguments filter the list: list fields must contain all given values, all
+    others must equal one of them. For example ?online=true&loaded_integrations=mqtt
+    """
+    @authenticated
+    def get(self):
+        filters = {key: [decode_text(x) for x in values]
+                   for key, values in self.request.arguments.items()}
+        status = DEVICE_STATUS.as_dict()
+        devices = []
+        for entry in _list_dashboard_entries():
+            device = entry.as_dict()
+            device.update(status.get(entry.filename) or DeviceStatus.new_result(None))
+            if _matches_filters(device, filters):
+                devices.append(device)
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(devices))
 
 
 class PingRequestHandler(BaseHandler):
     @authenticated
     def get(self):
+        # Only wakes up an idle status thread, polling doesn't cause extra sweeps
+        DEVICE_STATUS.poll()
+        PING_REQUEST.set()
+        self.write(json.dumps(DEVICE_STATUS.online_status()))
+
+
+# pylint: disable=abstract-method
+class StatusWebSocket(tornado.websocket.WebSocketHandler):
+    """Send the status of all devices on connect, and afterwards only the changes."""
+    def open(self):
+        if not is_authenticated(self):
+            self.close()
+            return
+        DEVICE_STATUS.add_listener(self)
         PING_REQUEST.set()
-        self.write(json.dumps(PING_RESULT))
+        self.send_status(DEVICE_STATUS.as_dict())
+
+    def send_status(self, changes):
+        try:
+            self.write_message(json.dumps(changes))
+        except tornado.websocket.WebSocketClosedError:
+            DEVICE_STATUS.remove_listener(self)
+
+    def on_message(self, message):
+        pass
+
+    def on_close(self):
+        DEVICE_STATUS.remove_listener(self)
 
 
 def is_allowed(configuration):
@@ -586,9 +900,11 @@ class UndoDeleteRequestHandler(BaseHandler):
         shutil.move(os.path.join(trash_path, configuration), config_file)
 
 
-PING_RESULT = {}  # type: dict
+DEVICE_STATUS = DeviceStatus()
+DASHBOARD_ENTRIES = DashboardEntries()
 STOP_EVENT = threading.Event()
 PING_REQUEST = threading.Event()
+PING_RTT_RE = re.compile(r'time[=<]\s*([\d.]+)\s*ms')
 
 
 class LoginHandler(BaseHandler):
@@ -715,6 +1031,8 @@ def make_app(debug=False):
         (rel + "download.bin", DownloadBinaryRequestHandler),
         (rel + "serial-ports", SerialPortRequestHandler),
         (rel + "ping", PingRequestHandler),
+        (rel + "status", StatusWebSocket),
+        (rel + "devices", DevicesRequestHandler),
         (rel + "delete", DeleteRequestHandler),
         (rel + "undo-delete", UndoDeleteRequestHandler),
         (rel + "wizard.html", WizardRequestHandler),
@@ -756,7 +1074,10 @@ def start_web_server(args):
 
             webbrowser.open('localhost:{}'.format(args.port))
 
-    if settings.status_use_ping:
+    DEVICE_STATUS.io_loop = tornado.ioloop.IOLoop.current()
+    if settings.status_use_mqtt:
+        status_thread = MqttStatusThread()
+    elif settings.status_use_ping:
         status_thread = PingStatusThread()
     else:
         status_thread = MDNSStatusThread()
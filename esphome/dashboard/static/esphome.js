@@ -187,6 +187,58 @@ const colorReplace = (pre, state, text) => {
 };
 
 // ============================= Online/Offline Status Indicators =============================
+// Status of each device: {online, last_seen, rtt}, last_seen in seconds since the epoch
+const deviceStatus = {};
+
+const renderStatus = (filename) => {
+  let node = document.querySelector(`.status-indicator[data-node="${filename}"]`);
+  if (node === null)
+    return;
+
+  const status = deviceStatus[filename];
+  let klass;
+  if (status.online === null) {
+    klass = 'unknown';
+  } else if (status.online === true) {
+    klass = 'online';
+  } else if (status.last_seen !== null && Date.now() - status.last_seen * 1000 <= 5000) {
+    klass = 'not-responding';
+  } else {
+    klass = 'offline';
+  }
+
+  let title = '';
+  if (status.online === true && status.rtt !== null) {
+    title = `RTT ${status.rtt.toFixed(1)} ms`;
+  } else if (status.online === false && status.last_seen !== null) {
+    title = `Last seen ${new Date(status.last_seen * 1000).toLocaleString()}`;
+  }
+  if (node.getAttribute('title') !== title)
+    node.setAttribute('title', title);
+
+  if (node.classList.contains(klass))
+    return;
+
+  node.classList.remove('unknown', 'online', 'offline', 'not-responding');
+  node.classList.add(klass);
+};
+
+const applyStatus = (changes) => {
+  for (let filename in changes) {
+    deviceStatus[filename] = changes[filename];
+    renderStatus(filename);
+  }
+};
+
+// Devices that just went offline turn from not-responding to offline
+setInterval(() => {
+  for (let filename in deviceStatus) {
+    if (deviceStatus[filename].online === false)
+      renderStatus(filename);
+  }
+}, 1000);
+
+// Fallback while the status WebSocket is not connected
 let isFetchingPing = false;
 const fetchPing = () => {
   if (isFetchingPing)
@@ -195,41 +247,44 @@ const fetchPing = () => {
 
   fetch(`./ping`, {credentials: "same-origin"}).then(res => res.json())
     .then(response => {
+      const changes = {};
       for (let filename in response) {
-        let node = document.querySelector(`.status-indicator[data-node="${filename}"]`);
-        if (node === null)
-          continue;
-
-        let status = response[filename];
-        let klass;
-        if (status === null) {
-          klass = 'unknown';
-        } else if (status === true) {
-          klass = 'online';
-          node.setAttribute('data-last-connected', Date.now().toString());
-        } else if (node.hasAttribute('data-last-connected')) {
-          const attr = parseInt(node.getAttribute('data-last-connected'));
-          if (Date.now() - attr <= 5000) {
-            klass = 'not-responding';
-          } else {
-            klass = 'offline';
-          }
-        } else {
-          klass = 'offline';
-        }
-
-        if (node.classList.contains(klass))
-          continue;
-
-        node.classList.remove('unknown', 'online', 'offline', 'not-responding');
-        node.classList.add(klass);
+        const old = deviceStatus[filename] || {last_seen: null};
+        const online = response[filename];
+        changes[filename] = {
+          online: online,
+          last_seen: online === true ? Date.now() / 1000 : old.last_seen,
+          rtt: null,
+        };
       }
-
+      applyStatus(changes);
+      isFetchingPing = false;
+    }, () => {
       isFetchingPing = false;
     });
 };
-setInterval(fetchPing, 2000);
-fetchPing();
+
+let pingInterval = null;
+const connectStatus = () => {
+  const socket = new WebSocket(`${wsUrl}status`);
+  socket.addEventListener('open', () => {
+    if (pingInterval !== null) {
+      clearInterval(pingInterval);
+      pingInterval = null;
+    }
+  });
+  socket.addEventListener('message', (event) => {
+    applyStatus(JSON.parse(event.data));
+  });
+  socket.addEventListener('close', () => {
+    if (pingInterval === null) {
+      pingInterval = setInterval(fetchPing, 2000);
+      fetchPing();
+    }
+    setTimeout(connectStatus, 5000);
+  });
+};
+connectStatus();
 
 // ============================= Serial Port Selector =============================
 const portSelect = document.querySelector('.nav-wrapper select');
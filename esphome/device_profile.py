@@ -0,0 +1,187 @@
+"""Device profiles for the commands that only talk to an already compiled device.
+
+`logs`, `upload` and `clean-mqtt` only need the name, platform and build path of
+the device, its address and the settings of its ota:, api:, mqtt: and logger:
+components. A profile with just these values is stored in .esphome/ next to the
+configuration. It is keyed like the configuration cache by the YAML files,
+include directories and environment variables it was read from. While the
+profile is fresh, these commands neither parse the YAML nor import the validation
+and code generation machinery. Otherwise only the sections of the profile are
+validated and the profile is written again.
+"""
+import json
+import logging
+import os
+
+from esphome import config_cache, yaml_util
+from esphome.const import CONF_BAUD_RATE, CONF_BIRTH_MESSAGE, CONF_BROKER, CONF_CLIENT_ID, \
+    CONF_DISCOVERY_PREFIX, CONF_ESPHOME, CONF_LOG_TOPIC, CONF_LOGGER, CONF_MQTT, CONF_NAME, \
+    CONF_OTA, CONF_PASSWORD, CONF_PLATFORMIO_OPTIONS, CONF_PORT, CONF_SHUTDOWN_MESSAGE, \
+    CONF_SSL_FINGERPRINTS, CONF_TOPIC_PREFIX, CONF_USE_ADDRESS, CONF_USERNAME, CONF_WIFI, \
+    CONF_WILL_MESSAGE
+from esphome.core import CORE, EsphomeError
+from esphome.helpers import mkdir_p
+from esphome.py_compat import integer_types, text_type
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bump when the layout of a profile changes
+PROFILE_VERSION = 2
+# The components whose settings are part of the profile
+PROFILE_DOMAINS = [CONF_WIFI, 'ethernet', CONF_OTA, 'api', CONF_MQTT, CONF_LOGGER]
+# The settings that are stored for each section, all others are dropped
+_PROFILE_KEYS = {
+    CONF_ESPHOME: [CONF_NAME, CONF_PLATFORMIO_OPTIONS],
+    CONF_WIFI: [CONF_USE_ADDRESS],
+    'ethernet': [CONF_USE_ADDRESS],
+    CONF_OTA: [CONF_PORT, CONF_PASSWORD],
+    'api': [CONF_PORT, CONF_PASSWORD],
+    CONF_LOGGER: [CONF_BAUD_RATE],
+    CONF_MQTT: [CONF_BROKER, CONF_PORT, CONF_USERNAME, CONF_PASSWORD, CONF_CLIENT_ID,
+                CONF_TOPIC_PREFIX, CONF_LOG_TOPIC, CONF_DISCOVERY_PREFIX, CONF_SSL_FINGERPRINTS,
+                CONF_BIRTH_MESSAGE, CONF_WILL_MESSAGE, CONF_SHUTDOWN_MESSAGE],
+}
+
+
+def ext_profile_path(base_path, config_filename):  # type: (str, str) -> str
+    return os.path.join(base_path, '.esphome', '{}.profile.json'.format(config_filename))
+
+
+def profile_path():  # type: () -> str
+    return ext_profile_path(CORE.config_dir, CORE.config_filename)
+
+
+def _to_json(value):
+    if isinstance(value, dict):
+        return {text_type(k): _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(x) for x in value]
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, integer_types):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return text_type(value)
+
+
+def profile_config(config):
+    """Return the parts of the validated config that are stored in the profile."""
+    profile = {}
+    for domain, keys in _PROFILE_KEYS.items():
+        if domain not in config:
+            continue
+        profile[domain] = {key: _to_json(config[domain][key])
+                           for key in keys if key in config[domain]}
+    return profile
+
+
+def load_stored_config(path):
+    """Return the config stored in the profile at path, without checking if it's fresh.
+
+    None if there is no readable profile at path.
+    """
+    try:
+        with open(path) as f_handle:
+            data = json.load(f_handle)
+        if data.get('version') != PROFILE_VERSION:
+            return None
+        return data['config']
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+
+def load():
+    """Return the config of the profile of the current configuration.
+
+    Also restores the CORE metadata of the profile. Returns None if there is no
+    fresh profile.
+    """
+    path = profile_path()
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as f_handle:
+            data = json.load(f_handle)
+        if data.get('version') != PROFILE_VERSION:
+            return None
+        key = config_cache.compute_key(data['files'], data['directories'], data['env_vars'])
+        if key != data['key']:
+            _LOGGER.debug("Device profile is outdated")
+            return None
+    except (IOError, OSError, ValueError, KeyError) as err:
+        _LOGGER.debug("Could not read device profile: %s", err)
+        return None
+
+    core_data = data['core']
+    CORE.name = core_data['name']
+    CORE.esp_platform = core_data['esp_platform']
+    CORE.board = core_data['board']
+    CORE.build_path = core_data['build_path']
+    return data['config']
+
+
+def save(config):
+    """Store the profile of config, which must come from the last load_yaml call."""
+    files, directories, env_vars = yaml_util.loaded_dependencies()
+    data = {
+        'version': PROFILE_VERSION,
+        'files': files,
+        'directories': directories,
+        'env_vars': env_vars,
+        'key': config_cache.compute_key(files, directories, env_vars),
+        'core': {
+            'name': CORE.name,
+            'esp_platform': CORE.esp_platform,
+            'board': CORE.board,
+            'build_path': CORE.build_path,
+        },
+        'config': config,
+    }
+    path = profile_path()
+    tmp_path = path + '.tmp'
+    try:
+        mkdir_p(os.path.dirname(path))
+        with open(tmp_path, 'w') as f_handle:
+            json.dump(data, f_handle, indent=2, sort_keys=True)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as err:
+        # Not being able to write the profile is never fatal
+        _LOGGER.warning("Could not write device profile: %s", err)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_profile():
+    """Return the profile config of the current configuration.
+
+    Uses the stored profile if it's fresh, otherwise validates only the sections of
+    the profile. Returns None if that fails, the caller should then read the full
+    configuration to report the errors.
+    """
+    config = load()
+    if config is not None:
+        _LOGGER.info("Using device profile of %s", CORE.config_path)
+        return config
+
+    from esphome.config import load_partial_config
+
+    _LOGGER.info("Reading configuration %s...", CORE.config_path)
+    try:
+        result = load_partial_config(PROFILE_DOMAINS)
+    except EsphomeError as err:
+        _LOGGER.debug("Could not read device profile: %s", err)
+        return None
+    if result.errors:
+        return None
+    config = profile_config(result)
+    save(config)
+    return config
+
+
+def clear():
+    path = profile_path()
+    if os.path.isfile(path):
+        os.remove(path)
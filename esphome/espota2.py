@@ -7,7 +7,7 @@ import time
 
 from esphome.core import EsphomeError
 from esphome.helpers import is_ip_address, resolve_ip_address
-from esphome.py_compat import IS_PY2, char_to_byte
+from esphome.py_compat import IS_PY2, IS_PY3, char_to_byte
 
 RESPONSE_OK = 0
 RESPONSE_REQUEST_AUTH = 1
@@ -296,6 +296,10 @@ def run_ota_impl_(remote_host, remote_port, password, filename):
 
 
 def run_ota(remote_host, remote_port, password, filename):
+    if IS_PY3:
+        from esphome import espota_async
+
+        return espota_async.run_ota(remote_host, remote_port, password, filename)
     try:
         return run_ota_impl_(remote_host, remote_port, password, filename)
     except OTAError as err:
@@ -0,0 +1,341 @@
+"""asyncio implementation of the ESPHome OTA upload protocol.
+
+Compared to the blocking uploader in espota2 this module streams the firmware
+from disk (also for computing the MD5), sends it in configurable chunks without
+shrinking the socket send buffer and bases the progress on the bytes the device
+has acknowledged on the TCP level. Several devices can be flashed concurrently
+from one event loop with run_ota_many.
+
+This module requires python 3.5+, use espota2 for the public entry points.
+"""
+import asyncio
+import hashlib
+import logging
+import random
+import socket
+import sys
+import time
+
+from esphome.core import EsphomeError
+from esphome.espota2 import MAGIC_BYTES, OTA_VERSION_1_0, RESPONSE_AUTH_OK, \
+    RESPONSE_BIN_MD5_OK, RESPONSE_HEADER_OK, RESPONSE_OK, RESPONSE_RECEIVE_OK, \
+    RESPONSE_REQUEST_AUTH, RESPONSE_UPDATE_END_OK, RESPONSE_UPDATE_PREPARE_OK, OTAError, \
+    ProgressBar, check_error
+from esphome.helpers import is_ip_address, resolve_ip_address
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 8192
+# How long to wait for a response of the device (the device erases flash after the size)
+RESPONSE_TIMEOUT = 20.0
+CONNECT_TIMEOUT = 10.0
+# Linux SIOCOUTQ: Number of bytes in the send queue that were not acknowledged yet
+_SIOCOUTQ = 0x5411
+# macOS SO_NWRITE: Same as SIOCOUTQ
+_SO_NWRITE = 0x1024
+
+
+def file_md5(filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Compute the MD5 and size of a file without reading it into memory at once."""
+    md5 = hashlib.md5()
+    size = 0
+    with open(filename, 'rb') as file_handle:
+        while True:
+            chunk = file_handle.read(chunk_size)
+            if not chunk:
+                break
+            md5.update(chunk)
+            size += len(chunk)
+    return md5.hexdigest(), size
+
+
+def unacked_bytes(sock):
+    """Return how many bytes the kernel still holds for sock, 0 if that's not known."""
+    if sock is None:
+        return 0
+    try:
+        if sys.platform.startswith('linux'):
+            import fcntl
+            import struct
+
+            buf = fcntl.ioctl(sock.fileno(), _SIOCOUTQ, b'\0\0\0\0')
+            return struct.unpack('I', buf)[0]
+        if sys.platform == 'darwin':
+            return sock.getsockopt(socket.SOL_SOCKET, _SO_NWRITE)
+    except (OSError, IOError, ValueError):
+        pass
+    return 0
+
+
+class UploadStats(object):
+    def __init__(self, host, size):
+        self.host = host
+        self.size = size
+        self.start = None
+        self.end = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+    @property
+    def throughput(self):
+        """The transfer rate of the firmware data in bytes per second."""
+        duration = self.duration
+        if not duration:
+            return None
+        return self.size / duration
+
+    def __str__(self):
+        throughput = self.throughput
+        if throughput is None:
+            return '{} bytes'.format(self.size)
+        return '{} bytes in {:.1f}s ({:.1f} KiB/s)'.format(self.size, self.duration,
+                                                           throughput / 1024)
+
+
+class _LogProgress(object):
+    """Progress reporter for concurrent uploads, logs every 10 percent."""
+
+    def __init__(self, host):
+        self.host = host
+        self.last_step = None
+
+    def update(self, progress):
+        step = int(min(progress, 1) * 10)
+        if step == self.last_step:
+            return
+        self.last_step = step
+        _LOGGER.info("%s: Uploading %s%%", self.host, step * 10)
+
+    def done(self):
+        pass
+
+
+async def _read_exactly(reader, amount, msg, expect, decode=True):
+    try:
+        data = await asyncio.wait_for(reader.readexactly(amount), RESPONSE_TIMEOUT)
+    except asyncio.IncompleteReadError as err:
+        data = err.partial
+        if data:
+            check_error(list(data), expect)
+        raise OTAError("Error receiving {}: Connection closed".format(msg))
+    except asyncio.TimeoutError:
+        raise OTAError("Error receiving {}: Timeout".format(msg))
+    except (OSError, socket.error) as err:
+        raise OTAError("Error receiving {}: {}".format(msg, err))
+    try:
+        check_error(list(data), expect)
+    except OTAError as err:
+        raise OTAError("Error {}: {}".format(msg, err))
+    if decode:
+        return list(data)
+    return data
+
+
+async def _send(writer, data, msg):
+    if isinstance(data, (list, tuple)):
+        data = bytes(data)
+    elif isinstance(data, int):
+        data = bytes([data])
+    elif isinstance(data, str):
+        data = data.encode('utf8')
+    try:
+        writer.write(data)
+        await asyncio.wait_for(writer.drain(), RESPONSE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise OTAError("Error sending {}: Timeout".format(msg))
+    except (OSError, socket.error) as err:
+        raise OTAError("Error sending {}: {}".format(msg, err))
+
+
+def _set_nodelay(sock, value):
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, value)
+
+
+async def perform_ota(reader, writer, password, filename, chunk_size=DEFAULT_CHUNK_SIZE,
+                      send_buffer=None, progress=None):
+    """Run the OTA protocol on an open connection, returns the upload statistics."""
+    loop = asyncio.get_event_loop()
+    md5, file_size = await loop.run_in_executor(None, file_md5, filename, chunk_size)
+    _LOGGER.info('Uploading %s (%s bytes)', filename, file_size)
+    _LOGGER.debug("MD5 of binary is %s", md5)
+    sock = writer.get_extra_info('socket')
+
+    # Enable nodelay, we need it for phase 1
+    _set_nodelay(sock, 1)
+    await _send(writer, MAGIC_BYTES, 'magic bytes')
+
+    _, version = await _read_exactly(reader, 2, 'version', RESPONSE_OK)
+    if version != OTA_VERSION_1_0:
+        raise OTAError("Unsupported OTA version {}".format(version))
+
+    # Features
+    await _send(writer, 0x00, 'features')
+    await _read_exactly(reader, 1, 'features', RESPONSE_HEADER_OK)
+
+    auth, = await _read_exactly(reader, 1, 'auth', [RESPONSE_REQUEST_AUTH, RESPONSE_AUTH_OK])
+    if auth == RESPONSE_REQUEST_AUTH:
+        if not password:
+            raise OTAError("ESP requests password, but no password given!")
+        nonce = await _read_exactly(reader, 32, 'authentication nonce', [], decode=False)
+        nonce = nonce.decode()
+        _LOGGER.debug("Auth: Nonce is %s", nonce)
+        cnonce = hashlib.md5(str(random.random()).encode()).hexdigest()
+        _LOGGER.debug("Auth: CNonce is %s", cnonce)
+        await _send(writer, cnonce, 'auth cnonce')
+
+        result_md5 = hashlib.md5()
+        result_md5.update(password.encode('utf-8'))
+        result_md5.update(nonce.encode())
+        result_md5.update(cnonce.encode())
+        result = result_md5.hexdigest()
+        _LOGGER.debug("Auth: Result is %s", result)
+        await _send(writer, result, 'auth result')
+        await _read_exactly(reader, 1, 'auth result', RESPONSE_AUTH_OK)
+
+    file_size_encoded = [
+        (file_size >> 24) & 0xFF,
+        (file_size >> 16) & 0xFF,
+        (file_size >> 8) & 0xFF,
+        (file_size >> 0) & 0xFF,
+    ]
+    await _send(writer, file_size_encoded, 'binary size')
+    await _read_exactly(reader, 1, 'binary size', RESPONSE_UPDATE_PREPARE_OK)
+
+    await _send(writer, md5, 'file checksum')
+    await _read_exactly(reader, 1, 'file checksum', RESPONSE_BIN_MD5_OK)
+
+    # Disable nodelay for transfer
+    _set_nodelay(sock, 0)
+    if send_buffer is not None and sock is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer)
+    # Keep at most a few chunks buffered in user space, the kernel buffer does the rest
+    writer.transport.set_write_buffer_limits(high=chunk_size * 4)
+
+    if progress is None:
+        progress = ProgressBar()
+    stats = UploadStats(writer.get_extra_info('peername'), file_size)
+    stats.start = time.time()
+    offset = 0
+    with open(filename, 'rb') as file_handle:
+        while True:
+            chunk = file_handle.read(chunk_size)
+            if not chunk:
+                break
+            offset += len(chunk)
+            await _send(writer, chunk, 'data')
+            # Progress is based on the bytes the device acknowledged, not the bytes
+            # that were handed to the kernel
+            pending = writer.transport.get_write_buffer_size() + unacked_bytes(sock)
+            progress.update(max(offset - pending, 0) / float(file_size))
+    progress.update(1)
+    progress.done()
+
+    # Enable nodelay for last checks
+    _set_nodelay(sock, 1)
+    _LOGGER.info("Waiting for result...")
+
+    await _read_exactly(reader, 1, 'receive OK', RESPONSE_RECEIVE_OK)
+    stats.end = time.time()
+    await _read_exactly(reader, 1, 'Update end', RESPONSE_UPDATE_END_OK)
+    await _send(writer, RESPONSE_OK, 'end acknowledgement')
+    _LOGGER.info("OTA successful: %s", stats)
+    return stats
+
+
+async def _resolve(remote_host):
+    if is_ip_address(remote_host):
+        return remote_host
+    _LOGGER.info("Resolving IP address of %s", remote_host)
+    loop = asyncio.get_event_loop()
+    try:
+        ip = await loop.run_in_executor(None, resolve_ip_address, remote_host)
+    except EsphomeError as err:
+        _LOGGER.error("Error resolving IP address of %s. Is it connected to WiFi?", remote_host)
+        _LOGGER.error("(If this error persists, please set a static IP address: "
+                      "https://esphome.io/components/wifi.html#manual-ips)")
+        raise OTAError(err)
+    _LOGGER.info(" -> %s", ip)
+    return ip
+
+
+async def upload(remote_host, remote_port, password, filename, chunk_size=DEFAULT_CHUNK_SIZE,
+                 send_buffer=None, attempts=1, progress=None):
+    """Upload filename to a device, returns the upload statistics.
+
+    The OTA protocol can't continue an interrupted transfer, if the connection
+    fails the upload is restarted from the beginning up to attempts times.
+    """
+    ip = await _resolve(remote_host)
+    for attempt in range(1, attempts + 1):
+        _LOGGER.info("Connecting to %s", ip)
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(ip, remote_port), CONNECT_TIMEOUT)
+        except (OSError, socket.error, asyncio.TimeoutError) as err:
+            error = OTAError("Connecting to {}:{} failed: {}".format(remote_host, remote_port,
+                                                                     str(err) or 'Timeout'))
+        else:
+            try:
+                return await perform_ota(reader, writer, password, filename,
+                                         chunk_size=chunk_size, send_buffer=send_buffer,
+                                         progress=progress)
+            except OTAError as err:
+                error = err
+            finally:
+                writer.close()
+        if attempt == attempts:
+            raise error
+        _LOGGER.warning("Upload to %s failed (%s), retrying (%s/%s)...", remote_host, error,
+                        attempt + 1, attempts)
+        await asyncio.sleep(1)
+    return None
+
+
+def _run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def run_ota(remote_host, remote_port, password, filename, **kwargs):
+    try:
+        _run(upload(remote_host, remote_port, password, filename, **kwargs))
+    except OTAError as err:
+        _LOGGER.error(err)
+        return 1
+    # Do not connect logs until it is fully on
+    time.sleep(1)
+    return 0
+
+
+def run_ota_many(targets, max_parallel=4, **kwargs):
+    """Flash several devices concurrently.
+
+    :param targets: A list of (remote_host, remote_port, password, filename) tuples.
+    :param max_parallel: Maximum number of concurrent uploads.
+    :return: A dict mapping each remote_host to its UploadStats, or the OTAError
+      if the upload to that device failed.
+    """
+    async def upload_many():
+        semaphore = asyncio.Semaphore(max_parallel)
+
+        async def upload_one(host, port, password, filename):
+            async with semaphore:
+                try:
+                    return await upload(host, port, password, filename,
+                                        progress=_LogProgress(host), **kwargs)
+                except OTAError as err:
+                    _LOGGER.error("%s: %s", host, err)
+                    return err
+
+        return await asyncio.gather(*[upload_one(*target) for target in targets])
+
+    results = _run(upload_many())
+    return dict(zip([target[0] for target in targets], results))
@@ -23,6 +23,34 @@ def ensure_unique_string(preferred_string, current_strings):
     return test_string
 
 
+class UniqueStringGenerator(object):
+    """Like ensure_unique_string for many strings, each also added to the current strings.
+
+    Remembers the last suffix tried for every preferred string, so generating n
+    strings with the same preferred string takes linear instead of quadratic time.
+    """
+
+    def __init__(self, current_strings):
+        self._current_strings = set(current_strings)
+        self._tries = {}
+
+    def add(self, string):
+        self._current_strings.add(string)
+
+    def generate(self, preferred_string):
+        tries = self._tries.get(preferred_string, 1)
+        test_string = preferred_string if tries == 1 else \
+            u"{}_{}".format(preferred_string, tries)
+
+        while test_string in self._current_strings:
+            tries += 1
+            test_string = u"{}_{}".format(preferred_string, tries)
+
+        self._tries[preferred_string] = tries
+        self._current_strings.add(test_string)
+        return test_string
+
+
 def indent_all_but_first_and_last(text, padding=u'  '):
     lines = text.splitlines(True)
     if len(lines) <= 2:
@@ -108,6 +136,22 @@ def is_ip_address(host):
 
 def _resolve_with_zeroconf(host):
     from esphome.core import EsphomeError
+    from esphome.py_compat import IS_PY3
+
+    if IS_PY3:
+        from esphome import zeroconf_async
+
+        try:
+            info = zeroconf_async.resolve_host(host + '.')
+        except EsphomeError:
+            raise
+        except Exception as err:
+            raise EsphomeError("Error resolving mDNS hostname: {}".format(err))
+        if info is None:
+            raise EsphomeError("Error resolving address with mDNS: Did not respond. "
+                               "Maybe the device is offline.")
+        return info
+
     from esphome.zeroconf import Zeroconf
 
     try:
@@ -0,0 +1,256 @@
+"""Follow the logs of all devices in a configuration directory at once.
+
+Devices with the native API are streamed with the asyncio API client, devices
+that only have MQTT are followed with one MQTT connection per broker. All
+lines are printed with a coloured per-device prefix and can additionally be
+written to rotating per-device log files.
+
+This module requires python 3.5+, it is used by `esphome <dir> logs-all`.
+"""
+import asyncio
+from datetime import datetime
+import fnmatch
+import functools
+import logging
+import logging.handlers
+import os
+import re
+
+from esphome import yaml_util
+from esphome.api.client_async import run_until_interrupted, stream_logs
+from esphome.config import read_config
+from esphome.const import CONF_BROKER, CONF_ESPHOME, CONF_MQTT, CONF_NAME, CONF_PASSWORD, \
+    CONF_PORT, CONF_SSL_FINGERPRINTS, CONF_USERNAME
+from esphome.core import CORE, EsphomeError
+from esphome.helpers import color, mkdir_p
+from esphome.py_compat import decode_text
+from esphome.util import list_yaml_files, safe_print
+
+_LOGGER = logging.getLogger(__name__)
+
+# Indexed by the ESPHOME_LOG_LEVEL_* values of the device
+LOG_LEVELS = ['NONE', 'ERROR', 'WARN', 'INFO', 'CONFIG', 'DEBUG', 'VERBOSE', 'VERY_VERBOSE']
+LOG_LEVEL_LETTERS = ['', 'E', 'W', 'I', 'C', 'D', 'V', 'VV']
+DEVICE_COLORS = ['cyan', 'green', 'yellow', 'blue', 'purple', 'bold_cyan', 'bold_green',
+                 'bold_yellow', 'bold_blue', 'bold_purple']
+# "[D][sensor:123]: ...", optionally preceded by the colour of the level
+_HEADER_RE = re.compile(r'^(?:\x1b\[[0-9;]*m)?\[(VV|[EWICDV])\]\[([^\]:]*)(?::\d+)?\]')
+_ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
+
+
+class LogDevice(object):
+    """A device of the configuration directory and how its logs can be reached."""
+
+    def __init__(self, name, path, address=None, api_port=None, api_password=None,
+                 mqtt_conf=None, log_topic=None):
+        self.name = name
+        self.path = path
+        self.address = address
+        self.api_port = api_port
+        self.api_password = api_password
+        self.mqtt_conf = mqtt_conf
+        self.log_topic = log_topic
+        self.color = None
+
+    @property
+    def uses_api(self):
+        return self.api_port is not None
+
+
+def _device_from_config(path, config):
+    from esphome import mqtt
+
+    name = config[CONF_ESPHOME][CONF_NAME]
+    if 'logger' not in config:
+        _LOGGER.warning("Skipping %s, logger is not configured", path)
+        return None
+    if 'api' in config and CORE.address is not None:
+        return LogDevice(name, path, address=CORE.address, api_port=config['api'][CONF_PORT],
+                         api_password=config['api'][CONF_PASSWORD])
+    if CONF_MQTT in config:
+        log_topic = mqtt.get_log_topic(config)
+        if log_topic is not None:
+            return LogDevice(name, path, mqtt_conf=config[CONF_MQTT], log_topic=log_topic)
+    _LOGGER.warning("Skipping %s, neither api: nor mqtt: log messages are configured", path)
+    return None
+
+
+def load_devices(directory):
+    """Read all configurations in directory, returns the devices that have remote logs."""
+    devices = []
+    # secrets.yaml and shared includes only need to be parsed once for all devices
+    yaml_util.keep_parse_cache()
+    try:
+        for path in list_yaml_files(directory):
+            CORE.config_path = path
+            try:
+                # Not written to the config cache, the results of a load with the
+                # parse cache kept shouldn't end up in the cache of single devices
+                config = read_config(use_cache=False)
+                if config is None:
+                    _LOGGER.warning("Skipping %s, the configuration is invalid", path)
+                    continue
+                CORE.config = config
+                device = _device_from_config(path, config)
+            except EsphomeError as err:
+                _LOGGER.warning("Skipping %s: %s", path, err)
+                continue
+            finally:
+                CORE.reset()
+            if device is not None:
+                device.color = DEVICE_COLORS[len(devices) % len(DEVICE_COLORS)]
+                devices.append(device)
+    finally:
+        yaml_util.keep_parse_cache(False)
+    return devices
+
+
+def parse_header(text):
+    """Return the level (or None) and tag (or None) of a log line of a device."""
+    match = _HEADER_RE.match(text)
+    if match is None:
+        return None, None
+    return LOG_LEVEL_LETTERS.index(match.group(1)), match.group(2)
+
+
+class LogPrinter(object):
+    """Filters the log lines of all devices, prints them and writes them to the log files."""
+
+    def __init__(self, devices, level=None, tags=None, exclude_tags=None, log_dir=None,
+                 max_bytes=0, backup_count=0):
+        self._level = level
+        self._tags = tags or []
+        self._exclude_tags = exclude_tags or []
+        self._log_dir = log_dir
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._width = max(len(device.name) for device in devices)
+        self._file_loggers = {}
+
+    def _matches(self, level, tag):
+        if self._level is not None and level is not None and level > self._level:
+            return False
+        if self._tags and (tag is None or
+                           not any(fnmatch.fnmatchcase(tag, x) for x in self._tags)):
+            return False
+        if tag is not None and any(fnmatch.fnmatchcase(tag, x) for x in self._exclude_tags):
+            return False
+        return True
+
+    def _file_logger(self, device):
+        logger = self._file_loggers.get(device.name)
+        if logger is None:
+            handler = logging.handlers.RotatingFileHandler(
+                os.path.join(self._log_dir, device.name + '.log'), maxBytes=self._max_bytes,
+                backupCount=self._backup_count, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger = logging.Logger(device.name)
+            logger.addHandler(handler)
+            self._file_loggers[device.name] = logger
+        return logger
+
+    def handle(self, device, text, level=None):
+        header_level, tag = parse_header(text)
+        if level is None:
+            level = header_level
+        if not self._matches(level, tag):
+            return
+        now = datetime.now()
+        prefix = color(device.color, device.name.ljust(self._width))
+        safe_print(u'{} {} | {}'.format(now.strftime(u'[%H:%M:%S]'), prefix, text))
+        if self._log_dir is not None:
+            line = u'{} {}'.format(now.strftime(u'[%Y-%m-%d %H:%M:%S]'), _ANSI_RE.sub(u'', text))
+            self._file_logger(device).info(line)
+
+    def close(self):
+        for logger in self._file_loggers.values():
+            for handler in logger.handlers:
+                handler.close()
+        self._file_loggers = {}
+
+
+def _start_mqtt(loop, mqtt_conf, devices, printer):
+    """Subscribe to the log topics of devices, all of which use the broker of mqtt_conf."""
+    import paho.mqtt.client as mqtt_client
+
+    from esphome import mqtt
+
+    by_topic = {device.log_topic: device for device in devices}
+    broker = u'{}:{}'.format(mqtt_conf[CONF_BROKER], mqtt_conf[CONF_PORT])
+
+    def on_connect(client, userdata, flags, return_code):
+        _LOGGER.info("Connected to MQTT broker %s", broker)
+        for topic in by_topic:
+            client.subscribe(topic)
+
+    def on_message(client, userdata, msg):
+        device = by_topic.get(msg.topic)
+        if device is not None:
+            loop.call_soon_threadsafe(printer.handle, device, decode_text(msg.payload))
+
+    client = mqtt_client.Client(u'')
+    client.on_connect = on_connect
+    client.on_message = on_message
+    mqtt.configure_client(client, mqtt_conf)
+    # The network loop thread of paho reconnects by itself
+    client.connect_async(str(mqtt_conf[CONF_BROKER]), mqtt_conf[CONF_PORT])
+    client.loop_start()
+    return client
+
+
+def _broker_key(mqtt_conf):
+    return (str(mqtt_conf[CONF_BROKER]), mqtt_conf[CONF_PORT], mqtt_conf.get(CONF_USERNAME),
+            mqtt_conf.get(CONF_PASSWORD), bool(mqtt_conf.get(CONF_SSL_FINGERPRINTS)))
+
+
+async def _follow_all(devices, printer, log_level):
+    loop = asyncio.get_event_loop()
+    brokers = {}
+    for device in devices:
+        if not device.uses_api:
+            brokers.setdefault(_broker_key(device.mqtt_conf), []).append(device)
+    clients = [_start_mqtt(loop, group[0].mqtt_conf, group, printer)
+               for group in brokers.values()]
+
+    def on_log(device, msg):
+        printer.handle(device, msg.message, level=msg.level or None)
+
+    waits = [stream_logs(device.address, device.api_port, device.api_password,
+                         functools.partial(on_log, device), log_level=log_level)
+             for device in devices if device.uses_api]
+    if clients:
+        # MQTT logs arrive on the paho threads, run until interrupted
+        waits.append(loop.create_future())
+    try:
+        await asyncio.gather(*waits)
+    finally:
+        for client in clients:
+            client.disconnect()
+            client.loop_stop()
+
+
+def run_logs_all(directory, level=None, tags=None, exclude_tags=None, log_dir=None,
+                 max_bytes=0, backup_count=0):
+    """Follow the logs of all devices in directory until interrupted.
+
+    :param level: Name of the most verbose log level to show, None for all levels.
+    :param tags: Only show lines of these tags (fnmatch patterns).
+    :param exclude_tags: Never show lines of these tags (fnmatch patterns).
+    :param log_dir: Directory for the rotating per-device log files, None to disable them.
+    """
+    devices = load_devices(directory)
+    if not devices:
+        _LOGGER.error("No devices with api: or mqtt: logs found in %s", directory)
+        return 1
+    if log_dir is not None:
+        mkdir_p(log_dir)
+    log_level = LOG_LEVELS.index(level) if level is not None else None
+    printer = LogPrinter(devices, level=log_level, tags=tags, exclude_tags=exclude_tags,
+                         log_dir=log_dir, max_bytes=max_bytes, backup_count=backup_count)
+    _LOGGER.info("Following the logs of %s devices", len(devices))
+    try:
+        run_until_interrupted(_follow_all(devices, printer,
+                                          log_level if log_level is not None else 7))
+    finally:
+        printer.close()
+    return 0
@@ -6,13 +6,15 @@ import logging
 import socket
 import ssl
 import sys
+import threading
 import time
 
 import paho.mqtt.client as mqtt
 
-from esphome.const import CONF_BROKER, CONF_DISCOVERY_PREFIX, CONF_ESPHOME, \
-    CONF_LOG_TOPIC, CONF_MQTT, CONF_NAME, CONF_PASSWORD, CONF_PORT, CONF_SSL_FINGERPRINTS, \
-    CONF_TOPIC, CONF_TOPIC_PREFIX, CONF_USERNAME
+from esphome.const import CONF_BIRTH_MESSAGE, CONF_BROKER, CONF_DISCOVERY_PREFIX, \
+    CONF_ESPHOME, CONF_LOG_TOPIC, CONF_MQTT, CONF_NAME, CONF_PASSWORD, CONF_PAYLOAD, CONF_PORT, \
+    CONF_SHUTDOWN_MESSAGE, CONF_SSL_FINGERPRINTS, CONF_TOPIC, CONF_TOPIC_PREFIX, CONF_USERNAME, \
+    CONF_WILL_MESSAGE
 from esphome.core import CORE, EsphomeError
 from esphome.helpers import color
 from esphome.py_compat import decode_text
@@ -21,6 +23,23 @@ from esphome.util import safe_print
 _LOGGER = logging.getLogger(__name__)
 
 
+def configure_client(client, conf, username=None, password=None):
+    """Set up the credentials and TLS of a client for the broker of the mqtt: block conf."""
+    if username is None:
+        if conf.get(CONF_USERNAME):
+            client.username_pw_set(conf[CONF_USERNAME], conf[CONF_PASSWORD])
+    elif username:
+        client.username_pw_set(username, password)
+
+    if conf.get(CONF_SSL_FINGERPRINTS):
+        if sys.version_info >= (2, 7, 13):
+            tls_version = ssl.PROTOCOL_TLS  # pylint: disable=no-member
+        else:
+            tls_version = ssl.PROTOCOL_SSLv23
+        client.tls_set(ca_certs=None, certfile=None, keyfile=None, cert_reqs=ssl.CERT_REQUIRED,
+                       tls_version=tls_version, ciphers=None)
+
+
 def initialize(config, subscriptions, on_message, username, password, client_id):
     def on_connect(client, userdata, flags, return_code):
         _LOGGER.info("Connected to MQTT broker!")
@@ -51,20 +70,7 @@ def initialize(config, subscriptions, on_message, username, password, client_id)
     client.on_connect = on_connect
     client.on_message = on_message
     client.on_disconnect = on_disconnect
-    if username is None:
-        if config[CONF_MQTT].get(CONF_USERNAME):
-            client.username_pw_set(config[CONF_MQTT][CONF_USERNAME],
-                                   config[CONF_MQTT][CONF_PASSWORD])
-    elif username:
-        client.username_pw_set(username, password)
-
-    if config[CONF_MQTT].get(CONF_SSL_FINGERPRINTS):
-        if sys.version_info >= (2, 7, 13):
-            tls_version = ssl.PROTOCOL_TLS  # pylint: disable=no-member
-        else:
-            tls_version = ssl.PROTOCOL_SSLv23
-        client.tls_set(ca_certs=None, certfile=None, keyfile=None, cert_reqs=ssl.CERT_REQUIRED,
-                       tls_version=tls_version, ciphers=None)
+    configure_client(client, config[CONF_MQTT], username, password)
 
     try:
         client.connect(str(config[CONF_MQTT][CONF_BROKER]), config[CONF_MQTT][CONF_PORT])
@@ -78,20 +84,27 @@ def initialize(config, subscriptions, on_message, username, password, client_id)
     return 0
 
 
+def get_log_topic(config):
+    """Return the topic the device of config publishes its logs to, None if disabled."""
+    conf = config[CONF_MQTT]
+    if CONF_LOG_TOPIC in conf:
+        if conf[CONF_LOG_TOPIC] is None:
+            return None
+        return conf[CONF_LOG_TOPIC][CONF_TOPIC]
+    if CONF_TOPIC_PREFIX in conf:
+        return conf[CONF_TOPIC_PREFIX] + u'/debug'
+    return config[CONF_ESPHOME][CONF_NAME] + u'/debug'
+
+
 def show_logs(config, topic=None, username=None, password=None, client_id=None):
-    if topic is not None:
-        pass  # already have topic
-    elif CONF_MQTT in config:
-        conf = config[CONF_MQTT]
-        if CONF_LOG_TOPIC in conf:
-            topic = config[CONF_MQTT][CONF_LOG_TOPIC][CONF_TOPIC]
-        elif CONF_TOPIC_PREFIX in config[CONF_MQTT]:
-            topic = config[CONF_MQTT][CONF_TOPIC_PREFIX] + u'/debug'
-        else:
-            topic = config[CONF_ESPHOME][CONF_NAME] + u'/debug'
-    else:
-        _LOGGER.error(u"MQTT isn't setup, can't start MQTT logs")
-        return 1
+    if topic is None:
+        if CONF_MQTT not in config:
+            _LOGGER.error(u"MQTT isn't setup, can't start MQTT logs")
+            return 1
+        topic = get_log_topic(config)
+        if topic is None:
+            _LOGGER.error(u"The MQTT log topic is disabled, can't start MQTT logs")
+            return 1
     _LOGGER.info(u"Starting log output from %s", topic)
 
     def on_message(client, userdata, msg):
@@ -125,6 +138,130 @@ def clear_topic(config, topic, username=None, password=None, client_id=None):
     return initialize(config, [topic], on_message, username, password, client_id)
 
 
+def get_status_messages(conf):
+    """Return the messages the device of the mqtt: block conf publishes about its status.
+
+    Each message is a (topic, payload, online) tuple, messages the device doesn't send
+    are left out.
+    """
+    status_topic = u'{}/status'.format(conf[CONF_TOPIC_PREFIX])
+    messages = []
+    for key, default_payload, online in ((CONF_BIRTH_MESSAGE, u'online', True),
+                                         (CONF_WILL_MESSAGE, u'offline', False),
+                                         (CONF_SHUTDOWN_MESSAGE, u'offline', False)):
+        message = conf.get(key, {CONF_TOPIC: status_topic, CONF_PAYLOAD: default_payload})
+        if not message:
+            # Empty message, disabled
+            continue
+        messages.append((message[CONF_TOPIC], message[CONF_PAYLOAD], online))
+    return messages
+
+
+class DashboardStatus(object):
+    """Track the online status of devices from their birth, will and shutdown messages.
+
+    Keeps one connection to the broker, subscribed to the status topics of all queried
+    devices. As the devices publish these messages retained, the current status of
+    every device arrives right after subscribing. on_update is called from the network
+    thread of the client with the keys whose status changed, mapped to True (online),
+    False (offline) or None (unknown, while the broker can't be reached).
+    """
+    # Topics per SUBSCRIBE packet
+    SUBSCRIBE_BATCH = 100
+
+    def __init__(self, broker, port, on_update, username=None, password=None):
+        self.broker = broker
+        self.port = port
+        self.on_update = on_update
+        self.client = mqtt.Client()
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.reconnect_delay_set(1, 60)
+        self.lock = threading.Lock()
+        self.connected = False
+        self.key_messages = {}
+        self.topic_keys = {}
+        self.status = {}
+
+    def start(self):
+        _LOGGER.info("Connecting to MQTT broker %s:%s for the device status", self.broker,
+                     self.port)
+        self.client.connect_async(self.broker, self.port)
+        self.client.loop_start()
+
+    def stop(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def request_query(self, messages):
+        """Track the devices of messages, a dict of keys to their status messages.
+
+        Subscribes to the new topics and unsubscribes from the ones no longer needed.
+        """
+        with self.lock:
+            old_topics = set(self.topic_keys)
+            self.key_messages = dict(messages)
+            self.topic_keys = {}
+            for key, key_messages in self.key_messages.items():
+                for topic, _, _ in key_messages:
+                    self.topic_keys.setdefault(topic, set()).add(key)
+            self.status = {key: online for key, online in self.status.items()
+                           if key in self.key_messages}
+            new_topics = set(self.topic_keys)
+            connected = self.connected
+        if connected:
+            self._unsubscribe(sorted(old_topics - new_topics))
+            self._subscribe(sorted(new_topics - old_topics))
+
+    def _subscribe(self, topics):
+        for i in range(0, len(topics), self.SUBSCRIBE_BATCH):
+            self.client.subscribe([(topic, 0) for topic in topics[i:i + self.SUBSCRIBE_BATCH]])
+
+    def _unsubscribe(self, topics):
+        for i in range(0, len(topics), self.SUBSCRIBE_BATCH):
+            self.client.unsubscribe(topics[i:i + self.SUBSCRIBE_BATCH])
+
+    def _on_connect(self, client, userdata, flags, return_code):
+        if return_code != 0:
+            _LOGGER.warning("MQTT broker refused the connection: %s",
+                            mqtt.connack_string(return_code))
+            return
+        _LOGGER.info("Connected to MQTT broker %s:%s", self.broker, self.port)
+        with self.lock:
+            self.connected = True
+            topics = sorted(self.topic_keys)
+        # Clean session, subscribe to everything again
+        self._subscribe(topics)
+
+    def _on_disconnect(self, client, userdata, return_code):
+        with self.lock:
+            self.connected = False
+            changed = {key: None for key, online in self.status.items() if online is not None}
+            self.status.update(changed)
+        if return_code != 0:
+            _LOGGER.warning("Disconnected from MQTT broker (%s), device status is unknown",
+                            return_code)
+        if changed:
+            self.on_update(changed)
+
+    def _on_message(self, client, userdata, msg):
+        payload = decode_text(msg.payload)
+        changed = {}
+        with self.lock:
+            for key in self.topic_keys.get(msg.topic, ()):
+                for topic, message_payload, online in self.key_messages[key]:
+                    if topic == msg.topic and message_payload == payload:
+                        if self.status.get(key) != online:
+                            self.status[key] = online
+                            changed[key] = online
+                        break
+        if changed:
+            self.on_update(changed)
+
+
 # From marvinroger/async-mqtt-client -> scripts/get-fingerprint/get-fingerprint.py
 def get_fingerprint(config):
     addr = str(config[CONF_MQTT][CONF_BROKER]), config[CONF_MQTT][CONF_PORT]
@@ -63,10 +63,17 @@ FILTER_PLATFORMIO_LINES = [
 ]
 
 
+def get_platformio_env(core):
+    """Return the environment variables PlatformIO needs to build the project of core."""
+    return {
+        "PLATFORMIO_BUILD_DIR": os.path.abspath(core.relative_pioenvs_path()),
+        "PLATFORMIO_LIBDEPS_DIR": os.path.abspath(core.relative_piolibdeps_path()),
+    }
+
+
 def run_platformio_cli(*args, **kwargs):
     os.environ["PLATFORMIO_FORCE_COLOR"] = "true"
-    os.environ["PLATFORMIO_BUILD_DIR"] = os.path.abspath(CORE.relative_pioenvs_path())
-    os.environ["PLATFORMIO_LIBDEPS_DIR"] = os.path.abspath(CORE.relative_piolibdeps_path())
+    os.environ.update(get_platformio_env(CORE))
     cmd = ['platformio'] + list(args)
 
     if not CORE.verbose:
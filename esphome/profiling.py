@@ -0,0 +1,313 @@
+"""Wall and CPU time of the stages of the config-to-firmware pipeline (esphome --profile).
+
+The stages (YAML loading, the validation stages, code generation, writing the
+sources and the PlatformIO compile) are recorded as nested spans. In addition,
+every component and platform gets
+
+- the time of its schema validation,
+- the time of the steps of its to_code coroutine as run by CORE.flush_tasks, with
+  the number of steps, how often the coroutine was re-queued behind other tasks
+  and how often it was parked waiting for an ID,
+- the size of the C++ statements its to_code generated.
+
+The report is printed as a table and written as a Chrome trace file (open it in
+chrome://tracing or https://ui.perfetto.dev), which also holds the totals per stage
+and component under the "esphome" key.
+
+Profiling is off unless start() was called. All hooks then return immediately.
+"""
+from __future__ import print_function
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from esphome.py_compat import IS_PY2, text_type
+
+if IS_PY2:
+    _wall_time = time.time
+    # CPU time of the process on Unix
+    _cpu_time = time.clock
+else:
+    _wall_time = time.perf_counter
+    _cpu_time = time.process_time
+
+# Trace format version, bump when the layout of the "esphome" data changes
+TRACE_VERSION = 1
+
+_PROFILER = None
+
+
+class _Span(object):
+    def __init__(self, name, category, depth, is_step=False):
+        self.name = name
+        self.category = category
+        self.depth = depth
+        self.is_step = is_step
+        self.start = _wall_time()
+        self.cpu_start = _cpu_time()
+        self.wall = None
+        self.cpu = None
+
+    def finish(self):
+        self.wall = _wall_time() - self.start
+        self.cpu = _cpu_time() - self.cpu_start
+
+
+class ComponentStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.instances = 0
+        self.schema_wall = 0.0
+        self.schema_cpu = 0.0
+        self.to_code_wall = 0.0
+        self.to_code_cpu = 0.0
+        self.steps = 0
+        self.requeues = 0
+        self.waits = 0
+        self.cpp_bytes = 0
+
+    @property
+    def total_wall(self):
+        return self.schema_wall + self.to_code_wall
+
+    def as_dict(self):
+        return {
+            'instances': self.instances,
+            'schema_wall': self.schema_wall,
+            'schema_cpu': self.schema_cpu,
+            'to_code_wall': self.to_code_wall,
+            'to_code_cpu': self.to_code_cpu,
+            'steps': self.steps,
+            'requeues': self.requeues,
+            'waits': self.waits,
+            'cpp_bytes': self.cpp_bytes,
+        }
+
+
+class Profiler(object):
+    def __init__(self):
+        self.origin = _wall_time()
+        # All finished spans in the order they were started
+        self.spans = []
+        self._stack = []
+        self.components = {}
+
+    def _component(self, name):
+        stats = self.components.get(name)
+        if stats is None:
+            stats = self.components[name] = ComponentStats(name)
+        return stats
+
+    def begin(self, name, category, is_step=False):
+        record = _Span(name, category, len(self._stack), is_step)
+        self.spans.append(record)
+        self._stack.append(record)
+        return record
+
+    def end(self, record):
+        """Finish record and all spans that are still open inside of it."""
+        if record not in self._stack:
+            return
+        while self._stack:
+            top = self._stack.pop()
+            top.finish()
+            if top is record:
+                break
+
+    def finish(self):
+        """Finish all open spans."""
+        if self._stack:
+            self.end(self._stack[0])
+
+    def step(self, name, category):
+        """Finish the previous step of the current record and begin the next one."""
+        if self._stack and self._stack[-1].is_step:
+            self.end(self._stack[-1])
+        self.begin(name, category, is_step=True)
+
+    def add_schema(self, name, record):
+        stats = self._component(name)
+        stats.instances += 1
+        stats.schema_wall += record.wall
+        stats.schema_cpu += record.cpu
+
+    def run_task_step(self, core, task):
+        """Run the next step of the to_code task and account it to its component."""
+        name = _task_name(core, task)
+        main_count = len(core.main_statements)
+        global_count = len(core.global_statements)
+        record = self.begin(name, 'to_code')
+        try:
+            next(task)
+        finally:
+            self.end(record)
+            stats = self._component(name)
+            stats.steps += 1
+            stats.to_code_wall += record.wall
+            stats.to_code_cpu += record.cpu
+            stats.cpp_bytes += _statements_size(core.main_statements[main_count:])
+            stats.cpp_bytes += _statements_size(core.global_statements[global_count:])
+
+    def task_requeued(self, core, task, waiting):
+        name = _task_name(core, task)
+        stats = self._component(name)
+        if waiting:
+            stats.waits += 1
+        else:
+            stats.requeues += 1
+
+    def stage_totals(self):
+        """Return (name, depth, wall, cpu) of the spans that aren't per component, merged by path.
+
+        The to_code steps of a stage are interleaved, so they're only reported per
+        component.
+        """
+        totals = []
+        index = {}
+        path = []
+        for record in self.spans:
+            if record.category in ('schema', 'to_code') or record.wall is None:
+                continue
+            del path[record.depth:]
+            path.append(record.name)
+            key = tuple(path)
+            if key in index:
+                entry = totals[index[key]]
+                entry[2] += record.wall
+                entry[3] += record.cpu
+            else:
+                index[key] = len(totals)
+                totals.append([record.name, record.depth, record.wall, record.cpu])
+        return [tuple(entry) for entry in totals]
+
+    def trace_events(self):
+        events = []
+        for record in self.spans:
+            if record.wall is None:
+                continue
+            events.append({
+                'name': record.name,
+                'cat': record.category,
+                'ph': 'X',
+                'ts': int((record.start - self.origin) * 1e6),
+                'dur': int(record.wall * 1e6),
+                'pid': 1,
+                'tid': 1,
+                'args': {'cpu_ms': round(record.cpu * 1000, 3)},
+            })
+        return events
+
+    def as_dict(self):
+        return {
+            'version': TRACE_VERSION,
+            'stages': [{'name': name, 'depth': depth, 'wall': wall, 'cpu': cpu}
+                       for name, depth, wall, cpu in self.stage_totals()],
+            'components': {name: stats.as_dict() for name, stats in self.components.items()},
+        }
+
+    def write_trace(self, path):
+        data = {
+            'traceEvents': self.trace_events(),
+            'displayTimeUnit': 'ms',
+            'esphome': self.as_dict(),
+        }
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f_handle:
+            json.dump(data, f_handle, indent=1, sort_keys=True)
+
+    def format_report(self):
+        lines = []
+        lines.append(u"{:<48} {:>10} {:>10}".format(u"Stage", u"Wall ms", u"CPU ms"))
+        for name, depth, wall, cpu in self.stage_totals():
+            label = u'  ' * depth + name
+            lines.append(u"{:<48} {:>10.1f} {:>10.1f}".format(label, wall * 1000, cpu * 1000))
+        lines.append(u"")
+        lines.append(u"{:<32} {:>4} {:>10} {:>10} {:>10} {:>10} {:>6} {:>7} {:>6} {:>9}".format(
+            u"Component", u"#", u"Schema ms", u"CPU ms", u"to_code ms", u"CPU ms", u"Steps",
+            u"Requeue", u"Waits", u"C++ bytes"))
+        for stats in sorted(self.components.values(), key=lambda s: (-s.total_wall, s.name)):
+            lines.append(u"{:<32} {:>4} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f} {:>6} {:>7} "
+                         u"{:>6} {:>9}".format(stats.name, stats.instances,
+                                               stats.schema_wall * 1000, stats.schema_cpu * 1000,
+                                               stats.to_code_wall * 1000,
+                                               stats.to_code_cpu * 1000, stats.steps,
+                                               stats.requeues, stats.waits, stats.cpp_bytes))
+        return u'\n'.join(lines)
+
+
+def _task_name(core, task):
+    # The component of to_code tasks, the function name of other tasks
+    name = core.task_units.get(task)
+    if name is None:
+        name = getattr(task, '__name__', text_type(task))
+    return name
+
+
+def _statements_size(statements):
+    from esphome.cpp_generator import statement
+
+    size = 0
+    for exp in statements:
+        # Same text as CORE.cpp_main_section, plus the newline
+        size += len(text_type(statement(exp)).rstrip().encode('utf-8')) + 1
+    return size
+
+
+def start():  # type: () -> Profiler
+    global _PROFILER
+    _PROFILER = Profiler()
+    return _PROFILER
+
+
+def stop():  # type: () -> Profiler
+    """Stop profiling, finishes all open spans and returns the profiler."""
+    global _PROFILER
+    profiler = _PROFILER
+    _PROFILER = None
+    if profiler is not None:
+        profiler.finish()
+    return profiler
+
+
+def get_profiler():  # type: () -> Profiler
+    """Return the running profiler, None if profiling is off."""
+    return _PROFILER
+
+
+@contextmanager
+def span(name, category='stage'):
+    """Record the time of the with block as a stage, nested in the current stage."""
+    profiler = _PROFILER
+    if profiler is None:
+        yield None
+        return
+    current = profiler.begin(name, category)
+    try:
+        yield current
+    finally:
+        profiler.end(current)
+
+
+def step(name, category='stage'):
+    """Begin the next step of the current stage, ends at the next step or with the stage."""
+    if _PROFILER is not None:
+        _PROFILER.step(name, category)
+
+
+@contextmanager
+def schema_span(name):
+    """Record the time of the with block as schema validation of the component name."""
+    profiler = _PROFILER
+    if profiler is None:
+        yield
+        return
+    current = profiler.begin(name, 'schema')
+    try:
+        yield
+    finally:
+        profiler.end(current)
+        profiler.add_schema(name, current)
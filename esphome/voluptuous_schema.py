@@ -53,8 +53,9 @@ class _Schema(vol.Schema):
         # Keys that may be required
         all_required_keys = set(key for key in schema if isinstance(key, vol.Required))
 
-        # Keys that may have defaults
-        all_default_keys = set(key for key in schema if isinstance(key, vol.Optional))
+        # Keys that may have defaults, in schema order so the defaults are always inserted
+        # in the same order
+        all_default_keys = [key for key in schema if isinstance(key, vol.Optional)]
 
         # Recursively compile schema
         _compiled_schema = {}
@@ -1,12 +1,17 @@
 from __future__ import print_function
 
 import json
+import logging
 import os
+import time
 
-from esphome.config import load_config, _format_vol_invalid
+from esphome import yaml_util
+from esphome.config import load_config, _format_vol_invalid, SchemaCache
 from esphome.core import CORE
 from esphome.py_compat import text_type, safe_input
 
+_LOGGER = logging.getLogger(__name__)
+
 
 def _get_invalid_range(res, invalid):
     # type: (Config, vol.Invalid) -> Optional[DocumentRange]
@@ -30,12 +35,14 @@ class VSCodeResult(object):
     def __init__(self):
         self.yaml_errors = []
         self.validation_errors = []
+        self.stats = {}
 
     def dump(self):
         return json.dumps({
             'type': 'result',
             'yaml_errors': self.yaml_errors,
             'validation_errors': self.validation_errors,
+            'stats': self.stats,
         })
 
     def add_yaml_error(self, message):
@@ -51,10 +58,16 @@ class VSCodeResult(object):
 
 
 def read_config(args):
+    schema_cache = None
+    if args.incremental:
+        # Keep the parsed files and schema results of unchanged parts between requests
+        yaml_util.keep_parse_cache()
+        schema_cache = SchemaCache()
     while True:
         CORE.reset()
         data = json.loads(safe_input())
         assert data['type'] == 'validate'
+        start = time.time()
         CORE.vscode = True
         CORE.ace = args.ace
         f = data['file']
@@ -64,7 +77,7 @@ def read_config(args):
             CORE.config_path = data['file']
         vs = VSCodeResult()
         try:
-            res = load_config()
+            res = load_config(schema_cache=schema_cache)
         except Exception as err:  # pylint: disable=broad-except
             vs.add_yaml_error(text_type(err))
         else:
@@ -74,4 +87,9 @@ def read_config(args):
                     vs.add_validation_error(range_, _format_vol_invalid(err, res))
                 except Exception:  # pylint: disable=broad-except
                     continue
+        vs.stats['latency_ms'] = round((time.time() - start) * 1000, 1)
+        if schema_cache is not None:
+            vs.stats['schemas_validated'] = schema_cache.validated
+            vs.stats['schemas_reused'] = schema_cache.reused
+        _LOGGER.debug("Validated %s in %sms", f, vs.stats['latency_ms'])
         print(vs.dump())
@@ -1,15 +1,18 @@
 from __future__ import print_function
 
+import hashlib
 import logging
 import os
 import re
 
+from esphome import profiling
+from esphome.build_manifest import get_manifest
 from esphome.config import iter_components
-from esphome.const import CONF_BOARD_FLASH_MODE, CONF_ESPHOME, CONF_PLATFORMIO_OPTIONS, \
-    HEADER_FILE_EXTENSIONS, SOURCE_FILE_EXTENSIONS, __version__
+from esphome.const import CONF_BOARD_FLASH_MODE, CONF_ESPHOME, CONF_INCLUDES, \
+    CONF_PLATFORMIO_OPTIONS, HEADER_FILE_EXTENSIONS, SOURCE_FILE_EXTENSIONS, __version__
 from esphome.core import CORE, EsphomeError
-from esphome.helpers import mkdir_p, read_file, write_file_if_changed, walk_files, \
-    copy_file_if_changed
+from esphome.helpers import indent, mkdir_p, read_file, write_file_if_changed, walk_files
+from esphome.py_compat import encode_text, text_type
 from esphome.storage_json import StorageJSON, storage_path
 
 _LOGGER = logging.getLogger(__name__)
@@ -216,6 +219,17 @@ def get_ini_content():
     # data['lib_ldf_mode'] = 'chain'
     data.update(CORE.config[CONF_ESPHOME].get(CONF_PLATFORMIO_OPTIONS, {}))
 
+    if get_compile_cache_dir() is not None or precompiled_header_enabled():
+        extra_scripts = data.get('extra_scripts', [])
+        if not isinstance(extra_scripts, list):
+            extra_scripts = [extra_scripts]
+        if get_compile_cache_dir() is not None:
+            extra_scripts = ['pre:' + COMPILE_CACHE_SCRIPT_NAME] + extra_scripts
+        if precompiled_header_enabled():
+            # Post scripts can change the flags of the project sources only
+            extra_scripts = extra_scripts + ['post:' + PCH_SCRIPT_NAME]
+        data['extra_scripts'] = extra_scripts
+
     content = u'[env:{}]\n'.format(CORE.name)
     content += format_ini(data)
 
@@ -244,6 +258,9 @@ def find_begin_end(text, begin_s, end_s):
 def write_platformio_ini(content):
     update_storage_json()
     path = CORE.relative_build_path('platformio.ini')
+    manifest = get_manifest()
+    if manifest.is_current(path, [content]):
+        return
 
     if os.path.isfile(path):
         text = read_file(path)
@@ -252,7 +269,7 @@ def write_platformio_ini(content):
         content_format = INI_BASE_FORMAT
     full_file = content_format[0] + INI_AUTO_GENERATE_BEGIN + '\n' + content
     full_file += INI_AUTO_GENERATE_END + content_format[1]
-    write_file_if_changed(path, full_file)
+    manifest.write_file(path, full_file, inputs=[content])
 
 
 def write_platformio_project():
@@ -260,7 +277,173 @@ def write_platformio_project():
 
     content = get_ini_content()
     write_gitignore()
+    write_compile_cache_script()
     write_platformio_ini(content)
+    get_manifest().save()
+
+
+COMPILE_CACHE_SCRIPT_NAME = 'esphome_compile_cache.py'
+COMPILE_CACHE_SCRIPT_FORMAT = u"""\
+# Auto generated code by esphome
+# Runs all compiler invocations through the esphome compile cache.
+Import("env")  # noqa
+
+LAUNCHER = {!r}
+for key in ('CCCOM', 'CXXCOM'):
+    env.Replace(**{{key: LAUNCHER + ' ' + env[key]}})  # noqa
+"""
+
+
+def get_compile_cache_dir():
+    """Return the directory of the shared object cache, None if it is disabled.
+
+    The cache is enabled by setting $ESPHOME_COMPILE_CACHE_DIR, nodes that are
+    built with the same directory share their compiled objects.
+    """
+    cache_dir = os.environ.get('ESPHOME_COMPILE_CACHE_DIR')
+    if not cache_dir:
+        return None
+    return os.path.abspath(os.path.expanduser(cache_dir))
+
+
+def write_compile_cache_script():
+    from esphome import compile_cache
+
+    path = CORE.relative_build_path(COMPILE_CACHE_SCRIPT_NAME)
+    cache_dir = get_compile_cache_dir()
+    if cache_dir is None:
+        get_manifest().remove(path)
+        return
+
+    base_dirs = [CORE.build_path, CORE.relative_pioenvs_path(CORE.name),
+                 CORE.relative_pioenvs_path(), CORE.relative_piolibdeps_path()]
+    launcher = os.path.abspath(compile_cache.__file__)
+    if launcher.endswith('.pyc'):
+        launcher = launcher[:-1]
+    launcher_cmd = [u'$PYTHONEXE', launcher, u'--cache-dir', cache_dir]
+    for base_dir in base_dirs:
+        launcher_cmd += [u'--base-dir', os.path.abspath(base_dir)]
+    launcher_cmd += [u'--extra-key', u'{}/{}'.format(CORE.arduino_version, CORE.board), u'--']
+    content = COMPILE_CACHE_SCRIPT_FORMAT.format(
+        u' '.join(u'"{}"'.format(x) for x in launcher_cmd))
+    get_manifest().write_file(path, content)
+
+
+PCH_SCRIPT_NAME = 'esphome_pch.py'
+PCH_HEADER_NAME = 'esphome_pch.h'
+PCH_HEADER_CONTENT = u"""\
+// Auto generated code by esphome
+// Precompiled by esphome_pch.py and included in all C++ sources of the project.
+#include "esphome.h"
+"""
+PCH_SCRIPT_FORMAT = u"""\
+# Auto generated code by esphome
+# Precompiles esphome_pch.h, the headers of all components, and includes it in
+# all C++ sources of the project.
+from __future__ import print_function
+
+import hashlib
+import os
+import time
+
+Import("env", "projenv")  # noqa
+
+# Key of the headers, libraries and platform, computed by esphome
+HEADER_KEY = {header_key!r}
+PCH_NAME = 'esphome_pch.h'
+
+
+def precompile_header():
+    pch_dir = projenv.subst(os.path.join('$BUILD_DIR', 'esphome_pch'))  # noqa
+    header = os.path.join(projenv.subst('$PROJECT_DIR'), 'src', PCH_NAME)  # noqa
+    pch_path = os.path.join(pch_dir, PCH_NAME + '.gch')
+    key_path = os.path.join(pch_dir, 'key')
+    command = '$CXX -x c++-header -o "' + pch_path + '" -c $CXXFLAGS $CCFLAGS $_CCCOMCOM "' + \\
+        header + '"'
+
+    compiler = projenv.subst('$CXX')  # noqa
+    compiler = projenv.WhereIs(compiler) or compiler  # noqa
+    hasher = hashlib.sha256()
+    hasher.update(HEADER_KEY.encode('utf-8'))
+    hasher.update(projenv.subst(command).encode('utf-8'))  # noqa
+    if os.path.isfile(compiler):
+        stat = os.stat(compiler)
+        hasher.update('{{}} {{}}'.format(stat.st_size, int(stat.st_mtime)).encode('utf-8'))
+    key = hasher.hexdigest()
+
+    old_key = None
+    if os.path.isfile(key_path):
+        with open(key_path) as f_handle:
+            old_key = f_handle.read().strip()
+    if old_key != key or not os.path.isfile(pch_path):
+        if not os.path.isdir(pch_dir):
+            os.makedirs(pch_dir)
+        if os.path.isfile(key_path):
+            os.remove(key_path)
+        start = time.time()
+        rc = projenv.Execute(projenv.VerboseAction(command, 'Precompiling ' + PCH_NAME))  # noqa
+        if rc:
+            print('Could not precompile {{}}, compiling without it.'.format(PCH_NAME))
+            if os.path.isfile(pch_path):
+                os.remove(pch_path)
+            return
+        with open(key_path, 'w') as f_handle:
+            f_handle.write(key)
+        print('Precompiled {{}} in {{:.1f}}s'.format(PCH_NAME, time.time() - start))
+
+    # GCC looks for esphome_pch.h.gch in each include directory before esphome_pch.h,
+    # a precompiled header that doesn't match the flags is skipped with a warning.
+    projenv.Prepend(CPPPATH=[pch_dir])  # noqa
+    projenv.Append(CXXFLAGS=['-include', PCH_NAME, '-Winvalid-pch'])  # noqa
+
+
+if not env.GetOption('clean'):  # noqa
+    precompile_header()
+"""
+
+
+def precompiled_header_enabled():
+    """Return True if the headers of esphome.h are precompiled.
+
+    Precompiling is enabled by setting $ESPHOME_PCH=1.
+    """
+    return os.environ.get('ESPHOME_PCH') == '1'
+
+
+def get_precompiled_header_key():
+    """Return the hash of everything the precompiled header is built from.
+
+    These are the contents of all headers of the loaded components (including
+    defines.h), the libraries and the platform. The build script adds the
+    compiler and its flags.
+    """
+    headers = {'esphome.h', DEFINES_H_TARGET, VERSION_H_TARGET}
+    for _, component, _ in iter_components(CORE.config):
+        headers.update(target for target in component.source_files
+                       if os.path.splitext(target)[1] in HEADER_FILE_EXTENSIONS)
+    manifest = get_manifest()
+    hasher = hashlib.sha256()
+    parts = [CORE.arduino_version, CORE.board] + gather_lib_deps()
+    for target in sorted(headers):
+        content_hash = manifest.content_hash(CORE.relative_src_path(*target.split('/')))
+        parts.append(u'{} {}'.format(target, content_hash))
+    for part in parts:
+        hasher.update(encode_text(part))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+def write_precompiled_header():
+    manifest = get_manifest()
+    header_path = CORE.relative_src_path(PCH_HEADER_NAME)
+    script_path = CORE.relative_build_path(PCH_SCRIPT_NAME)
+    if not precompiled_header_enabled():
+        manifest.remove(header_path)
+        manifest.remove(script_path)
+        return
+    manifest.write_file(header_path, PCH_HEADER_CONTENT)
+    manifest.write_file(script_path,
+                        PCH_SCRIPT_FORMAT.format(header_key=get_precompiled_header_key()))
 
 
 DEFINES_H_FORMAT = ESPHOME_H_FORMAT = u"""\
@@ -273,6 +456,7 @@ VERSION_H_FORMAT = u"""\
 """
 DEFINES_H_TARGET = 'esphome/core/defines.h'
 VERSION_H_TARGET = 'esphome/core/version.h'
+BINARY_BLOBS_CPP_TARGET = 'binary_blobs.cpp'
 ESPHOME_README_TXT = u"""
 THIS DIRECTORY IS AUTO-GENERATED, DO NOT MODIFY
 
@@ -304,6 +488,9 @@ def copy_src_tree():
 
     source_files_copy = source_files.copy()
     source_files_copy.pop(DEFINES_H_TARGET)
+    # Generated below, copying it first would write it twice on every run
+    source_files_copy.pop(VERSION_H_TARGET, None)
+    manifest = get_manifest()
 
     for path in walk_files(CORE.relative_src_path('esphome')):
         if os.path.splitext(path)[1] not in SOURCE_FILE_EXTENSIONS:
@@ -316,25 +503,23 @@ def copy_src_tree():
             continue
         if target not in source_files_copy:
             # Source file removed, delete target
-            os.remove(path)
+            manifest.remove(path)
         else:
             src_path = source_files_copy.pop(target)
-            copy_file_if_changed(src_path, path)
+            manifest.copy_file(src_path, path)
 
     # Now copy new files
     for target, src_path in source_files_copy.items():
         dst_path = CORE.relative_src_path(*target.split('/'))
-        copy_file_if_changed(src_path, dst_path)
+        manifest.copy_file(src_path, dst_path)
 
     # Finally copy defines
-    write_file_if_changed(CORE.relative_src_path('esphome', 'core', 'defines.h'),
-                          generate_defines_h())
-    write_file_if_changed(CORE.relative_src_path('esphome', 'README.txt'),
-                          ESPHOME_README_TXT)
-    write_file_if_changed(CORE.relative_src_path('esphome.h'),
-                          ESPHOME_H_FORMAT.format(include_s))
-    write_file_if_changed(CORE.relative_src_path('esphome', 'core', 'version.h'),
-                          VERSION_H_FORMAT.format(__version__))
+    manifest.write_file(CORE.relative_src_path('esphome', 'core', 'defines.h'),
+                        generate_defines_h())
+    manifest.write_file(CORE.relative_src_path('esphome', 'README.txt'), ESPHOME_README_TXT)
+    manifest.write_file(CORE.relative_src_path('esphome.h'), ESPHOME_H_FORMAT.format(include_s))
+    manifest.write_file(CORE.relative_src_path('esphome', 'core', 'version.h'),
+                        VERSION_H_FORMAT.format(__version__))
 
 
 def generate_defines_h():
@@ -343,24 +528,209 @@ def generate_defines_h():
     return DEFINES_H_FORMAT.format(u'\n'.join(define_content_l))
 
 
-def write_cpp(code_s):
-    path = CORE.relative_src_path('main.cpp')
-    if os.path.isfile(path):
-        text = read_file(path)
-        code_format = find_begin_end(text, CPP_AUTO_GENERATE_BEGIN, CPP_AUTO_GENERATE_END)
-        code_format_ = find_begin_end(code_format[0], CPP_INCLUDE_BEGIN, CPP_INCLUDE_END)
-        code_format = (code_format_[0], code_format_[1], code_format[1])
-    else:
-        code_format = CPP_BASE_FORMAT
+BINARY_BLOBS_CPP_FORMAT = u"""\
+// Auto generated code by esphome
+// Large constant arrays used by main.cpp, they're kept in this file so
+// that main.cpp stays small and this file is only recompiled if they change.
+#include <Arduino.h>
+
+{}"""
 
+
+def write_binary_blobs():
+    path = CORE.relative_src_path(BINARY_BLOBS_CPP_TARGET)
+    if not CORE.binary_blob_statements:
+        get_manifest().remove(path)
+        return
+    get_manifest().write_file(path,
+                              BINARY_BLOBS_CPP_FORMAT.format(CORE.cpp_binary_blob_section))
+
+
+SETUP_DIR = 'setup'
+SETUP_GLOBALS_H = 'main_globals.h'
+SETUP_GLOBALS_H_FORMAT = u"""\
+// Auto generated code by esphome
+// The global variables of main.cpp, for the setup code in this directory.
+#pragma once
+#include "esphome.h"
+{}"""
+SETUP_CPP_FORMAT = u"""\
+// Auto generated code by esphome
+#include "{}"
+{}"""
+SETUP_FUNCTION_FORMAT = u"""
+void {}() {{
+{}
+}}
+"""
+
+
+def _local_variable_name(statement_):
+    """Return the name of the variable the statement declares inside setup(), if any."""
+    from esphome.cpp_generator import AssignmentExpression, ExpressionStatement
+
+    if not isinstance(statement_, ExpressionStatement):
+        return None
+    expression = statement_.expression
+    if isinstance(expression, AssignmentExpression) and expression.type is not None:
+        return text_type(expression.name)
+    return None
+
+
+def split_setup_code(statements, units):
+    """Split the statements of setup() into runs of statements of the same unit.
+
+    Returns a list of (unit, statement texts) in the original order of the
+    statements. A run ends when a statement of another unit follows, so running
+    the runs one after another does exactly what the unsplit setup() did.
+
+    Runs are merged if one uses a local variable that an earlier run declared,
+    the merged run belongs to the unit of the first one.
+    """
+    from esphome.cpp_generator import statement
+
+    texts = [text_type(statement(x)).rstrip() for x in statements]
+    # [unit, start, end] of the runs and the index of the run of each statement
+    runs = []
+    run_of = []
+    for unit in units:
+        if runs and runs[-1][0] == unit:
+            runs[-1][2] += 1
+        else:
+            runs.append([unit, len(run_of), len(run_of) + 1])
+        run_of.append(len(runs) - 1)
+
+    # The last run that uses a local variable declared in each run
+    reach = list(range(len(runs)))
+    for i, statement_ in enumerate(statements):
+        name = _local_variable_name(statement_)
+        if name is None:
+            continue
+        run = run_of[i]
+        pattern = re.compile(r'\b{}\b'.format(re.escape(name)))
+        for j in range(len(texts) - 1, runs[run][2] - 1, -1):
+            if pattern.search(texts[j]) is not None:
+                reach[run] = max(reach[run], run_of[j])
+                break
+
+    result = []
+    i = 0
+    while i < len(runs):
+        last = reach[i]
+        j = i
+        while j < last:
+            j += 1
+            last = max(last, reach[j])
+        unit = runs[i][0]
+        run_texts = texts[runs[i][1]:runs[last][2]]
+        if result and result[-1][0] == unit:
+            result[-1][1].extend(run_texts)
+        else:
+            result.append((unit, run_texts))
+        i = last + 1
+    return result
+
+
+def _setup_unit_name(unit):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', unit)
+
+
+def _global_declaration(statement_):
+    """Return the declaration of the global defined by statement_ for other source files."""
+    from esphome.cpp_generator import ExpressionStatement, VariableDeclarationExpression
+
+    if isinstance(statement_, ExpressionStatement) and \
+            isinstance(statement_.expression, VariableDeclarationExpression):
+        return u'extern {}'.format(statement_)
+    return text_type(statement_).rstrip()
+
+
+def _split_setup_enabled():
+    # Headers of the user are included in every source file that sees the globals. They
+    # may define functions or variables which must only be compiled once.
+    return not CORE.config[CONF_ESPHOME].get(CONF_INCLUDES)
+
+
+def write_setup_units(setup_code):
+    """Write the runs of split_setup_code that belong to a unit to their own source files.
+
+    Each unit gets a file in src/setup/ with a function for each of its runs. Returns
+    the text of the body of setup(), with the calls of these functions in place of
+    the runs, and the declarations of the functions.
+    """
+    manifest = get_manifest()
+    setup_dir = CORE.relative_src_path(SETUP_DIR)
+    main_code = []
+    declarations = []
+    functions = {}
+    for unit, texts in setup_code:
+        if unit is None:
+            main_code.extend(texts)
+            continue
+        name = _setup_unit_name(unit)
+        unit_functions = functions.setdefault(name, [])
+        function_name = u'setup_{}_{}'.format(name, len(unit_functions))
+        unit_functions.append(SETUP_FUNCTION_FORMAT.format(function_name,
+                                                           indent(u'\n'.join(texts))))
+        main_code.append(u'{}();'.format(function_name))
+        declarations.append(u'void {}();'.format(function_name))
+
+    paths = set()
+    if functions:
+        globals_s = u'\n'.join(_global_declaration(x) for x in CORE.global_statements)
+        manifest.write_file(os.path.join(setup_dir, SETUP_GLOBALS_H),
+                            SETUP_GLOBALS_H_FORMAT.format(globals_s + u'\n'))
+        paths.add(os.path.join(setup_dir, SETUP_GLOBALS_H))
+    for name, unit_functions in functions.items():
+        path = os.path.join(setup_dir, name + u'.cpp')
+        manifest.write_file(path, SETUP_CPP_FORMAT.format(SETUP_GLOBALS_H,
+                                                          u''.join(unit_functions)))
+        paths.add(path)
+    for path in walk_files(setup_dir):
+        if path not in paths:
+            # Unit was removed from the configuration
+            manifest.remove(path)
+
+    main_s = u'\n'.join(main_code) + u'\n\n'
+    declarations_s = u''.join(x + u'\n' for x in declarations)
+    return main_s, declarations_s
+
+
+def write_cpp():
+    profiling.step(u'copy_src_tree')
     copy_src_tree()
+    profiling.step(u'write_binary_blobs')
+    write_binary_blobs()
+    profiling.step(u'precompiled header')
+    write_precompiled_header()
+    profiling.step(u'setup units')
+    units = CORE.main_statement_units
+    if not _split_setup_enabled():
+        units = [None] * len(units)
+    setup_code = split_setup_code(CORE.main_statements, units)
+    main_s, declarations_s = write_setup_units(setup_code)
+    code_s = indent(main_s)
+    profiling.step(u'main.cpp')
     global_s = u'#include "esphome.h"\n'
     global_s += CORE.cpp_global_section
+    global_s += declarations_s
+
+    path = CORE.relative_src_path('main.cpp')
+    manifest = get_manifest()
+    if not manifest.is_current(path, [global_s, code_s]):
+        if os.path.isfile(path):
+            text = read_file(path)
+            code_format = find_begin_end(text, CPP_AUTO_GENERATE_BEGIN, CPP_AUTO_GENERATE_END)
+            code_format_ = find_begin_end(code_format[0], CPP_INCLUDE_BEGIN, CPP_INCLUDE_END)
+            code_format = (code_format_[0], code_format_[1], code_format[1])
+        else:
+            code_format = CPP_BASE_FORMAT
 
-    full_file = code_format[0] + CPP_INCLUDE_BEGIN + u'\n' + global_s + CPP_INCLUDE_END
-    full_file += code_format[1] + CPP_AUTO_GENERATE_BEGIN + u'\n' + code_s + CPP_AUTO_GENERATE_END
-    full_file += code_format[2]
-    write_file_if_changed(path, full_file)
+        full_file = code_format[0] + CPP_INCLUDE_BEGIN + u'\n' + global_s + CPP_INCLUDE_END
+        full_file += code_format[1] + CPP_AUTO_GENERATE_BEGIN + u'\n' + code_s
+        full_file += CPP_AUTO_GENERATE_END + code_format[2]
+        manifest.write_file(path, full_file, inputs=[global_s, code_s])
+    manifest.save()
 
 
 def clean_build():
@@ -2,6 +2,8 @@ from __future__ import print_function
 
 import fnmatch
 import functools
+import hashlib
+import io
 import logging
 import math
 import os
@@ -11,9 +13,9 @@ import yaml
 import yaml.constructor
 
 from esphome import core
-from esphome.config_helpers import read_config_file
+from esphome.config_helpers import is_editor_file, read_config_file
 from esphome.core import EsphomeError, IPAddress, Lambda, MACAddress, TimePeriod, DocumentRange
-from esphome.py_compat import text_type, IS_PY2
+from esphome.py_compat import encode_text, text_type, IS_PY2
 from esphome.util import OrderedDict, filter_yaml_files
 
 _LOGGER = logging.getLogger(__name__)
@@ -22,8 +24,18 @@ _LOGGER = logging.getLogger(__name__)
 # let's not reinvent the wheel here
 
 SECRET_YAML = u'secrets.yaml'
-_SECRET_CACHE = {}
 _SECRET_VALUES = {}
+# The files, include directories and environment variables the last load_yaml call read
+_LOADED_FILES = set()
+_LOADED_DIRS = set()
+_LOADED_ENV_VARS = {}
+# Parsed files by absolute path, see _load_cached
+_PARSE_CACHE = {}
+# The cache entries of the files that are currently being parsed, innermost last
+_PARSE_STACK = []
+_KEEP_PARSE_CACHE = False
+# Incremented by every load_yaml call, entries are only validated once per load
+_LOAD_GENERATION = 0
 
 
 class NodeListClass(list):
@@ -102,32 +114,36 @@ def _add_data_ref(fn):
     return wrapped
 
 
-class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
-    """Loader class that keeps track of line numbers."""
+class ESPHomeLoaderMixin(object):
+    """Constructors of the ESPHome loaders that keep track of line numbers.
+
+    These only work on the node level, so they're shared by the pure python
+    loader and the one based on the libyaml parser.
+    """
 
     @_add_data_ref
     def construct_yaml_int(self, node):
-        return super(ESPHomeLoader, self).construct_yaml_int(node)
+        return super(ESPHomeLoaderMixin, self).construct_yaml_int(node)
 
     @_add_data_ref
     def construct_yaml_float(self, node):
-        return super(ESPHomeLoader, self).construct_yaml_float(node)
+        return super(ESPHomeLoaderMixin, self).construct_yaml_float(node)
 
     @_add_data_ref
     def construct_yaml_binary(self, node):
-        return super(ESPHomeLoader, self).construct_yaml_binary(node)
+        return super(ESPHomeLoaderMixin, self).construct_yaml_binary(node)
 
     @_add_data_ref
     def construct_yaml_omap(self, node):
-        return super(ESPHomeLoader, self).construct_yaml_omap(node)
+        return super(ESPHomeLoaderMixin, self).construct_yaml_omap(node)
 
     @_add_data_ref
     def construct_yaml_str(self, node):
-        return super(ESPHomeLoader, self).construct_yaml_str(node)
+        return super(ESPHomeLoaderMixin, self).construct_yaml_str(node)
 
     @_add_data_ref
     def construct_yaml_seq(self, node):
-        return super(ESPHomeLoader, self).construct_yaml_seq(node)
+        return super(ESPHomeLoaderMixin, self).construct_yaml_seq(node)
 
     def custom_flatten_mapping(self, node):
         pre_merge = []
@@ -225,6 +241,7 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
     @_add_data_ref
     def construct_env_var(self, node):
         args = node.value.split()
+        _track_env_var(args[0], os.environ.get(args[0]))
         # Check for a default value
         if len(args) > 1:
             return os.getenv(args[0], u' '.join(args[1:]))
@@ -242,16 +259,23 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
     def _rel_path(self, *args):
         return os.path.join(self._directory, *args)
 
+    def _include_dir_files(self, directory):
+        path = self._rel_path(directory)
+        files = list_include_dir(path)
+        _track_dir(os.path.abspath(path), files)
+        return files
+
     @_add_data_ref
     def construct_secret(self, node):
-        secrets = _load_yaml_internal(self._rel_path(SECRET_YAML))
+        # Only a single value is used, so don't copy the whole secrets file
+        secrets = _load_cached(self._rel_path(SECRET_YAML))
         if node.value not in secrets:
             raise yaml.MarkedYAMLError(
                 context=u"Secret '{}' not defined".format(node.value),
                 context_mark=node.start_mark
             )
-        val = secrets[node.value]
-        _SECRET_VALUES[text_type(val)] = node.value
+        val = _copy_data(secrets[node.value])
+        _track_secret(text_type(val), node.value)
         return val
 
     @_add_data_ref
@@ -260,12 +284,12 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
 
     @_add_data_ref
     def construct_include_dir_list(self, node):
-        files = filter_yaml_files(_find_files(self._rel_path(node.value), '*.yaml'))
+        files = self._include_dir_files(node.value)
         return [_load_yaml_internal(f) for f in files]
 
     @_add_data_ref
     def construct_include_dir_merge_list(self, node):
-        files = filter_yaml_files(_find_files(self._rel_path(node.value), '*.yaml'))
+        files = self._include_dir_files(node.value)
         merged_list = []
         for fname in files:
             loaded_yaml = _load_yaml_internal(fname)
@@ -275,7 +299,7 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
 
     @_add_data_ref
     def construct_include_dir_named(self, node):
-        files = filter_yaml_files(_find_files(self._rel_path(node.value), '*.yaml'))
+        files = self._include_dir_files(node.value)
         mapping = OrderedDict()
         for fname in files:
             filename = os.path.splitext(os.path.basename(fname))[0]
@@ -284,7 +308,7 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
 
     @_add_data_ref
     def construct_include_dir_merge_named(self, node):
-        files = filter_yaml_files(_find_files(self._rel_path(node.value), '*.yaml'))
+        files = self._include_dir_files(node.value)
         mapping = OrderedDict()
         for fname in files:
             loaded_yaml = _load_yaml_internal(fname)
@@ -297,41 +321,255 @@ class ESPHomeLoader(yaml.SafeLoader):  # pylint: disable=too-many-ancestors
         return Lambda(text_type(node.value))
 
 
-ESPHomeLoader.add_constructor(u'tag:yaml.org,2002:int', ESPHomeLoader.construct_yaml_int)
-ESPHomeLoader.add_constructor(u'tag:yaml.org,2002:float', ESPHomeLoader.construct_yaml_float)
-ESPHomeLoader.add_constructor(u'tag:yaml.org,2002:binary', ESPHomeLoader.construct_yaml_binary)
-ESPHomeLoader.add_constructor(u'tag:yaml.org,2002:omap', ESPHomeLoader.construct_yaml_omap)
-ESPHomeLoader.add_constructor(u'tag:yaml.org,2002:str', ESPHomeLoader.construct_yaml_str)
-ESPHomeLoader.add_constructor(u'tag:yaml.org,2002:seq', ESPHomeLoader.construct_yaml_seq)
-ESPHomeLoader.add_constructor(u'tag:yaml.org,2002:map', ESPHomeLoader.construct_yaml_map)
-ESPHomeLoader.add_constructor('!env_var', ESPHomeLoader.construct_env_var)
-ESPHomeLoader.add_constructor('!secret', ESPHomeLoader.construct_secret)
-ESPHomeLoader.add_constructor('!include', ESPHomeLoader.construct_include)
-ESPHomeLoader.add_constructor('!include_dir_list', ESPHomeLoader.construct_include_dir_list)
-ESPHomeLoader.add_constructor('!include_dir_merge_list',
-                              ESPHomeLoader.construct_include_dir_merge_list)
-ESPHomeLoader.add_constructor('!include_dir_named', ESPHomeLoader.construct_include_dir_named)
-ESPHomeLoader.add_constructor('!include_dir_merge_named',
-                              ESPHomeLoader.construct_include_dir_merge_named)
-ESPHomeLoader.add_constructor('!lambda', ESPHomeLoader.construct_lambda)
+# pylint: disable=too-many-ancestors
+class ESPHomeLoader(ESPHomeLoaderMixin, yaml.SafeLoader):
+    """Loader based on the pure python YAML parser."""
+
+
+if yaml.__with_libyaml__:
+    class ESPHomeCLoader(ESPHomeLoaderMixin, yaml.CSafeLoader):
+        """Loader based on the libyaml parser, several times faster than ESPHomeLoader."""
+else:
+    ESPHomeCLoader = None
+
+LOADERS = [x for x in (ESPHomeLoader, ESPHomeCLoader) if x is not None]
+# The loader class used by load_yaml, the fastest one that is available
+LOADER_CLASS = LOADERS[-1]
+
+
+def _add_constructors(loader_cls):
+    for tag, name in [
+            (u'tag:yaml.org,2002:int', 'construct_yaml_int'),
+            (u'tag:yaml.org,2002:float', 'construct_yaml_float'),
+            (u'tag:yaml.org,2002:binary', 'construct_yaml_binary'),
+            (u'tag:yaml.org,2002:omap', 'construct_yaml_omap'),
+            (u'tag:yaml.org,2002:str', 'construct_yaml_str'),
+            (u'tag:yaml.org,2002:seq', 'construct_yaml_seq'),
+            (u'tag:yaml.org,2002:map', 'construct_yaml_map'),
+            ('!env_var', 'construct_env_var'),
+            ('!secret', 'construct_secret'),
+            ('!include', 'construct_include'),
+            ('!include_dir_list', 'construct_include_dir_list'),
+            ('!include_dir_merge_list', 'construct_include_dir_merge_list'),
+            ('!include_dir_named', 'construct_include_dir_named'),
+            ('!include_dir_merge_named', 'construct_include_dir_merge_named'),
+            ('!lambda', 'construct_lambda'),
+    ]:
+        loader_cls.add_constructor(tag, getattr(loader_cls, name))
+
+
+for _loader_cls in LOADERS:
+    _add_constructors(_loader_cls)
 
 
 def load_yaml(fname):
+    global _LOAD_GENERATION  # pylint: disable=global-statement
+
     _SECRET_VALUES.clear()
-    _SECRET_CACHE.clear()
+    _LOADED_FILES.clear()
+    _LOADED_DIRS.clear()
+    _LOADED_ENV_VARS.clear()
+    _LOAD_GENERATION += 1
+    if not _KEEP_PARSE_CACHE:
+        _PARSE_CACHE.clear()
     return _load_yaml_internal(fname)
 
 
-def _load_yaml_internal(fname):
-    content = read_config_file(fname)
-    loader = ESPHomeLoader(content)
+def keep_parse_cache(keep=True):
+    """Keep parsed files across load_yaml calls.
+
+    By default every load_yaml call starts with an empty parse cache. Long-lived
+    processes that load several configurations or the same one repeatedly can keep
+    it instead: entries are checked against the modification time of all files they
+    were parsed from before being reused.
+    """
+    global _KEEP_PARSE_CACHE  # pylint: disable=global-statement
+
+    _KEEP_PARSE_CACHE = keep
+    if not keep:
+        _PARSE_CACHE.clear()
+
+
+def invalidate_parse_cache(path=None):
+    """Drop path and every file that includes it from the parse cache, all files if None.
+
+    Needed when the content of a file changes without its modification time changing,
+    for example when the content comes from an editor buffer.
+    """
+    if path is None:
+        _PARSE_CACHE.clear()
+        return
+    path = os.path.abspath(path)
+    for key, entry in list(_PARSE_CACHE.items()):
+        if path in entry.files or path in entry.dirs:
+            del _PARSE_CACHE[key]
+
+
+def loaded_dependencies():
+    """Return the files, directories and environment variables the last load_yaml call used.
+
+    Directories are the ones scanned by the !include_dir_* tags, environment variables
+    map to their value (or None if they were not set).
+    """
+    return sorted(_LOADED_FILES), sorted(_LOADED_DIRS), dict(_LOADED_ENV_VARS)
+
+
+def list_include_dir(directory):
+    """Return the YAML files an !include_dir_* tag would load from directory."""
+    return filter_yaml_files(_find_files(directory, '*.yaml'))
+
+
+def _create_loader(content, fname):
+    loader_cls = LOADER_CLASS
+    if loader_cls is ESPHomeCLoader:
+        # libyaml takes the document name for the marks from the stream
+        stream = io.StringIO(text_type(content))
+        stream.name = fname
+        loader = loader_cls(stream)
+    else:
+        loader = loader_cls(content)
     loader.name = fname
+    return loader
+
+
+class _ParseCacheEntry(object):
+    """A parsed file and everything the result depends on."""
+
+    def __init__(self):
+        self.data = None
+        self.generation = _LOAD_GENERATION
+        # The file itself and all (transitively) included files mapped to their stamp
+        self.files = {}
+        # Scanned !include_dir_* directories mapped to the files they contained
+        self.dirs = {}
+        self.env_vars = {}
+        self.secret_values = {}
+
+    def is_valid(self):
+        if self.generation == _LOAD_GENERATION:
+            return True
+        if any(_file_stamp(path) != stamp for path, stamp in self.files.items()):
+            return False
+        if any(list_include_dir(path) != files for path, files in self.dirs.items()):
+            return False
+        if any(os.environ.get(name) != value for name, value in self.env_vars.items()):
+            return False
+        self.generation = _LOAD_GENERATION
+        return True
+
+
+def _content_stamp(content):
+    return hashlib.sha1(encode_text(content)).hexdigest()
+
+
+def _file_stamp(path):
+    if is_editor_file(path):
+        # The editor buffer may differ from the file on disk
+        try:
+            return _content_stamp(read_config_file(path))
+        except EsphomeError:
+            return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+def _track_file(path, stamp):
+    _LOADED_FILES.add(path)
+    for entry in _PARSE_STACK:
+        entry.files[path] = stamp
+
+
+def _track_dir(path, files):
+    _LOADED_DIRS.add(path)
+    for entry in _PARSE_STACK:
+        entry.dirs[path] = files
+
+
+def _track_env_var(name, value):
+    _LOADED_ENV_VARS[name] = value
+    for entry in _PARSE_STACK:
+        entry.env_vars[name] = value
+
+
+def _track_secret(value, name):
+    _SECRET_VALUES[value] = name
+    for entry in _PARSE_STACK:
+        entry.secret_values[value] = name
+
+
+def _copy_data(value):
+    """Copy the containers and lambdas of loaded data, other scalars are immutable and shared.
+
+    Lambdas are copied too, the substitution pass replaces their value in place.
+    """
+    if isinstance(value, dict):
+        res = type(value)()
+        for key, val in value.items():
+            res[key] = _copy_data(val)
+    elif isinstance(value, list):
+        res = type(value)(_copy_data(x) for x in value)
+    elif isinstance(value, tuple):
+        # The pairs of !!omap
+        return tuple(_copy_data(x) for x in value)
+    elif isinstance(value, Lambda):
+        res = type(value)(value)
+    else:
+        return value
+    if isinstance(value, ESPHomeDataBase):
+        # Only the esp_range, the __dict__ of the pure python OrderedDict of python 2 also
+        # holds its linked list of keys
+        res._esp_range = value.esp_range  # pylint: disable=protected-access
+    return res
+
+
+def _load_cached(fname):
+    """Parse fname or take it from the parse cache, the result must not be modified.
+
+    A file like secrets.yaml or a shared include is often referenced many times
+    by one configuration, it's only read and parsed once per load.
+    """
+    path = os.path.abspath(fname)
+    entry = _PARSE_CACHE.get(path)
+    if entry is not None and entry.is_valid():
+        for file_path, stamp in entry.files.items():
+            _track_file(file_path, stamp)
+        for dir_path, files in entry.dirs.items():
+            _track_dir(dir_path, files)
+        for name, value in entry.env_vars.items():
+            _track_env_var(name, value)
+        for value, name in entry.secret_values.items():
+            _track_secret(value, name)
+        return entry.data
+
+    entry = _ParseCacheEntry()
+    _PARSE_STACK.append(entry)
     try:
-        return loader.get_single_data() or OrderedDict()
-    except yaml.YAMLError as exc:
-        raise EsphomeError(exc)
+        if is_editor_file(fname):
+            content = read_config_file(fname)
+            stamp = _content_stamp(content)
+        else:
+            # Stamp before reading so that a concurrent modification invalidates the entry
+            stamp = _file_stamp(path)
+            content = read_config_file(fname)
+        _track_file(path, stamp)
+        loader = _create_loader(content, fname)
+        try:
+            entry.data = loader.get_single_data() or OrderedDict()
+        except yaml.YAMLError as exc:
+            raise EsphomeError(exc)
+        finally:
+            loader.dispose()
     finally:
-        loader.dispose()
+        _PARSE_STACK.pop()
+    _PARSE_CACHE[path] = entry
+    return entry.data
+
+
+def _load_yaml_internal(fname):
+    return _copy_data(_load_cached(fname))
 
 
 def dump(dict_):
@@ -142,6 +142,8 @@ class DNSRecord(DNSEntry):
     def __init__(self, name, type_, class_, ttl):
         DNSEntry.__init__(self, name, type_, class_)
         self.ttl = 15
+        # The TTL the record was sent with, 0 for goodbye records
+        self.sent_ttl = ttl
         self.created = time.time()
 
     def write(self, out):
@@ -647,49 +649,55 @@ def new_socket():
     return s
 
 
+def create_sockets():
+    """Create the socket to receive mDNS packets and one socket per interface to send them."""
+    listen_socket = new_socket()
+    interfaces = get_all_addresses()
+
+    respond_sockets = []
+
+    for i in interfaces:
+        try:
+            _value = socket.inet_aton(_MDNS_ADDR) + socket.inet_aton(i)
+            listen_socket.setsockopt(
+                socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _value)
+        except socket.error as e:
+            _errno = e.args[0]
+            if _errno == errno.EADDRINUSE:
+                log.info(
+                    'Address in use when adding %s to multicast group, '
+                    'it is expected to happen on some systems', i,
+                )
+            elif _errno == errno.EADDRNOTAVAIL:
+                log.info(
+                    'Address not available when adding %s to multicast '
+                    'group, it is expected to happen on some systems', i,
+                )
+                continue
+            elif _errno == errno.EINVAL:
+                log.info(
+                    'Interface of %s does not support multicast, '
+                    'it is expected in WSL', i
+                )
+                continue
+
+            else:
+                raise
+
+        respond_socket = new_socket()
+        respond_socket.setsockopt(
+            socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(i))
+
+        respond_sockets.append(respond_socket)
+    return listen_socket, respond_sockets
+
+
 class Zeroconf(QuietLogger):
     def __init__(self):
         # hook for threads
         self._GLOBAL_DONE = False
 
-        self._listen_socket = new_socket()
-        interfaces = get_all_addresses()
-
-        self._respond_sockets = []
-
-        for i in interfaces:
-            try:
-                _value = socket.inet_aton(_MDNS_ADDR) + socket.inet_aton(i)
-                self._listen_socket.setsockopt(
-                    socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _value)
-            except socket.error as e:
-                _errno = e.args[0]
-                if _errno == errno.EADDRINUSE:
-                    log.info(
-                        'Address in use when adding %s to multicast group, '
-                        'it is expected to happen on some systems', i,
-                    )
-                elif _errno == errno.EADDRNOTAVAIL:
-                    log.info(
-                        'Address not available when adding %s to multicast '
-                        'group, it is expected to happen on some systems', i,
-                    )
-                    continue
-                elif _errno == errno.EINVAL:
-                    log.info(
-                        'Interface of %s does not support multicast, '
-                        'it is expected in WSL', i
-                    )
-                    continue
-
-                else:
-                    raise
-
-            respond_socket = new_socket()
-            respond_socket.setsockopt(
-                socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(i))
-
-            self._respond_sockets.append(respond_socket)
+        self._listen_socket, self._respond_sockets = create_sockets()
 
         self.listeners = []
 
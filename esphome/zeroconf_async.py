@@ -0,0 +1,390 @@
+"""asyncio mDNS engine with a record cache shared by all lookups of the process.
+
+The blocking implementation in esphome.zeroconf opens new sockets and a new
+listener for every lookup and rebuilds its whole cache on every received record.
+Here a single engine runs on its own event loop thread for the whole process:
+
+- Received records go into a cache indexed by name and type. Each record expires
+  after the TTL its sender gave, capped at MAX_TTL. The expiry times are kept in
+  a heap, so each expiry costs O(log n) and nothing is ever purged in bulk.
+- Questions asked within a few milliseconds of each other are sent together, as
+  multi-question packets for many hosts, instead of one packet per host.
+- Concurrent lookups of the same host share their queries and the answer.
+  Lookups of hosts that answered recently are served from the cache.
+
+The dashboard status, helpers.resolve_ip_address and with it the OTA and native
+API clients all use the engine returned by get_engine().
+
+This module requires python 3.5+, use esphome.zeroconf on python 2.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import socket
+import threading
+
+from esphome.core import EsphomeError
+from esphome.zeroconf import DNSAddress, DNSIncoming, DNSOutgoing, DNSQuestion, DNSText, \
+    _CLASS_IN, _FLAGS_QR_QUERY, _MAX_MSG_ABSOLUTE, _MDNS_ADDR, _MDNS_PORT, _TYPE_A, \
+    create_sockets
+
+_LOGGER = logging.getLogger(__name__)
+
+# How long to collect questions before sending them in one batch
+BATCH_DELAY = 0.005
+# Stay below the typical MTU, the questions of a batch are split into several packets
+_MAX_QUERY_SIZE = 1400
+# Timeouts between retries of a lookup, doubled after every try
+_FIRST_RETRY_DELAY = 0.2
+# Records are kept at most this many seconds. Devices announce their A records with
+# a TTL of 120 seconds, the dashboard should notice a device that went away without
+# sending a goodbye record sooner than that.
+MAX_TTL = 30.0
+
+
+def _record_data(record):
+    if isinstance(record, DNSAddress):
+        return record.address
+    if isinstance(record, DNSText):
+        return record.text
+    return None
+
+
+def record_ttl(record):
+    """Return how long record is cached, the TTL it was sent with capped at MAX_TTL."""
+    return min(record.sent_ttl, MAX_TTL)
+
+
+class RecordCache(object):
+    """mDNS records by name and type, each until its TTL runs out (see record_ttl).
+
+    Names are stored lower case with the trailing dot. All times are in the clock
+    of the event loop.
+    """
+    def __init__(self):
+        # (name, type) -> {record data: (record, expiry time)}
+        self._records = {}
+        # (expiry time, sequence, (name, type), record data). Entries of refreshed
+        # records stay in the heap until they come up and are skipped then.
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, record, now):
+        """Add or refresh a record, returns True if there were no records of its name and type."""
+        data = _record_data(record)
+        if data is None:
+            return False
+        key = (record.key, record.type)
+        records = self._records.get(key)
+        is_new = not records
+        expires = now + record_ttl(record)
+        if records is None:
+            records = self._records[key] = {}
+        records[data] = (record, expires)
+        heapq.heappush(self._heap, (expires, next(self._sequence), key, data))
+        return is_new
+
+    def remove(self, record):
+        """Remove a record, returns True if it was the last one of its name and type."""
+        key = (record.key, record.type)
+        records = self._records.get(key)
+        if not records or records.pop(_record_data(record), None) is None:
+            return False
+        if not records:
+            del self._records[key]
+            return True
+        return False
+
+    def get(self, name, type_):
+        """Return the records of name and type that have not expired."""
+        records = self._records.get((name.lower(), type_))
+        if not records:
+            return []
+        return [record for record, _ in records.values()]
+
+    def remaining(self, name, type_, now):
+        """Return how long the longest living record of name and type is still valid."""
+        records = self._records.get((name.lower(), type_))
+        if not records:
+            return 0
+        return max(expires for _, expires in records.values()) - now
+
+    def next_expiry(self):
+        return self._heap[0][0] if self._heap else None
+
+    def expire(self, now):
+        """Remove all expired records, returns the (name, type) keys that have no records left."""
+        emptied = []
+        while self._heap and self._heap[0][0] <= now:
+            expires, _, key, data = heapq.heappop(self._heap)
+            records = self._records.get(key)
+            if not records or data not in records or records[data][1] != expires:
+                # Removed or refreshed since
+                continue
+            del records[data]
+            if not records:
+                del self._records[key]
+                emptied.append(key)
+        return emptied
+
+
+class _ReceiveProtocol(asyncio.DatagramProtocol):
+    def __init__(self, engine):
+        self.engine = engine
+
+    def datagram_received(self, data, addr):
+        self.engine.handle_packet(data)
+
+    def error_received(self, exc):
+        _LOGGER.debug("mDNS receive error: %s", exc)
+
+
+class ZeroconfEngine(object):
+    """The mDNS sockets and record cache of the process, run on a dedicated event loop.
+
+    The methods starting with async_ and the listeners run on the loop of the engine,
+    all others can be called from any thread.
+    """
+    def __init__(self):
+        try:
+            self._listen_socket, self._respond_sockets = create_sockets()
+        except Exception:
+            raise EsphomeError("Cannot start mDNS sockets, is this a docker container without "
+                               "host network mode?")
+        for sock in self._respond_sockets:
+            sock.setblocking(False)
+        self.loop = asyncio.SelectorEventLoop()
+        self.cache = RecordCache()
+        # Called with the (name, type) keys that got their first record and the ones that
+        # lost their last record
+        self.listeners = []
+        self._waiters = {}
+        self._pending_questions = set()
+        self._flush_handle = None
+        self._expiry_handle = None
+        self._transport = None
+        self.packets_sent = 0
+        self._thread = threading.Thread(target=self._run, name='zeroconf-async')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self._listen_socket.setblocking(False)
+        self._transport, _ = self.loop.run_until_complete(self.loop.create_datagram_endpoint(
+            lambda: _ReceiveProtocol(self), sock=self._listen_socket))
+        self.loop.run_forever()
+        self._transport.close()
+        for sock in self._respond_sockets:
+            sock.close()
+        self.loop.close()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    def run_coroutine(self, coro):
+        """Run coro on the loop of the engine, returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def handle_packet(self, data):
+        msg = DNSIncoming(data)
+        if not msg.valid or msg.is_query():
+            return
+        now = self.loop.time()
+        added = []
+        removed = []
+        for record in msg.answers:
+            if record.sent_ttl == 0:
+                # Goodbye record, the device announced it's going away
+                if self.cache.remove(record):
+                    removed.append((record.key, record.type))
+                continue
+            if self.cache.add(record, now):
+                added.append((record.key, record.type))
+            if record.type == _TYPE_A:
+                for waiter in self._waiters.pop(record.key, []):
+                    if not waiter.done():
+                        waiter.set_result(socket.inet_ntoa(record.address))
+        if added or removed:
+            self._notify(added, removed)
+        self._schedule_expiry()
+
+    def _notify(self, added, removed):
+        for listener in list(self.listeners):
+            try:
+                listener(added, removed)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Error in mDNS listener")
+
+    def _schedule_expiry(self):
+        next_expiry = self.cache.next_expiry()
+        if self._expiry_handle is not None:
+            if next_expiry is not None and self._expiry_handle.when() <= next_expiry:
+                return
+            self._expiry_handle.cancel()
+            self._expiry_handle = None
+        if next_expiry is not None:
+            self._expiry_handle = self.loop.call_at(next_expiry, self._expire)
+
+    def _expire(self):
+        self._expiry_handle = None
+        removed = self.cache.expire(self.loop.time())
+        if removed:
+            self._notify([], removed)
+        self._schedule_expiry()
+
+    def async_request(self, names):
+        """Ask for the A records of names, batched with the other questions of this moment."""
+        self._pending_questions.update(names)
+        if self._flush_handle is None and self._pending_questions:
+            self._flush_handle = self.loop.call_later(BATCH_DELAY, self._flush_questions)
+
+    def request(self, names):
+        self.call_soon(self.async_request, list(names))
+
+    def _flush_questions(self):
+        self._flush_handle = None
+        names = sorted(self._pending_questions)
+        self._pending_questions.clear()
+        out = DNSOutgoing(_FLAGS_QR_QUERY)
+        size = 12
+        for name in names:
+            # Upper bound, the shared suffixes are compressed
+            question_size = len(name.encode('utf-8')) + 6
+            if out.questions and size + question_size > _MAX_QUERY_SIZE:
+                self._send(out)
+                out = DNSOutgoing(_FLAGS_QR_QUERY)
+                size = 12
+            out.add_question(DNSQuestion(name, _TYPE_A, _CLASS_IN))
+            size += question_size
+        if out.questions:
+            self._send(out)
+
+    def _send(self, out):
+        packet = out.packet()
+        assert len(packet) <= _MAX_MSG_ABSOLUTE
+        self.packets_sent += 1
+        for sock in self._respond_sockets:
+            try:
+                sock.sendto(packet, (_MDNS_ADDR, _MDNS_PORT))
+            except OSError as err:
+                _LOGGER.debug("Error sending mDNS query: %s", err)
+
+    async def async_resolve(self, host, timeout=3.0):
+        """Resolve the .local host name (with trailing dot) to an IPv4 address, None on timeout."""
+        name = host.lower()
+        records = self.cache.get(name, _TYPE_A)
+        if records:
+            return socket.inet_ntoa(records[0].address)
+
+        waiter = self.loop.create_future()
+        self._waiters.setdefault(name, []).append(waiter)
+        deadline = self.loop.time() + timeout
+        delay = _FIRST_RETRY_DELAY
+        try:
+            while True:
+                self.async_request([name])
+                remaining = deadline - self.loop.time()
+                if remaining <= 0:
+                    return None
+                done, _ = await asyncio.wait([waiter], timeout=min(delay, remaining))
+                if done:
+                    return waiter.result()
+                delay *= 2
+        finally:
+            waiters = self._waiters.get(name)
+            if waiters is not None and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[name]
+
+    def resolve(self, host, timeout=3.0):
+        """Blocking version of async_resolve for other threads."""
+        return self.run_coroutine(self.async_resolve(host, timeout)).result()
+
+
+_ENGINE = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_engine():  # type: () -> ZeroconfEngine
+    """Return the mDNS engine of the process, starting it on first use."""
+    global _ENGINE
+    with _ENGINE_LOCK:
+        if _ENGINE is None:
+            _ENGINE = ZeroconfEngine()
+        return _ENGINE
+
+
+class DashboardStatus(object):
+    """Track which of the hosts of the dashboard answer mDNS queries.
+
+    A host is online while the cache has an A record for it. request_query re-asks
+    only for the hosts without a record or whose records are past half their TTL,
+    all in batched packets. on_update is called from the engine thread, only with the
+    keys whose status changed.
+    """
+    def __init__(self, engine, on_update):
+        self.engine = engine
+        self.on_update = on_update
+        self.key_to_host = {}
+        self.host_keys = {}
+        self.status = {}
+
+    def start(self):
+        self.engine.call_soon(self.engine.listeners.append, self._on_change)
+
+    def stop(self):
+        self.engine.call_soon(self.engine.listeners.remove, self._on_change)
+
+    def request_query(self, hosts):
+        """Track hosts, a dict of keys to their host names (with trailing dot)."""
+        self.engine.call_soon(self._request_query, dict(hosts))
+
+    def _request_query(self, hosts):
+        self.key_to_host = hosts
+        self.host_keys = {}
+        for key, host in hosts.items():
+            self.host_keys.setdefault(host.lower(), []).append(key)
+        self.status = {key: online for key, online in self.status.items() if key in hosts}
+        self._update(list(hosts))
+
+        now = self.engine.loop.time()
+        stale = []
+        for host in self.host_keys:
+            records = self.engine.cache.get(host, _TYPE_A)
+            if not records or self.engine.cache.remaining(host, _TYPE_A, now) < \
+                    record_ttl(records[0]) / 2.0:
+                stale.append(host)
+        self.engine.async_request(stale)
+
+    def _on_change(self, added, removed):
+        keys = []
+        for name, type_ in added + removed:
+            if type_ == _TYPE_A:
+                keys.extend(self.host_keys.get(name, []))
+        if keys:
+            self._update(keys)
+
+    def _update(self, keys):
+        changed = {}
+        for key in keys:
+            online = bool(self.engine.cache.get(self.key_to_host[key], _TYPE_A))
+            if self.status.get(key) != online:
+                self.status[key] = online
+                changed[key] = online
+        if changed:
+            self.on_update(changed)
+
+
+def resolve_host(host, timeout=3.0):
+    """Resolve the .local host name (with trailing dot) with the shared engine, None on timeout."""
+    return get_engine().resolve(host, timeout)
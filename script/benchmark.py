@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""Benchmark the stages of a build on large generated configurations.
+
+For every size a configuration with that many template sensors is generated,
+spread over !include'd files and using substitutions, filters, lambdas and
+automations, with binary sensors and switches that reference the sensors by ID.
+Then the YAML loading, validate_config (without the ID pass), do_id_pass, the
+code generation by CORE.flush_tasks and write_cpp are timed separately. Nothing
+is compiled, so neither a toolchain nor network access is needed.
+
+Each stage is run --repeat times on a fresh CORE, the first run (which imports
+the components) and the fastest run are reported. With --output the results are
+stored as JSON, with --compare they are compared to the results of an earlier
+run, for example of another commit:
+
+    script/benchmark.py --sizes 100 500 --output before.json
+    git checkout my-branch
+    script/benchmark.py --sizes 100 500 --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# pylint: disable=wrong-import-position
+from esphome import const, writer, yaml_util  # noqa
+from esphome.__main__ import wrap_to_code  # noqa
+from esphome.config import do_id_pass, iter_components, validate_config  # noqa
+from esphome.core import CORE  # noqa
+from esphome.util import OrderedDict  # noqa
+
+STAGES = ['load_yaml', 'validate_config', 'do_id_pass', 'flush_tasks', 'write_cpp']
+# Sensors per included file
+GROUP_SIZE = 50
+
+SENSOR_TEMPLATE = """\
+- platform: template
+  name: "${{prefix}} Sensor {i}"
+  id: sensor_{i}
+  lambda: return {i}.0;
+  update_interval: ${{interval}}
+  unit_of_measurement: "°C"
+  accuracy_decimals: 2
+  filters:
+    - offset: 2.0
+    - multiply: 1.2
+    - sliding_window_moving_average:
+        window_size: 15
+        send_every: 15
+    - lambda: return x * {i};
+  on_value_range:
+    above: 50.0
+    then:
+      - switch.turn_on: switch_{i}
+  on_value:
+    then:
+      - if:
+          condition:
+            lambda: return x > id(sensor_{other}).state;
+          then:
+            - logger.log:
+                format: "Sensor {i} is above sensor {other}: %.1f"
+                args: [x]
+            - delay: 1s
+          else:
+            - switch.turn_off: switch_{i}
+"""
+
+BINARY_SENSOR_TEMPLATE = """\
+- platform: template
+  name: "${{prefix}} Binary Sensor {i}"
+  id: binary_sensor_{i}
+  lambda: |-
+    if (id(sensor_{i}).state > 10) {{
+      return true;
+    }}
+    return false;
+  filters:
+    - delayed_on: 100ms
+    - invert:
+  on_press:
+    then:
+      - switch.toggle: switch_{i}
+"""
+
+SWITCH_TEMPLATE = """\
+- platform: template
+  name: "${{prefix}} Switch {i}"
+  id: switch_{i}
+  optimistic: true
+  turn_on_action:
+    - sensor.template.publish:
+        id: sensor_{i}
+        state: !lambda return id(sensor_{other}).state + 1.0;
+"""
+
+MAIN_TEMPLATE = """\
+substitutions:
+  device: benchmark
+  prefix: Benchmark
+  interval: 60s
+
+esphome:
+  name: ${{device}}
+  platform: ESP8266
+  board: nodemcuv2
+  build_path: {build_path}
+
+wifi:
+  ssid: MyHomeNetwork
+  password: VerySafePassword
+
+api:
+  password: !include password.yaml
+
+ota:
+
+logger:
+
+sensor: !include_dir_merge_list sensor
+binary_sensor: !include_dir_merge_list binary_sensor
+switch: !include_dir_merge_list switch
+"""
+
+
+def write_generated_config(directory, sensors):
+    """Write a configuration with sensors template sensors to directory, returns its path."""
+    with open(os.path.join(directory, 'password.yaml'), 'w') as f_handle:
+        f_handle.write('"benchmark"\n')
+    templates = [('sensor', SENSOR_TEMPLATE), ('binary_sensor', BINARY_SENSOR_TEMPLATE),
+                 ('switch', SWITCH_TEMPLATE)]
+    for domain, _ in templates:
+        os.mkdir(os.path.join(directory, domain))
+    for start in range(0, sensors, GROUP_SIZE):
+        numbers = range(start, min(start + GROUP_SIZE, sensors))
+        for domain, template in templates:
+            filename = 'group_{:04d}.yaml'.format(start // GROUP_SIZE)
+            with open(os.path.join(directory, domain, filename), 'w') as f_handle:
+                for i in numbers:
+                    f_handle.write(template.format(i=i, other=(i + 1) % sensors))
+
+    path = os.path.join(directory, 'benchmark.yaml')
+    with open(path, 'w') as f_handle:
+        f_handle.write(MAIN_TEMPLATE.format(build_path=os.path.join(directory, 'build')))
+    return path
+
+
+def run_once(path):
+    """Run all stages on the configuration at path, returns the duration of each stage."""
+    CORE.reset()
+    CORE.config_path = path
+    durations = {}
+
+    start = time.time()
+    config = yaml_util.load_yaml(path)
+    durations['load_yaml'] = time.time() - start
+    CORE.raw_config = config
+
+    start = time.time()
+    result = validate_config(config, id_pass=False)
+    durations['validate_config'] = time.time() - start
+    if not result.errors:
+        start = time.time()
+        do_id_pass(result)
+        durations['do_id_pass'] = time.time() - start
+    if result.errors:
+        raise ValueError("Generated configuration is invalid: {}".format(
+            '; '.join(str(err) for err in result.errors[:5])))
+    CORE.config = OrderedDict(result)
+
+    start = time.time()
+    for name, component, conf in iter_components(CORE.config):
+        if component.to_code is not None:
+            task = CORE.add_job(wrap_to_code(name, component), conf)
+            CORE.task_units[task] = name
+    CORE.flush_tasks()
+    durations['flush_tasks'] = time.time() - start
+
+    start = time.time()
+    writer.write_platformio_project()
+    writer.write_cpp()
+    durations['write_cpp'] = time.time() - start
+    return durations
+
+
+def run_size(directory, sensors, repeat):
+    size_dir = os.path.join(directory, str(sensors))
+    os.mkdir(size_dir)
+    path = write_generated_config(size_dir, sensors)
+    runs = [run_once(path) for _ in range(repeat)]
+    return {stage: {'first': runs[0][stage], 'best': min(x[stage] for x in runs)}
+            for stage in STAGES}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    header = '{:>8} {:<16} {:>12} {:>12}'.format('sensors', 'stage', 'first', 'best')
+    if baseline is not None:
+        header += ' {:>12} {:>8}'.format('baseline', 'change')
+    print(header)
+    for size, stages in results['sizes'].items():
+        for stage in STAGES:
+            times = stages[stage]
+            line = '{:>8} {:<16} {:>10.1f}ms {:>10.1f}ms'.format(
+                size, stage, times['first'] * 1000, times['best'] * 1000)
+            old = None
+            if baseline is not None:
+                old = baseline['sizes'].get(size, {}).get(stage)
+            if old is not None:
+                line += ' {:>10.1f}ms {:>+7.1f}%'.format(
+                    old['best'] * 1000, (times['best'] / old['best'] - 1) * 100)
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500],
+                        help="Number of sensors of the generated configurations.")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Number of runs per size, the fastest one is reported.")
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    parser.add_argument('--compare', help="Compare with the results in this JSON file.")
+    parser.add_argument('--keep', action='store_true',
+                        help="Keep the generated configurations and print where they are.")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f_handle:
+            baseline = json.load(f_handle)
+
+    directory = tempfile.mkdtemp(prefix='esphome-benchmark-')
+    try:
+        results = {
+            'esphome_version': const.__version__,
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'libyaml': yaml_util.ESPHomeCLoader is not None,
+            'repeat': args.repeat,
+            'sizes': OrderedDict(),
+        }
+        for sensors in args.sizes:
+            # JSON keys are strings, use them here too so results and baseline match
+            results['sizes'][str(sensors)] = run_size(directory, sensors, args.repeat)
+    finally:
+        if args.keep:
+            print("Generated configurations are in {}".format(directory))
+        else:
+            shutil.rmtree(directory)
+
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f_handle:
+            json.dump(results, f_handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""A minimal MQTT 3.1.1 broker for trying out MQTT features without a real broker.
+
+Supports QoS 0 and 1 publishes, retained messages, wildcard subscriptions and will
+messages, which is enough for the MQTT logs and the MQTT status of the dashboard.
+There is no authentication and no persistence.
+
+With --devices the broker also simulates that many devices: each publishes its
+retained birth message on <prefix><n>/status, and a random device goes offline or
+comes back every --flap-interval seconds.
+
+    script/fake_mqtt_broker.py --port 1883 --devices 500
+    esphome dashboard --mqtt-broker localhost:1883 config/
+"""
+import argparse
+import asyncio
+import logging
+import random
+import struct
+import sys
+
+_LOGGER = logging.getLogger('fake_mqtt_broker')
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(topic_filter, topic):
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != '+' and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def encode_length(length):
+    out = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def encode_string(value):
+    data = value.encode('utf-8')
+    return struct.pack('!H', len(data)) + data
+
+
+def packet(packet_type, flags, body):
+    return bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body
+
+
+def publish_packet(topic, payload, retain):
+    return packet(PUBLISH, 1 if retain else 0, encode_string(topic) + payload)
+
+
+class Reader(object):
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, length):
+        value = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return value
+
+    def read_short(self):
+        return struct.unpack('!H', self.read(2))[0]
+
+    def read_string(self):
+        return self.read(self.read_short()).decode('utf-8')
+
+    def rest(self):
+        return self.data[self.pos:]
+
+    def at_end(self):
+        return self.pos >= len(self.data)
+
+
+class Broker(object):
+    def __init__(self):
+        self.sessions = set()
+        self.retained = {}
+
+    def publish(self, topic, payload, retain=False):
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        for session in list(self.sessions):
+            if any(topic_matches(f, topic) for f in session.subscriptions):
+                # Messages are forwarded with the retain flag cleared
+                session.send(publish_packet(topic, payload, False))
+
+    async def handle_client(self, reader, writer):
+        session = Session(self, writer)
+        try:
+            await session.run(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            if session.will is not None:
+                self.publish(*session.will)
+            writer.close()
+
+
+class Session(object):
+    def __init__(self, broker, writer):
+        self.broker = broker
+        self.writer = writer
+        self.subscriptions = set()
+        self.will = None
+
+    def send(self, data):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    async def read_packet(self, reader):
+        header = (await reader.readexactly(1))[0]
+        length = 0
+        multiplier = 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        body = await reader.readexactly(length) if length else b''
+        return header >> 4, header & 0x0F, Reader(body)
+
+    async def run(self, reader):
+        packet_type, _, body = await self.read_packet(reader)
+        if packet_type != CONNECT:
+            return
+        self.handle_connect(body)
+        self.broker.sessions.add(self)
+        self.send(packet(CONNACK, 0, b'\x00\x00'))
+        while True:
+            packet_type, flags, body = await self.read_packet(reader)
+            if packet_type == PUBLISH:
+                qos = (flags >> 1) & 0x03
+                topic = body.read_string()
+                if qos:
+                    self.send(packet(PUBACK, 0, struct.pack('!H', body.read_short())))
+                self.broker.publish(topic, body.rest(), bool(flags & 0x01))
+            elif packet_type == SUBSCRIBE:
+                self.handle_subscribe(body)
+            elif packet_type == UNSUBSCRIBE:
+                packet_id = body.read_short()
+                while not body.at_end():
+                    self.subscriptions.discard(body.read_string())
+                self.send(packet(UNSUBACK, 0, struct.pack('!H', packet_id)))
+            elif packet_type == PINGREQ:
+                self.send(packet(PINGRESP, 0, b''))
+            elif packet_type == DISCONNECT:
+                # Clean disconnect, the will isn't published
+                self.will = None
+                return
+
+    def handle_connect(self, body):
+        body.read_string()  # protocol name
+        body.read(1)  # protocol level
+        connect_flags = body.read(1)[0]
+        body.read_short()  # keep alive
+        body.read_string()  # client id
+        if connect_flags & 0x04:
+            will_topic = body.read_string()
+            will_payload = body.read(body.read_short())
+            self.will = (will_topic, will_payload, bool(connect_flags & 0x20))
+
+    def handle_subscribe(self, body):
+        packet_id = body.read_short()
+        granted = bytearray()
+        filters = []
+        while not body.at_end():
+            topic_filter = body.read_string()
+            body.read(1)  # requested qos
+            filters.append(topic_filter)
+            granted.append(0)
+        self.subscriptions.update(filters)
+        self.send(packet(SUBACK, 0, struct.pack('!H', packet_id) + bytes(granted)))
+        for topic, payload in sorted(self.broker.retained.items()):
+            if any(topic_matches(f, topic) for f in filters):
+                self.send(publish_packet(topic, payload, True))
+
+
+async def simulate_devices(broker, count, prefix, interval):
+    online = [True] * count
+    for i in range(count):
+        broker.publish('{}{}/status'.format(prefix, i), b'online', retain=True)
+    while True:
+        await asyncio.sleep(interval)
+        i = random.randrange(count)
+        online[i] = not online[i]
+        _LOGGER.info("%s%s is now %s", prefix, i, 'online' if online[i] else 'offline')
+        broker.publish('{}{}/status'.format(prefix, i), b'online' if online[i] else b'offline',
+                       retain=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--devices', type=int, default=0,
+                        help="Number of simulated devices.")
+    parser.add_argument('--device-prefix', default='device',
+                        help="Topic prefix of the simulated devices, followed by their number.")
+    parser.add_argument('--flap-interval', type=float, default=5.0,
+                        help="Seconds between status changes of the simulated devices.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    loop = asyncio.get_event_loop()
+    broker = Broker()
+    server = loop.run_until_complete(
+        asyncio.start_server(broker.handle_client, args.host, args.port))
+    _LOGGER.info("Listening on %s:%s", args.host, args.port)
+    if args.devices:
+        loop.create_task(simulate_devices(broker, args.devices, args.device_prefix,
+                                          args.flap_interval))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
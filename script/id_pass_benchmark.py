@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Benchmark esphome.config.do_id_pass on large synthetic configurations.
+
+Every generated configuration has the given number of template sensors, half
+of them with a manual ID and half with an automatic one. There are as many
+binary sensors that reference a sensor by ID and from a lambda, and as many
+components that are automatically connected to the single I2C bus. The time of
+the ID pass should grow about linearly with the size.
+
+    script/id_pass_benchmark.py --sizes 1000 2000 4000 8000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# pylint: disable=wrong-import-position
+from esphome.components import binary_sensor, i2c, sensor  # noqa
+from esphome.components.template import sensor as template_sensor  # noqa
+from esphome.config import Config, do_id_pass  # noqa
+from esphome.core import CORE, ID, Lambda  # noqa
+from esphome.util import OrderedDict  # noqa
+
+
+def generate_config(size):
+    config = Config()
+    config['i2c'] = OrderedDict([
+        ('id', ID(None, is_declaration=True, type=i2c.I2CComponent)),
+    ])
+    sensors = []
+    for i in range(size):
+        manual = i % 2 == 0
+        sensors.append(OrderedDict([
+            ('platform', 'template'),
+            ('id', ID('sensor_{}'.format(i) if manual else None, is_declaration=True,
+                      type=template_sensor.TemplateSensor, is_manual=manual)),
+            ('i2c_id', ID(None, type=i2c.I2CComponent)),
+        ]))
+    config['sensor'] = sensors
+    binary_sensors = []
+    for i in range(size):
+        reference = 'sensor_{}'.format(i - i % 2)
+        binary_sensors.append(OrderedDict([
+            ('platform', 'template'),
+            ('id', ID(None, is_declaration=True, type=binary_sensor.BinarySensor)),
+            ('sensor_id', ID(reference, type=sensor.Sensor)),
+            ('lambda', Lambda('return id({}).state > 10;'.format(reference))),
+        ]))
+    config['binary_sensor'] = binary_sensors
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 4000, 8000],
+                        help="Number of sensors of the generated configurations.")
+    args = parser.parse_args()
+
+    print("{:>8} {:>8} {:>12} {:>14}".format('sensors', 'IDs', 'id pass', 'per 1000 IDs'))
+    for size in args.sizes:
+        CORE.reset()
+        config = generate_config(size)
+        num_ids = 1 + 6 * size
+        start = time.time()
+        do_id_pass(config)
+        duration = time.time() - start
+        if config.errors:
+            for err in config.errors[:5]:
+                print(err)
+            return 1
+        print("{:>8} {:>8} {:>10.1f}ms {:>12.2f}ms".format(size, num_ids, duration * 1000,
+                                                            duration * 1000000 / num_ids))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
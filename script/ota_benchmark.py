@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Benchmark the OTA uploaders against a local fake OTA server.
+
+The fake server implements the device side of the ESPHome OTA protocol
+(including password authentication) and verifies the MD5 of the received
+firmware, so it can also be used to check the uploaders work at all.
+
+    script/ota_benchmark.py --size 1000000 --devices 4
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# pylint: disable=wrong-import-position
+from esphome import espota2, espota_async  # noqa
+
+NONCE = '0123456789abcdef0123456789abcdef'
+
+
+class FakeOTAServer(object):
+    """A fake ESPHome device that accepts OTA uploads."""
+
+    def __init__(self, password=None, read_size=1460, read_delay=0.0):
+        self.password = password
+        self.read_size = read_size
+        self.read_delay = read_delay
+        self.received = []
+        self.server = None
+
+    async def handle(self, reader, writer):
+        try:
+            await self._handle(reader, writer)
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, reader, writer):
+        magic = await reader.readexactly(5)
+        if list(magic) != espota2.MAGIC_BYTES:
+            writer.write(bytes([espota2.RESPONSE_ERROR_MAGIC]))
+            return
+        writer.write(bytes([espota2.RESPONSE_OK, espota2.OTA_VERSION_1_0]))
+        await reader.readexactly(1)
+        writer.write(bytes([espota2.RESPONSE_HEADER_OK]))
+        if self.password:
+            writer.write(bytes([espota2.RESPONSE_REQUEST_AUTH]) + NONCE.encode())
+            cnonce = (await reader.readexactly(32)).decode()
+            result = (await reader.readexactly(32)).decode()
+            expected = hashlib.md5((self.password + NONCE + cnonce).encode()).hexdigest()
+            if result != expected:
+                writer.write(bytes([espota2.RESPONSE_ERROR_AUTH_INVALID]))
+                return
+        writer.write(bytes([espota2.RESPONSE_AUTH_OK]))
+        size = int.from_bytes(await reader.readexactly(4), 'big')
+        writer.write(bytes([espota2.RESPONSE_UPDATE_PREPARE_OK]))
+        md5 = (await reader.readexactly(32)).decode()
+        writer.write(bytes([espota2.RESPONSE_BIN_MD5_OK]))
+
+        received = hashlib.md5()
+        remaining = size
+        while remaining:
+            data = await reader.read(min(self.read_size, remaining))
+            if not data:
+                return
+            received.update(data)
+            remaining -= len(data)
+            if self.read_delay:
+                await asyncio.sleep(self.read_delay)
+        if received.hexdigest() != md5:
+            writer.write(bytes([espota2.RESPONSE_ERROR_UPDATE_END]))
+            return
+        writer.write(bytes([espota2.RESPONSE_RECEIVE_OK, espota2.RESPONSE_UPDATE_END_OK]))
+        await reader.readexactly(1)
+        self.received.append(size)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+
+def start_server_thread(server):
+    """Run the fake server on its own event loop thread, returns its port."""
+    loop = asyncio.new_event_loop()
+    port = loop.run_until_complete(server.start())
+    thread = threading.Thread(target=loop.run_forever)
+    thread.daemon = True
+    thread.start()
+    return port
+
+
+class _NoSleep(object):
+    """Stand-in for the time module in espota2, skips the wait after the upload."""
+
+    def __getattr__(self, item):
+        return getattr(time, item)
+
+    @staticmethod
+    def sleep(_):
+        pass
+
+
+def bench_blocking(port, password, firmware):
+    start = time.time()
+    sock = socket.create_connection(('127.0.0.1', port))
+    espota2.time = _NoSleep()
+    try:
+        with open(firmware, 'rb') as file_handle:
+            espota2.perform_ota(sock, password, file_handle, firmware)
+    finally:
+        espota2.time = time
+        sock.close()
+    return time.time() - start
+
+
+def bench_async(port, password, firmware, chunk_size, devices):
+    targets = [('127.0.0.1', port, password, firmware)] * devices
+    start = time.time()
+    results = espota_async.run_ota_many(targets, max_parallel=devices, chunk_size=chunk_size)
+    duration = time.time() - start
+    for result in results.values():
+        if isinstance(result, Exception):
+            raise result
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1024 * 1024,
+                        help="Size of the fake firmware in bytes.")
+    parser.add_argument('--password', default='secret')
+    parser.add_argument('--devices', type=int, default=4,
+                        help="Number of concurrent uploads in the concurrency benchmark.")
+    parser.add_argument('--read-delay', type=float, default=0.0,
+                        help="Seconds the fake device sleeps after each read (slow link).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.NamedTemporaryFile(suffix='.bin', delete=False) as file_handle:
+        file_handle.write(os.urandom(args.size))
+        firmware = file_handle.name
+    try:
+        server = FakeOTAServer(password=args.password, read_delay=args.read_delay)
+        port = start_server_thread(server)
+
+        def report(name, duration, total):
+            print("{:<32} {:>8.2f}s {:>10.1f} KiB/s".format(name, duration,
+                                                           total / duration / 1024))
+
+        report('espota2 (blocking, 1 KiB)', bench_blocking(port, args.password, firmware),
+               args.size)
+        for chunk_size in (1024, 8192, 65536):
+            name = 'espota_async ({} KiB)'.format(chunk_size // 1024)
+            report(name, bench_async(port, args.password, firmware, chunk_size, 1), args.size)
+        name = 'espota_async x{} devices'.format(args.devices)
+        report(name, bench_async(port, args.password, firmware, 8192, args.devices),
+               args.size * args.devices)
+        expected = 1 + 3 + args.devices
+        if len(server.received) != expected:
+            print("Fake server only completed {} of {} uploads".format(len(server.received),
+                                                                     expected))
+            return 1
+    finally:
+        os.remove(firmware)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
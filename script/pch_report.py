@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Compare the compile times of a configuration with and without the precompiled header.
+
+For both modes the build directory is cleaned, the sources are generated and the
+project is compiled from scratch. Then a comment line is appended to main.cpp and
+to one of the generated setup units in turn, and the project is compiled again,
+like after a small change of the YAML. The changed file is restored afterwards.
+Only the PlatformIO builds are timed, so PlatformIO and the toolchain have to be
+installed. The compile cache is turned off for all builds.
+
+    script/pch_report.py tests/test1.yaml --output pch.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# pylint: disable=wrong-import-position
+from esphome import platformio_api  # noqa
+from esphome.config import read_config  # noqa
+from esphome.core import CORE  # noqa
+from esphome.util import OrderedDict  # noqa
+
+MODES = [('without', '0'), ('with', '1')]
+STEPS = ['clean build', 'main.cpp changed', 'setup unit changed']
+CHANGE_LINE = b'\n// Changed by pch_report.py\n'
+
+
+def run_esphome(path, command, pch):
+    env = os.environ.copy()
+    env['ESPHOME_PCH'] = pch
+    proc = subprocess.Popen([sys.executable, '-m', 'esphome', path] + command, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output, _ = proc.communicate()
+    if proc.returncode != 0:
+        sys.stdout.write(output.decode('utf-8', 'replace'))
+        raise RuntimeError("esphome {} {} failed".format(path, ' '.join(command)))
+
+
+def build(config):
+    """Compile the generated project, returns the duration."""
+    start = time.time()
+    if platformio_api.run_compile(config, False) != 0:
+        raise RuntimeError("Compiling {} failed".format(CORE.build_path))
+    return time.time() - start
+
+
+def build_changed(config, path):
+    """Compile the project with a changed path, returns the duration."""
+    with open(path, 'rb') as f_handle:
+        content = f_handle.read()
+    with open(path, 'wb') as f_handle:
+        f_handle.write(content + CHANGE_LINE)
+    try:
+        return build(config)
+    finally:
+        with open(path, 'wb') as f_handle:
+            f_handle.write(content)
+        # Untimed, so that the next step starts from the unchanged project
+        build(config)
+
+
+def find_setup_unit():
+    setup_dir = CORE.relative_src_path('setup')
+    if not os.path.isdir(setup_dir):
+        return None
+    units = sorted(x for x in os.listdir(setup_dir) if x.endswith('.cpp'))
+    if not units:
+        return None
+    return os.path.join(setup_dir, units[0])
+
+
+def measure(path, config, pch):
+    times = OrderedDict()
+    run_esphome(path, ['clean'], pch)
+    run_esphome(path, ['compile', '--only-generate'], pch)
+    times['clean build'] = build(config)
+    times['main.cpp changed'] = build_changed(config, CORE.relative_src_path('main.cpp'))
+    unit = find_setup_unit()
+    if unit is not None:
+        times['setup unit changed'] = build_changed(config, unit)
+    return times
+
+
+def print_report(results):
+    print('{:<24} {:>10} {:>10} {:>8}'.format('build', 'without', 'with', 'change'))
+    for step in STEPS:
+        without = results['without'].get(step)
+        with_pch = results['with'].get(step)
+        if without is None or with_pch is None:
+            continue
+        print('{:<24} {:>9.1f}s {:>9.1f}s {:>+7.1f}%'.format(
+            step, without, with_pch, (with_pch / without - 1) * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('configuration', help="The YAML configuration to compile.")
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    os.environ.pop('ESPHOME_COMPILE_CACHE_DIR', None)
+    os.environ['ESPHOME_USE_SUBPROCESS'] = '1'
+    path = os.path.abspath(args.configuration)
+    CORE.config_path = path
+    config = read_config()
+    if config is None:
+        return 1
+
+    results = OrderedDict()
+    for mode, pch in MODES:
+        print("Compiling {} the precompiled header...".format(mode))
+        results[mode] = measure(path, config, pch)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w') as f_handle:
+            json.dump(results, f_handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
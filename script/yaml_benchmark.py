@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Compare the YAML loader backends of esphome.yaml_util.
+
+Loads every configuration with each available backend, checks that the results
+(including the source ranges of all values) are identical and prints the time
+each backend needed. Without arguments the test configurations and a generated
+configuration using includes, secrets and merge keys are loaded. It also checks
+that modifying a loaded file or substituting its lambdas doesn't change the cached
+parse of its includes, and that the incremental validation of the editor server
+picks up a changed substitution in the lambdas of an included file.
+
+    script/yaml_benchmark.py [--repeat 5] [config.yaml ...]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# pylint: disable=wrong-import-position
+from esphome import yaml_util  # noqa
+from esphome.components.substitutions import do_substitution_pass  # noqa
+from esphome.config import SchemaCache, load_config  # noqa
+from esphome.core import CORE  # noqa
+from esphome.core import Lambda  # noqa
+
+TESTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+
+def write_generated_config(directory, sensors=200):
+    """Write a configuration that uses all custom tags, returns its path."""
+    with open(os.path.join(directory, 'secrets.yaml'), 'w') as f_handle:
+        f_handle.write('wifi_password: "hunter22"\napi_password: "secret"\n')
+    with open(os.path.join(directory, 'common.yaml'), 'w') as f_handle:
+        f_handle.write('board: nodemcuv2\nplatform: ESP8266\n')
+    os.mkdir(os.path.join(directory, 'sensors'))
+    for i in range(sensors // 10):
+        with open(os.path.join(directory, 'sensors', 'group{}.yaml'.format(i)), 'w') as f_handle:
+            f_handle.write('- &defaults\n'
+                           '  platform: template\n'
+                           '  update_interval: 60s\n'
+                           '  accuracy_decimals: 2\n')
+            for j in range(10):
+                f_handle.write(
+                    '- <<: *defaults\n'
+                    '  name: "Sensor {0}_{1}"\n'
+                    '  id: sensor_{0}_{1}\n'
+                    '  lambda: !lambda return {1}.0;\n'
+                    '  filters:\n'
+                    '    - sliding_window_moving_average:\n'
+                    '        window_size: 15\n'
+                    '    - lambda: return x * {1};\n'.format(i, j))
+    path = os.path.join(directory, 'generated.yaml')
+    with open(path, 'w') as f_handle:
+        f_handle.write(
+            'esphome:\n'
+            '  name: generated\n'
+            '  <<: !include common.yaml\n'
+            'wifi:\n'
+            '  ssid: MyHomeNetwork\n'
+            '  password: !secret wifi_password\n'
+            'api:\n'
+            '  password: !secret api_password\n'
+            'logger:\n'
+            '  level: !env_var ESPHOME_BENCHMARK_LEVEL DEBUG\n'
+            'sensor: !include_dir_merge_list sensors\n')
+    return path
+
+
+def compare(first, second, path='root'):
+    """Raise an AssertionError if first and second (including source ranges) differ."""
+    if type(first) is not type(second):
+        raise AssertionError("{}: type {} != {}".format(path, type(first), type(second)))
+    first_range = getattr(first, 'esp_range', None)
+    second_range = getattr(second, 'esp_range', None)
+    if str(first_range) != str(second_range):
+        raise AssertionError("{}: range {} != {}".format(path, first_range, second_range))
+    if isinstance(first, dict):
+        if list(first.keys()) != list(second.keys()):
+            raise AssertionError("{}: keys {} != {}".format(path, list(first), list(second)))
+        for key in first:
+            compare(first[key], second[key], '{}.{}'.format(path, key))
+    elif isinstance(first, list):
+        if len(first) != len(second):
+            raise AssertionError("{}: length {} != {}".format(path, len(first), len(second)))
+        for i, (first_item, second_item) in enumerate(zip(first, second)):
+            compare(first_item, second_item, '{}[{}]'.format(path, i))
+    elif isinstance(first, Lambda):
+        if first.value != second.value:
+            raise AssertionError("{}: {!r} != {!r}".format(path, first.value, second.value))
+    elif first != second:
+        raise AssertionError("{}: {!r} != {!r}".format(path, first, second))
+
+
+def check_parse_cache_copies(directory):
+    """Raise an AssertionError if modifying loaded data changes the parse cache."""
+    with open(os.path.join(directory, 'shared.yaml'), 'w') as f_handle:
+        f_handle.write('x: 1\ny: 2\n')
+    path = os.path.join(directory, 'copies.yaml')
+    with open(path, 'w') as f_handle:
+        f_handle.write('first: !include shared.yaml\nsecond: !include shared.yaml\n')
+
+    yaml_util.keep_parse_cache()
+    try:
+        result = yaml_util.load_yaml(path)
+        result['first']['z'] = 3
+        del result['first']['x']
+        for config in (result, yaml_util.load_yaml(path)):
+            if list(config['second'].keys()) != ['x', 'y'] or dict(config['second']) != \
+                    {'x': 1, 'y': 2}:
+                raise AssertionError("Modifying a copy changed the parse cache: {!r}".format(
+                    list(config['second'].items())))
+    finally:
+        yaml_util.keep_parse_cache(False)
+
+
+def check_parse_cache_substitutions(directory):
+    """Raise an AssertionError if substituting an included lambda changes the parse cache."""
+    with open(os.path.join(directory, 'lambda.yaml'), 'w') as f_handle:
+        f_handle.write('lambda: !lambda return ${val};\n')
+    paths = []
+    for val in ('1', '2'):
+        path = os.path.join(directory, 'substitutions_{}.yaml'.format(val))
+        with open(path, 'w') as f_handle:
+            f_handle.write('substitutions:\n  val: "{}"\nshared: !include lambda.yaml\n'.format(
+                val))
+        paths.append((val, path))
+
+    yaml_util.keep_parse_cache()
+    try:
+        for val, path in paths:
+            config = yaml_util.load_yaml(path)
+            do_substitution_pass(config)
+            expected = 'return {};'.format(val)
+            if config['shared']['lambda'].value != expected:
+                raise AssertionError("Substituted lambda of {} is {!r}, expected {!r}".format(
+                    path, config['shared']['lambda'].value, expected))
+    finally:
+        yaml_util.keep_parse_cache(False)
+
+
+def check_incremental_substitutions(directory):
+    """Raise an AssertionError if editing a substitution keeps a stale included lambda.
+
+    Validates like 'vscode --incremental': the parse cache and a SchemaCache are kept
+    between the validations of the edited configuration.
+    """
+    with open(os.path.join(directory, 'sensor.yaml'), 'w') as f_handle:
+        f_handle.write('- platform: template\n  name: Value\n  lambda: !lambda return ${val};\n')
+    path = os.path.join(directory, 'incremental.yaml')
+    schema_cache = SchemaCache()
+
+    yaml_util.keep_parse_cache()
+    try:
+        # Values of different lengths, the parse cache stamps files by mtime and size
+        for val in ('1', '42'):
+            with open(path, 'w') as f_handle:
+                f_handle.write('esphome:\n  name: incremental\n  platform: ESP8266\n'
+                               '  board: nodemcuv2\nsubstitutions:\n  val: "{}"\n'
+                               'sensor: !include sensor.yaml\n'.format(val))
+            CORE.reset()
+            CORE.config_path = path
+            result = load_config(schema_cache=schema_cache)
+            if result.errors:
+                raise AssertionError("Validating {} failed: {}".format(path, result.errors))
+            expected = 'return {};'.format(val)
+            if result['sensor'][0]['lambda'].value != expected:
+                raise AssertionError("Lambda after editing the substitution is {!r}, "
+                                     "expected {!r}".format(result['sensor'][0]['lambda'].value,
+                                                            expected))
+    finally:
+        yaml_util.keep_parse_cache(False)
+        CORE.reset()
+
+
+def bench(loader_cls, path, repeat):
+    yaml_util.LOADER_CLASS = loader_cls
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        result = yaml_util.load_yaml(path)
+        duration = time.time() - start
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="Number of loads per backend, the fastest one is reported.")
+    parser.add_argument('configs', nargs='*')
+    args = parser.parse_args()
+
+    if yaml_util.ESPHomeCLoader is None:
+        print("libyaml is not available, only the python backend can be measured.")
+    tmp_dir = None
+    configs = args.configs
+    if not configs:
+        configs = [os.path.join(TESTS_DIR, x) for x in sorted(os.listdir(TESTS_DIR))
+                   if x.endswith('.yaml')]
+        tmp_dir = tempfile.mkdtemp()
+        configs.append(write_generated_config(tmp_dir))
+
+    try:
+        check_directory = tempfile.mkdtemp()
+        try:
+            check_parse_cache_copies(check_directory)
+            check_parse_cache_substitutions(check_directory)
+            check_incremental_substitutions(check_directory)
+        finally:
+            shutil.rmtree(check_directory)
+
+        print("{:<20} {}".format('config', ''.join('{:>18}'.format(x.__name__)
+                                                   for x in yaml_util.LOADERS)))
+        for path in configs:
+            results = [bench(loader_cls, path, args.repeat) for loader_cls in yaml_util.LOADERS]
+            for _, other in results[1:]:
+                compare(results[0][1], other)
+            line = '{:<20}'.format(os.path.basename(path))
+            for duration, _ in results:
+                line += '{:>17.1f}ms'.format(duration * 1000)
+            if len(results) > 1:
+                line += '  ({:.1f}x)'.format(results[0][0] / results[-1][0])
+            print(line)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())